@@ -0,0 +1,318 @@
+#!/usr/bin/env python2
+#
+#   Copyright 2017 Nick Boultbee
+#   This file is part of squeeze-alexa.
+#
+#   squeeze-alexa is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   See LICENSE for full license
+
+"""Offline micro-benchmarks for squeeze-alexa internals.
+Usage: benchmark.py [name...]  (all benchmarks by default)"""
+
+from __future__ import print_function
+
+import io
+import random
+import re
+import shutil
+import sys
+import tempfile
+import timeit
+from os.path import dirname, join
+
+ROOT = dirname(dirname(__file__))
+sys.path.append(ROOT)
+
+from fuzzywuzzy import process
+from squeezealexa.matching import PhoneticIndex, TrigramIndex
+from squeezealexa.squeezebox.parsing import pairs, values, Tokenizer
+from squeezealexa.squeezebox.server import Server
+from squeezealexa.squeezebox.snapshot import Snapshot
+from squeezealexa.ssl_wrap import LineReader, SslSocketWrapper, \
+    create_context
+from squeezealexa.utils import PY2, fold
+from tests.simulator import Library, Simulator, \
+    make_certificate
+
+try:
+    from urllib import quote, unquote
+except ImportError:
+    from urllib.parse import quote, unquote
+
+BENCHMARKS = {}
+
+
+def benchmark(func):
+    BENCHMARKS[func.__name__] = func
+    return func
+
+
+def timed(func, repeat=3):
+    """Best-of-n time for running func once, in seconds"""
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+
+def report(name, secs, size=None):
+    rate = " (%.1f MB/s)" % (size / secs / 1e6) if size else ""
+    print("  %-40s %8.1f ms%s" % (name, secs * 1000, rate))
+
+
+def fake_albums(count):
+    items = " ".join("id:%d album:%s year:%d artist:%s"
+                     % (7000000 + i, quote("Album number %d" % i),
+                        1950 + i % 70, quote("Some Artist %d" % (i % 500)))
+                     for i in range(count))
+    return ("albums 0 %d tags:lay %s count:%d\n"
+            % (count, items, count)).encode('utf-8')
+
+
+def fake_artists(count):
+    items = " ".join("id:%d artist:%s"
+                     % (10000000 + i,
+                        quote((u"\xd3lafur %d" % i).encode('utf-8')))
+                     for i in range(count))
+    return ("artists 0 %d %s count:%d\n"
+            % (count, items, count)).encode('utf-8')
+
+
+def recv_from(data, size):
+    chunks = [data[i:i + size] for i in range(0, len(data), size)]
+    chunks.reverse()
+
+    def recv(bufsize=1024):
+        return chunks.pop() if chunks else b''
+
+    return recv
+
+
+def old_read(recv, num_lines):
+    """How SslSocketWrapper.communicate used to read responses"""
+    eof = False
+    response = ''
+    while not eof:
+        response += recv().decode('utf-8')
+        eof = response.count("\n") == num_lines or not response
+    return response
+
+
+@benchmark
+def reader():
+    """Reading large listings: old string concatenation vs LineReader"""
+    for name, data in [("albums x 40000", fake_albums(40000)),
+                       ("artists x 80000", fake_artists(80000))]:
+        print("%s: %.1f MB" % (name, len(data) / 1e6))
+        # SSL sockets return at most a record (16K) at a time,
+        # and the old code asked for 1K at a time.
+        report("old (1K recv)",
+               timed(lambda: old_read(recv_from(data, 1024), 1), repeat=1),
+               len(data))
+        report("LineReader (16K records)",
+               timed(lambda: LineReader(recv_from(data, 16384))
+                     .read_lines(1)), len(data))
+
+
+def old_pairs_from(response):
+    """How Server used to unescape and split tags"""
+    return [t for t in (tuple(unquote(s).split(':', 1))
+                        for s in response.split(' ')) if len(t) == 2]
+
+
+@benchmark
+def parsing():
+    """Splitting raw listings into tags: unescape-everything vs one pass"""
+    genres = " ".join("id%%3A%d genre%%3A%s" % (i, quote("Genre %d" % i))
+                      for i in range(255))
+    albums = " ".join(quote("%s:%s" % tag, safe='') for i in range(10000)
+                      for tag in [("id", 7000000 + i),
+                                  ("album", "Album number %d" % i),
+                                  ("year", 1950 + i % 70),
+                                  ("genre", "Genre %d" % (i % 255))])
+    for name, response in [("255 genres", genres),
+                           ("10000 albums", albums)]:
+        print("%s: %.1f KB" % (name, len(response) / 1e3))
+        report("old (unquote, split every token)",
+               timed(lambda: [v for k, v in old_pairs_from(response)
+                              if k == 'genre']))
+        report("pairs (one pass, all tags)",
+               timed(lambda: pairs(response)))
+        report("values (one pass, wanted tags only)",
+               timed(lambda: values(response, 'genre')))
+
+
+def old_pairs_from2(response):
+    """How Server used to split listings (after unescaping them all)"""
+    response = ' '.join(unquote(s) for s in response.split(' '))
+
+    def demunge(string):
+        return tuple(unquote(string).split(':', 1))
+
+    words = "|".join(["id", "album", "artist", "count", "year"])
+    pattern = r"(^|\W)({kwds})(?=\W|$)".format(kwds=words)
+    d = re.sub(pattern, r"_\2", response)[1:]
+    return [t for t in map(demunge, d.split('_')) if len(t) == 2]
+
+
+@benchmark
+def tokenizer():
+    """Splitting album listings into items: regex vs Tokenizer"""
+    tokenizer = Tokenizer.for_tags("Album", ("id", "album", "year", "artist"))
+    for count in [255, 10000]:
+        albums = " ".join(quote("%s:%s" % tag, safe='') for i in range(count)
+                          for tag in [("id", 7000000 + i),
+                                      ("album", "Album number %d" % i),
+                                      ("year", 1950 + i % 70),
+                                      ("artist", "Some Artist %d" % i)])
+        print("%d albums: %.1f KB" % (count, len(albums) / 1e3))
+        report("old (_pairs_from2)",
+               timed(lambda: old_pairs_from2(albums)))
+        report("Tokenizer.pairs", timed(lambda: list(tokenizer.pairs(albums))))
+        report("Tokenizer.records",
+               timed(lambda: list(tokenizer.records(albums))))
+
+
+def overlapped_modes(port, count):
+    """Best time for `count` mode queries at once, with asyncio"""
+    import asyncio
+    from squeezealexa.squeezebox.aio import AsyncConnection, AsyncServer
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    server = loop.run_until_complete(AsyncServer.create(
+        AsyncConnection("127.0.0.1", port, context=create_context())))
+    try:
+        return timed(lambda: loop.run_until_complete(asyncio.gather(
+            *[server.is_stopped() for _ in range(count)])))
+    finally:
+        server.close()
+        loop.run_until_complete(asyncio.sleep(0))
+        loop.close()
+        asyncio.set_event_loop(None)
+
+
+@benchmark
+def end_to_end():
+    """Server commands over TLS to a simulated LMS, at various latencies"""
+    directory = tempfile.mkdtemp()
+    try:
+        cert_file, key_file = make_certificate(directory)
+        library = Library.generate(artists=500, albums_per_artist=8)
+        for latency in [0, 0.005, 0.02]:
+            print("%.0f ms latency, %d albums:"
+                  % (latency * 1000, len(library.albums)))
+            with Simulator(library, cert_file=cert_file, key_file=key_file,
+                           latency=latency) as sim:
+                report("connect & load players",
+                       timed(lambda: Server(SslSocketWrapper("127.0.0.1",
+                                                             sim.port))
+                             .players))
+                server = Server(SslSocketWrapper("127.0.0.1", sim.port))
+                report("10 x mode query",
+                       timed(lambda: [server.is_stopped()
+                                      for _ in range(10)]))
+                if not PY2:
+                    report("10 x mode query (asyncio, at once)",
+                           overlapped_modes(sim.port, 10))
+                report("album search (all %d)" % len(library.albums),
+                       timed(lambda: server.get_albums_with_search_term(
+                           "album")))
+    finally:
+        shutil.rmtree(directory)
+
+
+@benchmark
+def snapshot():
+    """Cold start: the library from LMS, or from a snapshot on disk"""
+    directory = tempfile.mkdtemp()
+    try:
+        cert_file, key_file = make_certificate(directory)
+        library = Library.generate(artists=2000, albums_per_artist=10)
+        path = join(directory, "library.snapshot")
+        print("%d artists, %d albums:"
+              % (len(library.artists), len(library.albums)))
+        with Simulator(library, cert_file=cert_file, key_file=key_file,
+                       latency=0.02) as sim:
+            def cold_start():
+                server = Server(SslSocketWrapper("127.0.0.1", sim.port))
+                server.index.albums_matching("album 1")
+                return server
+
+            report("load index from LMS (20 ms latency)",
+                   timed(cold_start))
+            Snapshot.save(path, cold_start())
+
+        def restored():
+            server = Server(connect=None)
+            Snapshot.load(path).restore(server)
+            server.index.albums_matching("album 1")
+
+        report("load index from snapshot", timed(restored))
+    finally:
+        shutil.rmtree(directory)
+
+
+def misheard(name, rand):
+    """The name, as Alexa might hear it: a letter lost, or a word"""
+    words = name.split()
+    if len(words) > 2 and rand.random() < 0.3:
+        del words[rand.randrange(len(words))]
+    i = rand.randrange(len(words))
+    if len(words[i]) > 3:
+        j = rand.randrange(1, len(words[i]))
+        words[i] = words[i][:j] + words[i][j + 1:]
+    return " ".join(words)
+
+
+@benchmark
+def fuzzy():
+    """Fuzzy matching misheard names: a full scan vs a trigram shortlist"""
+    rand = random.Random(42)
+    for slot in ("artists", "albums"):
+        path = join(ROOT, "metadata", "slots", "%s.txt" % slot)
+        with io.open(path, encoding="utf-8") as f:
+            names = [line.strip() for line in f if line.strip()]
+        queries = [misheard(name, rand) for name in rand.sample(names, 20)]
+        print("%d %s, %d misheard names:" % (len(names), slot, len(queries)))
+        report("index by trigram", timed(lambda: TrigramIndex(
+            (i, fold(n)) for i, n in enumerate(names))))
+        report("index by sound", timed(lambda: PhoneticIndex(
+            (i, fold(n)) for i, n in enumerate(names))))
+        index = TrigramIndex((i, fold(n)) for i, n in enumerate(names))
+        sounds = PhoneticIndex((i, fold(n)) for i, n in enumerate(names))
+        report("sound-alikes (each)", timed(lambda: [
+            sounds.lookup(fold(q)) for q in queries]) / len(queries))
+
+        def best(query, choices):
+            found = process.extractBests(query, choices, limit=1,
+                                         score_cutoff=75)
+            return found[0][1] if found else None
+
+        expected = [best(q, names) for q in queries[:5]]
+        report("full scan (each)", timed(lambda: [best(q, names)
+                                                  for q in queries[:5]],
+                                         repeat=1) / 5)
+        expected += [best(q, names) for q in queries[5:]]
+        for limit, overlap in ((10, 0.5), (50, 0.5), (200, 0.5), (50, 0.3)):
+            def shortlisted():
+                return [best(q, [names[i] for i in
+                                 index.shortlist(fold(q), limit, overlap)])
+                        for q in queries]
+
+            found = shortlisted()
+            same = sum(f == e for f, e in zip(found, expected))
+            report("shortlist of %d, %d%% overlap (each)"
+                   % (limit, overlap * 100),
+                   timed(shortlisted) / len(queries))
+            print("  %-40s %8d / %d"
+                  % ("...as good as full scan", same, len(queries)))
+
+
+if __name__ == '__main__':
+    names = sys.argv[1:] or sorted(BENCHMARKS)
+    for name in names:
+        func = BENCHMARKS[name]
+        print("\n>>>> %s: %s <<<<" % (name, func.__doc__))
+        func()
@@ -33,17 +33,18 @@ def run_diagnostics(sslw):
                     password=SERVER_PASSWORD)
     assert server.genres
     assert server.playlists
-    cur_play_details = server.get_track_details().values()
-    if cur_play_details:
+    now = server.get_now_playing()
+    if now.title:
         print("Currently playing: %s" %
-              " >> ".join(cur_play_details))
+              " >> ".join(filter(None, [now.title, now.album, now.artist])))
     else:
         print("Nothing currently in playlist")
+    print("Player %s is %s (volume %s), at %.0f of %.0f seconds"
+          % (now.player_name, now.mode, now.volume,
+             now.time or 0, now.duration or 0))
 
-    status = server.get_status()
-    print("Up next: %s >> %s >> %s" % (status.get('genre', "Unknown genre"),
-                                       status.get('title', 'Unknown track'),
-                                       status.get('artist', 'Unknown artist')))
+    sslw.reconnect()
+    print("TLS: %s" % sslw.sessions)
 
 
 def die(help="no idea, sorry."):
@@ -73,16 +73,24 @@ class IntentHandler(object):
 
     def __init__(self):
         self._handlers = {}
+        self._static = set()
 
     def for_name(self, name):
         """Returns the handler for the given intent, or `None`"""
         return self._handlers.get(name, None)
 
-    def handle(cls, name):
-        """Registers a handler function for the given intent"""
+    def is_static(self, name):
+        """Whether the intent's handler never needs the server"""
+        return name in self._static
+
+    def handle(cls, name, static=False):
+        """Registers a handler function for the given intent.
+        Static ones (that never need the server) are told no player."""
 
         def _handler(func):
             cls._handlers[name] = func
+            if static:
+                cls._static.add(name)
             return func
 
         return _handler
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+#
+#   Copyright 2017 Nick Boultbee
+#   This file is part of squeeze-alexa.
+#
+#   squeeze-alexa is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   See LICENSE for full license
+
+import random
+import threading
+import time
+
+from squeezealexa.utils import print_d, print_w
+
+
+class CircuitOpenError(Exception):
+    """Not even trying the server, as it's been failing"""
+
+    def __init__(self, msg, retry_in=None):
+        super(CircuitOpenError, self).__init__(msg)
+        self.retry_in = retry_in
+
+
+class CircuitBreaker(object):
+    """Stops us wasting (Lambda) time on a server that keeps failing.
+
+    After `max_failures` consecutive failures the circuit opens, and calls
+    fail fast for a backoff period that doubles (with jitter) every time
+    it re-opens. After that, one "half-open" probe call is let through:
+    if it succeeds the circuit closes again, otherwise it re-opens.
+    Any checks made while probing, by the thread doing so (e.g. by a
+    connection pool, when it's connecting), are part of that probe."""
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half-open"
+
+    def __init__(self, max_failures=3, base_delay=2.0, max_delay=120.0,
+                 jitter=0.5, clock=time.time, rand=random.random):
+        self.max_failures = max_failures
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self._clock = clock
+        self._rand = rand
+        self._lock = threading.Lock()
+        self.failures = 0
+        self.trips = 0
+        """How many times in a row the circuit has opened"""
+        self._state = self.CLOSED
+        self._retry_at = 0
+        self._probing = None
+        """The thread probing the server, if any"""
+
+    @property
+    def state(self):
+        if self._state == self.OPEN and self._clock() >= self._retry_at:
+            return self.HALF_OPEN
+        return self._state
+
+    @property
+    def retry_in(self):
+        """Seconds until another call will be allowed"""
+        if self._state != self.OPEN:
+            return 0.0
+        return max(0.0, self._retry_at - self._clock())
+
+    def allow(self):
+        """Whether a call should be made now"""
+        with self._lock:
+            state = self.state
+            if state == self.CLOSED:
+                return True
+            if state != self.HALF_OPEN:
+                return False
+            current = threading.current_thread()
+            if self._probing is None:
+                print_d("Circuit half-open: probing the server again")
+                self._state = self.HALF_OPEN
+                self._probing = current
+            return self._probing is current
+
+    def check(self, name="server"):
+        """:raises CircuitOpenError if no call should be made now"""
+        if not self.allow():
+            raise CircuitOpenError("Not trying %s again for %.1f seconds"
+                                   % (name, self.retry_in),
+                                   retry_in=self.retry_in)
+
+    def succeeded(self):
+        with self._lock:
+            if self._state != self.CLOSED:
+                print_d("Circuit closed: server is responding again")
+            self._state = self.CLOSED
+            self.failures = 0
+            self.trips = 0
+            self._probing = None
+
+    def failed(self):
+        with self._lock:
+            self.failures += 1
+            if self._state == self.HALF_OPEN or \
+                    self.failures >= self.max_failures:
+                self._trip()
+
+    def _trip(self):
+        self.trips += 1
+        delay = min(self.max_delay, self.base_delay * 2 ** (self.trips - 1))
+        delay *= 1 - self.jitter * self._rand()
+        print_w("Circuit open after %d failure(s): fast-failing for %.1fs"
+                % (self.failures, delay))
+        self._state = self.OPEN
+        self._retry_at = self._clock() + delay
+        self._probing = None
+
+    def __str__(self):
+        return "circuit %s (%d failures)" % (self.state, self.failures)
@@ -12,9 +12,9 @@
 
 from __future__ import print_function
 
-import collections
 import random
 import time
+from os.path import dirname, join
 
 from fuzzywuzzy import process, fuzz
 from squeezealexa.alexa.handlers import AlexaHandler, IntentHandler
@@ -23,10 +23,16 @@ from squeezealexa.alexa.response import audio_response, speech_response, \
     _build_response
 from squeezealexa.alexa.utterances import Utterances
 from squeezealexa.settings import *
-from squeezealexa.squeezebox.server import Server, print_d
-from squeezealexa.ssl_wrap import SslSocketWrapper
-from squeezealexa.utils import english_join, sanitise_text, strip_accents, \
-    recover_key, remove_stop_words
+from squeezealexa.circuit_breaker import CircuitOpenError
+from squeezealexa.pool import ConnectionPool
+from squeezealexa.squeezebox.group import ServerGroup
+from squeezealexa.squeezebox.listener import Listener
+from squeezealexa.squeezebox.snapshot import Snapshot
+from squeezealexa.squeezebox.server import Server, SqueezeboxScanning, \
+    SqueezeboxTimeout, print_d
+from squeezealexa.ssl_wrap import Timeout
+from squeezealexa.utils import english_join, sanitise_text, fold, \
+    simplified, print_w, Deadline
 
 
 class MinConfidences(object):
@@ -47,12 +53,33 @@ class SqueezeAlexa(AlexaHandler):
     _server = None
     """The server instance
     :type Server"""
+    _pools = None
+    """Open connections to each server, kept across invocations
+    :type list[ConnectionPool]"""
+    _deadline = None
+    """When the current request must be answered by
+    :type Deadline"""
+    _snapshots = []
+    """The snapshot path of each server, and the players last saved there"""
+    _listeners = []
+    """Keep each server's player state up to date, if LISTEN_FOR_CHANGES
+    :type list[Listener]"""
 
     def __init__(self, server=None, app_id=None):
         super(SqueezeAlexa, self).__init__(app_id)
         if server:
             print_d("Overriding class server for testing")
-            SqueezeAlexa._server = server
+            SqueezeAlexa._reset(server)
+
+    @classmethod
+    def _reset(cls, server=None):
+        """Replaces the server, along with its servers' listeners and
+        snapshots (which are paired with them by position)"""
+        for listener in cls._listeners:
+            listener.stop()
+        cls._server = server
+        cls._listeners = []
+        cls._snapshots = []
 
     def handle(self, event, context):
         request = event['request']
@@ -62,7 +89,50 @@ class SqueezeAlexa(AlexaHandler):
                     % (request['type'], request['requestId']))
             self.touch_audio()
             return _build_response({})
-        return super(SqueezeAlexa, self).handle(event, context)
+        SqueezeAlexa._deadline = Deadline.from_context(
+            context, margin=RESPONSE_MARGIN_SECS)
+        try:
+            return super(SqueezeAlexa, self).handle(event, context)
+        except (SqueezeboxTimeout, Timeout) as e:
+            print_w("Giving up on %s: %s" % (req_type, e))
+            return self.smart_response(
+                title="Server timeout",
+                text="The Squeezebox server didn't respond in time",
+                speech="Sorry, the server is slow right now. "
+                       "Please try again.")
+        except CircuitOpenError as e:
+            print_w("Not trying the server for %s: %s" % (req_type, e))
+            return self.smart_response(
+                title="Server unavailable",
+                text="Couldn't reach the Squeezebox server recently",
+                speech="Sorry, I can't reach your Squeezebox server "
+                       "at the moment. Please try again soon.")
+        finally:
+            self.flush()
+
+    @classmethod
+    def flush(cls):
+        """Finishes sending any commands before the response is returned
+        (and Lambda freezes us)"""
+        if cls._server:
+            cls._server.flush()
+            cls.save_snapshots()
+            cls.release_connections()
+
+    @classmethod
+    def release_connections(cls):
+        """Returns each server's connection to its pool, where the next
+        invocation checks it's still alive before using it again"""
+        servers = getattr(cls._server, "servers", [cls._server])
+        for server, pool in zip(servers, cls._pools or []):
+            pool.release(server.release_connection())
+
+    @classmethod
+    def save_snapshots(cls):
+        """Saves any changes to the servers' players or libraries"""
+        servers = getattr(cls._server, "servers", [cls._server])
+        for server, saved in zip(servers, cls._snapshots):
+            saved[1] = Snapshot.save_changes(saved[0], server, saved[1])
 
     def on_session_started(self, request, session):
         print_d("Starting new session {0} for request {1}"
@@ -78,32 +148,88 @@ class SqueezeAlexa(AlexaHandler):
         return speech_response("Welcome", speech_output, reprompt_text,
                                end=False)
 
+    @staticmethod
+    def _addresses():
+        """The (hostname, port) of each configured server"""
+        return [(SERVER_HOSTNAME, SERVER_SSL_PORT)] + list(EXTRA_SERVERS)
+
+    @classmethod
+    def get_pools(cls):
+        """
+        :return a pool of connections to each configured server
+        :rtype list[ConnectionPool]
+        """
+        if not cls._pools:
+            cls._pools = [ConnectionPool.for_server(
+                hostname=hostname,
+                port=port,
+                ca_file=CA_FILE_PATH,
+                cert_file=CERT_FILE_PATH,
+                verify_hostname=VERIFY_SERVER_HOSTNAME)
+                for hostname, port in cls._addresses()]
+        return cls._pools
+
+    @classmethod
+    def _create_server(cls, pool, address):
+        listener = None
+        if LISTEN_FOR_CHANGES:
+            listener = Listener(pool.acquire, user=SERVER_USERNAME,
+                                password=SERVER_PASSWORD).start()
+            cls._listeners.append(listener)
+        # Connecting lazily, within whichever request's deadline needs it
+        server = Server(connect=lambda: pool.acquire(deadline=cls._deadline),
+                        user=SERVER_USERNAME,
+                        password=SERVER_PASSWORD,
+                        debug=DEBUG_LMS,
+                        deadline=cls._deadline,
+                        breaker=pool.breaker,
+                        state=listener and listener.state)
+        if SNAPSHOT_DIR:
+            name = "squeeze-alexa-%s-%d.snapshot" % address
+            path = join(SNAPSHOT_DIR, name)
+            bundled = join(dirname(dirname(__file__)), name)
+            snapshot = Snapshot.load(path) or Snapshot.load(bundled)
+            if snapshot:
+                snapshot.restore(server)
+            saved = (snapshot.players if snapshot and "players" in snapshot
+                     else None)
+            cls._snapshots.append([path, saved])
+        return server
+
     @classmethod
     def get_server(cls):
         """
-        :return a Server instance
+        :return a Server (or ServerGroup, if there are several) instance
         :rtype Server
         """
-        if not cls._server or cls._server.is_stale():
-            sslw = SslSocketWrapper(hostname=SERVER_HOSTNAME,
-                                    port=SERVER_SSL_PORT,
-                                    ca_file=CA_FILE_PATH,
-                                    cert_file=CERT_FILE_PATH,
-                                    verify_hostname=VERIFY_SERVER_HOSTNAME)
-            cls._server = Server(sslw,
-                                 user=SERVER_USERNAME,
-                                 password=SERVER_PASSWORD,
-                                 cur_player_id=DEFAULT_PLAYER,
-                                 debug=DEBUG_LMS)
+        server = cls._server
+        if not server:
+            cls._reset()
+            servers = [cls._create_server(pool, address) for pool, address
+                       in zip(cls.get_pools(), cls._addresses())]
+            if len(servers) == 1:
+                server = servers[0]
+            else:
+                server = ServerGroup(servers)
+            if DEFAULT_PLAYER:
+                server.cur_player_id = DEFAULT_PLAYER
+            cls._server = server
             print_d("Created %r" % cls._server)
+            return cls._server
+
+        server.deadline = cls._deadline
+        if server.is_stale():
+            print_d("Refreshing stale %r" % server)
+            server.refresh(lazy=True)
         else:
-            print_d("Reusing cached %r" % cls._server)
-        return cls._server
+            print_d("Reusing cached %r" % server)
+        return server
 
     def on_intent(self, intent_request, session):
         intent = intent_request['intent']
         intent_name = intent['name']
-        pid = self.player_id_from(intent)
+        pid = (None if handler.is_static(intent_name)
+               else self.player_id_from(intent))
         print_d("Received %s: %s (for player %s)" % (intent_name, intent, pid))
 
         intent_handler = handler.for_name(intent_name)
@@ -139,10 +265,8 @@ class SqueezeAlexa(AlexaHandler):
 
     @handler.handle(Custom.CURRENT)
     def on_current(self, intent, session, pid=None):
-        details = self.get_server().get_track_details()
-        title = details['current_title']
-        album = details['album']
-        artist = details['artist']
+        now = self.get_server().get_now_playing(player_id=pid)
+        title, album, artist = now.title, now.album, now.artist
         if title:
             desc = "Currently playing: \"%s\"" % title
             if album:
@@ -332,12 +456,12 @@ class SqueezeAlexa(AlexaHandler):
             results |= genres_from(slot)
         return results
 
-    @handler.handle(General.HELP)
+    @handler.handle(General.HELP, static=True)
     def on_help(self, intent, session, pid=None):
         return self.on_launch(intent, session)
 
-    @handler.handle(General.CANCEL)
-    @handler.handle(General.STOP)
+    @handler.handle(General.CANCEL, static=True)
+    @handler.handle(General.STOP, static=True)
     def on_stop(self, intent, session, pid=None):
         return self.on_session_ended(intent, session)
 
@@ -362,8 +486,10 @@ class SqueezeAlexa(AlexaHandler):
         return server.cur_player_id if defaulting else None
 
     def on_session_ended(self, session_ended_request, session):
+        # Also used for stop intents, which have no request ID of their own
         print_d("on_session_ended requestId=%s, sessionId=%s" %
-                (session_ended_request['requestId'], session['sessionId']))
+                (session_ended_request.get('requestId'),
+                 session['sessionId']))
         speech_output = "Hasta la vista, baby."
         return speech_response("Session Ended", speech_output, end=True)
 
@@ -435,80 +561,19 @@ class SqueezeAlexa(AlexaHandler):
     @handler.handle(ServerStatus.STATUS)
     def on_status(self, intent, session, pid=None):
 
-        response = self.get_server().get_status()
-        if response is "Scanning":
-            response = "The server is currently scanning."
-
-        if 'player_name' not in dict(response):
+        now = self.get_server().get_now_playing(player_id=pid)
+        if now is None or now.player_name is None:
             return "probably testing"
-
-        print_d("status response = {}".format(response))
-
-        player_name = dict(response)['player_name']
-        # print_d("player_name = {}".format(player_name))
-
-        player_connected = "connected" \
-            if dict(response)['player_connected'] is "1" else "disconnected"
-        # print_d("player_connected = {}".format(player_connected))
-
-        return audio_response(title=player_name,
+        print_d("Status: {}".format(now))
+        if now.scanning:
+            player_connected = "The server is currently scanning."
+        else:
+            player_connected = ("connected" if now.connected
+                                else "disconnected")
+        return audio_response(title=now.player_name,
                               text=player_connected,
                               url=OPERATIONAL_AUDIO_FILE_URL)
 
-    @staticmethod
-    def get_items_sorted_by_year(items_dict):
-        """
-        given a dictionary,
-        return another dictionary sorted by year (first key in values)
-        """
-
-        if len(items_dict) == 0:
-            return None
-
-        # print_d("items_dict: {}".format(items_dict))
-        # {album_id: (album_year, album_name, artist_name), etc.}
-        # {'7136042': ('2012',
-        #  'D\xc3\xbdr\xc3\xb0 \xc3\xad dau\xc3\xb0a\xc3\xbe\xc3\xb6gn',
-        #  '\xc3\x81sgeir Trausti'),
-        #  '7129185': ('2014', 'Going Home (EP)', '\xc3\x81sgeir'),
-        #  '7129184': ('2013', 'In the Silence', '\xc3\x81sgeir')}
-
-        # make the values a list
-        values_list = items_dict.values()
-
-        # print_d("item_list: {}".format(item_list))
-        # [(album_year, album_name, artist_name), etc.]
-        # [('2012',
-        #   'D\xc3\xbdr\xc3\xb0 \xc3\xad dau\xc3\xb0a\xc3\xbe\xc3\xb6gn',
-        #   '\xc3\x81sgeir Trausti'),
-        #  ('2014', 'Going Home (EP)', '\xc3\x81sgeir'),
-        #  ('2013', 'In the Silence', '\xc3\x81sgeir')]
-
-        # sort list by album_year
-        values_list.sort(key=lambda x: x[0])
-
-        # print_d("values_list (sorted): {}".format(values_list))
-        # [('2012',
-        #   'D\xc3\xbdr\xc3\xb0 \xc3\xad dau\xc3\xb0a\xc3\xbe\xc3\xb6gn',
-        #   '\xc3\x81sgeir Trausti'),
-        #  ('2013', 'In the Silence', '\xc3\x81sgeir'),
-        #  ('2014', 'Going Home (EP)', '\xc3\x81sgeir')]
-
-        # and back to a dictionary (ordered by insertion order)
-        sorted_items = collections.OrderedDict()
-        for index, value in enumerate(values_list):
-            key = recover_key(items_dict, value)
-            sorted_items[key] = value
-
-        # print_d("sorted_items: {}".format(sorted_items))
-        # [('7136042',
-        #  ('2012',
-        #   'D\xc3\xbdr\xc3\xb0 \xc3\xad dau\xc3\xb0a\xc3\xbe\xc3\xb6gn',
-        #   '\xc3\x81sgeir Trausti')),
-        #  ('7129184', ('2013', 'In the Silence', '\xc3\x81sgeir')),
-        #  ('7129185', ('2014', 'Going Home (EP)', '\xc3\x81sgeir'))])
-        return sorted_items
-
     @staticmethod
     def get_artist_matches(server, wanted_artist):
         """
@@ -516,24 +581,21 @@ class SqueezeAlexa(AlexaHandler):
         return top_matching_artists
         """
 
-        # get artists from server matching wanted_artist
-        artist_pairs = server.get_artists_with_search_term(wanted_artist)
-        if artist_pairs is "Scanning":
+        # get artists from the library matching wanted_artist
+        try:
+            found = server.index.artists_like(wanted_artist,
+                                              FUZZY_CANDIDATES,
+                                              FUZZY_MIN_OVERLAP)
+            sounding = server.index.artists_sounding_like(wanted_artist)
+        except SqueezeboxScanning:
             print_d("Sorry, currently scanning. Try again later.")
             return None
 
-        # print_d(artist_pairs)
-
-        # artist count
-        # last item is always ('count', '5')
-        artist_count = artist_pairs[len(artist_pairs) - 1][1]
-        if int(artist_count) == 0:
+        if not found:
             print_d("Sorry, no matching artists found.")
             return None
 
-        # print_d("artist count: %s" % artist_count)
-
-        query = strip_accents(wanted_artist).lower()
+        query = fold(wanted_artist)
         # print_d("query: %s" % query)
 
         is_single_word = len(wanted_artist.split()) == 1
@@ -541,39 +603,29 @@ class SqueezeAlexa(AlexaHandler):
         #    print_d("wanted artist is a single word")
 
         artists = {}
-
-        artist_id = None
-        for key, val in artist_pairs:
-
-            if key == "count":
-                pass  # no-op
-            elif key == "id":
-                artist_id = val
-            elif key == "artist":
-
-                q = strip_accents(val).lower()
-                if is_single_word and query not in q:
-                    # e.g. is 'Zimmer' in 'Alvin Risk & Hans Zimmer'?
-                    # e.g. is 'Olafur' in 'Ólafur Arnalds'?
-                    print_d("skipping q: {}".format(q))
-                    continue
-
-                artist_name = val
-
-                # add artist to the dict
-                artists[artist_id] = artist_name
-                # print_d("artist added, id: {0}, artist: {1}"
-                #        .format(artist_id, artist_name))
-
-        artist_choices = artists.values()
-        # print_d("artist_choices: %s" % artist_choices)
+        names = {}
+
+        for artist in found:
+            q = server.index.folded(artist.name)
+            if is_single_word and query not in q and artist not in sounding:
+                # e.g. is 'Zimmer' in 'Alvin Risk & Hans Zimmer'?
+                # e.g. is 'Olafur' in 'Ólafur Arnalds'?
+                # (unless it sounds like it, e.g. 'shoppin' for 'Chopin',
+                # though it must still score well enough, below)
+                print_d("skipping q: {}".format(q))
+                continue
+
+            # add artist to the dicts
+            names[artist.id] = artist.name
+            artists[artist.id] = server.index.simplified(artist.name)
 
         ###########################
         # use FuzzyWuzzy to find best_artist_match
-        # best_artist_match = process.extractOne(wanted_artist,
-        #                                        artist_choices)[0]
-        matches = process.extractBests(query,
-                                       artist_choices,
+        # (from a dict, so each match comes with its artist ID,
+        # and of names already simplified, as loaded)
+        matches = process.extractBests(simplified(wanted_artist),
+                                       artists,
+                                       processor=None,
                                        limit=255,
                                        score_cutoff=75)
         if len(matches) == 0:
@@ -584,12 +636,8 @@ class SqueezeAlexa(AlexaHandler):
         ###########################
 
         matching_artists = {}
-        for m in matches:
-            artist_id = recover_key(artists, m[0])
-            # print_d("artist_id: {0}, artist_name: {1}"
-            #                  .format(artist_id, m[0]))
-            # 10388130
-            matching_artists[artist_id] = artists[artist_id]
+        for simple_name, score, artist_id in matches:
+            matching_artists[artist_id] = names[artist_id]
 
         # print_d("matching_artists = {}".format(matching_artists))
         return matching_artists
@@ -598,7 +646,7 @@ class SqueezeAlexa(AlexaHandler):
     def get_albums_by_artist(self, server, wanted_artist):
         """
         given a wanted_artist,
-        return sorted_albums
+        return [(album, artist_name), ...], oldest first
         """
 
         print_d("wanted_artist: {}".format(wanted_artist))
@@ -611,62 +659,17 @@ class SqueezeAlexa(AlexaHandler):
 
         print_d("matching_artists: {}".format(matching_artists))
 
-        # accumulate albums by all artists
-        albums = {}
-        for artist_id in matching_artists.keys():
-
-            # print_d("artist_id: %s" % artist_id)
+        # albums by all the artists, already in year order, from the library
+        try:
+            albums = server.index.albums_by(*matching_artists)
+        except SqueezeboxScanning:
+            return None
 
-            album_pairs = server.get_albums_with_artist_id(artist_id)
-            # print_d("album_pairs: {}".format(album_pairs))
-
-            # album count for this artist
-            # last item is always ('count', '5')
-            this_artist_album_count = \
-                int(album_pairs[len(album_pairs) - 1][1])
-
-            artist_name = matching_artists[artist_id]
-            # print_d("album count: {0} for {1}"
-            #        .format(this_artist_album_count, artist_name))
-
-            if this_artist_album_count > 0:
-                album_id = None
-                album_name = None
-
-                for key, val in album_pairs:
-
-                    if key == "count":
-                        pass  # no-op
-                    elif key == "id":
-                        album_id = val
-                    elif key == "album":
-                        album_name = val
-                    else:  # key == "year"
-                        album_year = val
-
-                        # add album to the dict
-                        albums[album_id] = (album_year,
-                                            album_name,
-                                            artist_name)
-                        # print_d("album added, id: {0},
-                        #         name: {1}, artist: {2}"
-                        #        .format(album_id, album_name,
-                        #         artist_name))
-
-        # print_d("albums: {}".format(albums))
-
-        # sort albums by year
-        sorted_albums = self.get_items_sorted_by_year(albums)
-
-        # print_d("sorted_albums: {}".format(sorted_albums))
-        # [('7136042',
-        #  ('2012',
-        #   'D\xc3\xbdr\xc3\xb0 \xc3\xad dau\xc3\xb0a\xc3\xbe\xc3\xb6gn',
-        #   '\xc3\x81sgeir Trausti')),
-        #  ('7129184', ('2013', 'In the Silence', '\xc3\x81sgeir')),
-        #  ('7129185', ('2014', 'Going Home (EP)', '\xc3\x81sgeir'))])
-
-        return sorted_albums
+        # each with the (first) matching artist of its contributors
+        return [(album, next(matching_artists[artist_id]
+                             for artist_id in album.contributors
+                             if artist_id in matching_artists))
+                for album in albums]
 
     @staticmethod
     def get_matched_album(self, server, wanted_album):
@@ -675,54 +678,31 @@ class SqueezeAlexa(AlexaHandler):
         return album_id, album_name, album_year
         """
 
-        album_pairs = server.get_albums_with_search_term(wanted_album)
-        if album_pairs is "Scanning":
+        try:
+            found = server.index.albums_like(wanted_album,
+                                             FUZZY_CANDIDATES,
+                                             FUZZY_MIN_OVERLAP)
+        except SqueezeboxScanning:
             return None
-
-        album_count = int(album_pairs[len(album_pairs) - 1][1])
-        # print_d("album count: {0}".format(album_count))
-        if album_count == 0:
+        if not found:
             return None
 
-        print_d("album_pairs: {}".format(album_pairs))
+        print_d("Found %d albums" % len(found))
 
-        album_year = None
         albums = {}
         simple_albums = {}
-        album_choices = []
-
-        for key, val in album_pairs:
-
-            if key == "count":
-                pass  # no-op
-            elif key == "id":
-                album_id = val
-            elif key == "album":
-                album_name = val
-            elif key == "year":
-                album_year = val
-            else:
-                artist_name = val
-
-                # add album to the dict
-                albums[album_id] = album_name, album_year, artist_name
-
-                simple_album_name = remove_stop_words(album_name)
 
-                simple_albums[album_id] = simple_album_name
-                album_choices.append(simple_album_name)
-
-                # print_d("album added, id: {0} album: {1}"
-                #         .format(album_id, album_name))
-
-        # print_d("album_choices: %s" % album_choices)
-        # print_d("albums: {}".format(albums))
-        # print_d("simple_albums: {}".format(simple_albums))
+        for album in found:
+            # add album to the dicts
+            albums[album.id] = album
+            simple_albums[album.id] = server.index.simplified(album.name)
 
         ###########################
         # use FuzzyWuzzy to find matches
+        # (from a dict, so albums with the same name don't collide)
         matches = process.extractBests(wanted_album,
-                                       album_choices,
+                                       simple_albums,
+                                       processor=None,
                                        score_cutoff=75)
         if len(matches) == 0:
             return None
@@ -733,47 +713,24 @@ class SqueezeAlexa(AlexaHandler):
 
         # get the match with the best ratio
         sort_ratio = 0
-        for m in matches:
+        for simple_album_name, score, album_id in matches:
 
-            sr = fuzz.token_sort_ratio(wanted_album, m[0])
-            # pr = fuzz.partial_ratio(wanted_album, m[0])
-            # set_ratio = fuzz.token_set_ratio(wanted_album, m[0])
+            sr = fuzz.token_sort_ratio(wanted_album, simple_album_name)
+            # pr = fuzz.partial_ratio(wanted_album, simple_album_name)
+            # set_ratio = fuzz.token_set_ratio(wanted_album, simple_album_name)
 
             # print_d("sort_ratio: {0}, partial_ratio: {1}, set_ratio: {2}"
             #        .format(sr, pr, set_ratio))
 
             if sr > sort_ratio:
                 sort_ratio = sr
-                album_match = m[0]
-
-        ###########################
-        # album_match = process.extractOne(wanted_album,
-        #                                 album_choices,
-        #                                 scorer=fuzz.token_set_ratio,
-        #                                 score_cutoff=75)
-        # print_d("(extractOne) album_match: {}".format(album_match))
-        ###########################
+                album_match = albums[album_id]
 
         if album_match is None:
             return None
 
-        # print_d("(extractBests) album_match: {}".format(album_match))
-        # print_d("found an album!")
-
-        # album_id = recover_key(simple_albums, album_match[0])
-        album_id = recover_key(simple_albums, album_match)
-        # print_d("album_id: {}".format(album_id))
-
-        album_name = albums[album_id][0]
-        # print_d("album_name: {}".format(album_name))
-
-        album_year = albums[album_id][1]
-        # print_d("album_year: {}".format(album_year))
-
-        artist_name = albums[album_id][2]
-        # print_d("artist_name: {}".format(artist_name))
-
-        return album_id, album_year, album_name, artist_name
+        return (album_match.id, album_match.year, album_match.name,
+                album_match.artist)
 
     @staticmethod
     def get_matched_album_by_artist(self,
@@ -796,115 +753,60 @@ class SqueezeAlexa(AlexaHandler):
 
         query = wanted_album
 
-        album_match = None
-
-        album_id = None
-        album_name = None
-        album_year = None
-
-        artist_id = None
-
-        albums = {}
-
         # loop through albums from each artist by artist_id
-        for artist_id in artist_matches.keys():
+        for artist_id, artist_name in artist_matches.items():
 
             # print_d("artist_id: %s" % artist_id)
 
-            album_pairs = server.get_albums_with_artist_id(artist_id)
-            # print_d("album_pairs count: {}".format(album_pairs))
-
-            # album count for this artist
-            # last item is always ('count', '5')
-            this_artist_album_count = \
-                int(album_pairs[len(album_pairs) - 1][1])
-            # print_d("album count: {0} for {1}"
-            #         .format(this_artist_album_count, artists[k]))
-
-            if this_artist_album_count > 0:
-
-                albums.clear()
-                album_id = None
-                album_match = None
-
-                for key, val in album_pairs:
-
-                    if key == "count":
-                        pass  # no-op
-                    elif key == "id":
-                        album_id = val
-                    elif key == "album":
-                        album_name = val
-                    else:  # key == "year"
-                        album_year = val
-
-                        # add album to the dict
-                        albums[album_id] = (album_year, album_name)
-                        # print_d("album added, id: {0} album: {1}"
-                        #        .format(album_id, album_name))
-
-                # we're done with this artist_id
-                # inspect albums now
-
-                album_choices = albums.values()
-                # print_d("album_choices: {}".format(album_choices))
-
-                ###########################
-                # use FuzzyWuzzy to find matches
-                matches = process.extractBests(wanted_album,
-                                               album_choices,
-                                               score_cutoff=75)
-                if len(matches) == 0:
-                    continue
-
-                # print_d("matches: {}".format(matches))
-                # [(u'for now i am winter', 95),
-                #  (u'for now i am winter hdtracks 24 44 1', 95),
-                #  (u'island songs hdtracks 24 96', 48),
-                #  (u'another happy day', 42),
-                #  (u'gimme shelter', 41)]
-
-                # default is the first match
-                # best_album_match = matches[0][0]  # u'for now i am winter'
-
-                # get the match with the best ratio
-                sort_ratio = 0
-                for m in matches:
-
-                    sr = fuzz.token_sort_ratio(query, m[0])
-
-                    # pr = fuzz.partial_ratio(query, m[0])
-                    # set_ratio = fuzz.token_set_ratio(query, m[0])
-                    # print_d("sort_ratio: {0}, partial_ratio: {1},
-                    #        set_ratio: {2}"
-                    #        .format(sr, pr, set_ratio))
-
-                    if sr > sort_ratio:
-                        sort_ratio = sr
-                        album_match = m[0]
-                        ###########################
-
-            # end of: if this_artist_album_count > 0
+            try:
+                found = server.index.albums_by(artist_id)
+            except SqueezeboxScanning:
+                return None
+
+            # the albums, by ID, as are their simplified names
+            albums = {album.id: album for album in found}
+            simple_albums = {album.id: server.index.simplified(album.name)
+                             for album in found}
+
+            ###########################
+            # use FuzzyWuzzy to find matches
+            matches = process.extractBests(wanted_album,
+                                           simple_albums,
+                                           processor=None,
+                                           score_cutoff=75)
+
+            # print_d("matches: {}".format(matches))
+            # [(u'for now i am winter', 95, 7129301),
+            #  (u'for now i am winter hdtracks 24 44 1', 95, 7129302),
+            #  (u'island songs hdtracks 24 96', 48, 7129303),
+            #  (u'another happy day', 42, 7129304),
+            #  (u'gimme shelter', 41, 7129305)]
+
+            # get the match with the best ratio
+            album_match = None
+            sort_ratio = 0
+            for simple_album_name, score, album_id in matches:
+
+                sr = fuzz.token_sort_ratio(query, simple_album_name)
+
+                # pr = fuzz.partial_ratio(query, simple_album_name)
+                # set_ratio = fuzz.token_set_ratio(query, simple_album_name)
+                # print_d("sort_ratio: {0}, partial_ratio: {1},
+                #        set_ratio: {2}"
+                #        .format(sr, pr, set_ratio))
+
+                if sr > sort_ratio:
+                    sort_ratio = sr
+                    album_match = albums[album_id]
+            ###########################
 
             if album_match is not None:
                 # print_d("found an album!")
-
-                album_id = recover_key(albums, album_match)
-                album_year = album_match[0]
-                album_name = album_match[1]
-
-                break
+                return (album_match.id, album_match.year, album_match.name,
+                        artist_name)
 
         # end of: for k in top_matching_artists.keys()
-
-        artist_name = artist_matches[artist_id]
-
-        # print_d("album_id: {}".format(album_id))
-        # print_d("album_year: {}".format(album_year))
-        # print_d("album_name: {}".format(album_name))
-        # print_d("artist_name: {}".format(artist_name))
-
-        return album_id, album_year, album_name, artist_name
+        return None
 
     def get_one_album_by_artist(self, server, intent, wanted_artist):
         """
@@ -917,54 +819,28 @@ class SqueezeAlexa(AlexaHandler):
 
         sorted_albums = self.get_albums_by_artist(self, server, wanted_artist)
 
-        # [('7136042', ('2012',
-        #    'D\xc3\xbdr\xc3\xb0 \xc3\xad dau\xc3\xb0a\xc3\xbe\xc3\xb6gn',
-        #    '\xc3\x81sgeir Trausti')),
-        #  ('7129184', ('2013', 'In the Silence', '\xc3\x81sgeir')),
-        #  ('7129185', ('2014', 'Going Home (EP)', '\xc3\x81sgeir'))])
+        # [(Album(7136042, u'D\xfdr\xf0 \xed dau\xf0a\xfe\xf6gn', 2012, ...),
+        #   u'\xc1sgeir Trausti'),
+        #  (Album(7129184, u'In the Silence', 2013, ...), u'\xc1sgeir'),
+        #  (Album(7129185, u'Going Home (EP)', 2014, ...), u'\xc1sgeir')]
 
-        if sorted_albums is None:
-            return None
-
-        album_count = len(sorted_albums)
-        # print_d(album_count)
-        if album_count == 0:
+        if not sorted_albums:
             return None
 
         intent_name = intent[u'name']
         # print_d(intent_name)
         if intent_name == u'PlayFirstAlbumByArtistIntent':
             # first album
-            i = 0
+            album, artist_name = sorted_albums[0]
         elif intent_name == u'PlayLatestAlbumByArtistIntent':
             # latest album
-            i = album_count - 1
+            album, artist_name = sorted_albums[-1]
         else:
             # random album
-            from random import randrange
-            i = randrange(0, album_count)
-        # print_d(i)
-
-        # python 2.x
-        # -> (key, value) tuple of ith element
-        album = sorted_albums.items()[i]
-        # print_d("album: {}".format(album))
-        # album: ('7129185', ('2014', 'Going Home (EP)', '\xc3\x81sgeir'))
+            album, artist_name = random.choice(sorted_albums)
 
-        album_id = album[0]
-        # print_d("album_id: {}".format(album_id))
-
-        album_year = album[1][0]
-        # print_d("album_year: {}".format(album_year))
-
-        album_name = album[1][1]
-        # print_d("album_name: {}".format(album_name))
-
-        artist_name = album[1][2]
-        # print_d("artist_name: {}".format(artist_name))
-
-        return album_id, album_year, album_name, artist_name
-        # ('7129185', '2014', 'Going Home (EP)', '\xc3\x81sgeir')
+        return album.id, album.year, album.name, artist_name
+        # (7129185, 2014, u'Going Home (EP)', u'\xc1sgeir')
 
     @staticmethod
     def get_item_from_slot(intent, name):
@@ -1006,20 +882,17 @@ class SqueezeAlexa(AlexaHandler):
             albums = self.get_albums_by_artist(self, server, artist_slot)
 
             # print_d("albums: {}".format(albums))
-            # albums: OrderedDict(
-            #  [('7136173', ('2010', 'Break Off', 'SBTRKT; SAMPHA')),
-            #   ('7134031', ('2017', 'Process', 'Sampha'))])
+            # albums: [(Album(7136173, u'Break Off', 2010, ...), u'SBTRKT'),
+            #          (Album(7134031, u'Process', 2017, ...), u'Sampha')]
 
-            if albums is None:
+            if not albums:
                 return self.smart_response(speech=s_error)
 
             # great, we found some albums
             album_count = len(albums)
 
             # get the artist name from a best match of all artists
-
-            first_album = albums.items()[album_count - 1]
-            artist_name = first_album[1][2]
+            artist_name = albums[-1][1]
 
             heading = "Number of albums by %s" % artist_name
             if album_count == 1:
@@ -1067,8 +940,8 @@ class SqueezeAlexa(AlexaHandler):
                 # get the album name from the slot
                 album_slot = self.get_item_from_slot(intent, 'Album')
 
-                # remove stop words
-                album_slot = remove_stop_words(album_slot)
+                # remove stop words (and accents, punctuation etc)
+                album_slot = simplified(album_slot)
 
                 # manipulate utterance to change some inputs
                 album_slot = self.process_album_slot(album_slot)
@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+#
+#   Copyright 2017 Nick Boultbee
+#   This file is part of squeeze-alexa.
+#
+#   squeeze-alexa is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   See LICENSE for full license
+
+"""Cheap shortlisting of names that might be what was heard, so that only
+those few need scoring with fuzzywuzzy (which is slow, per name)."""
+
+import heapq
+import math
+import re
+from collections import Counter
+
+from squeezealexa.utils import STOP_WORDS
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+_VOWELS = u"aeiouy"
+_SILENT_STARTS = (u"gn", u"kn", u"pn", u"ps", u"wr")
+_LETTERS = {u"æ": u"ae", u"œ": u"oe", u"ø": u"o", u"ß": u"ss", u"ð": u"d",
+            u"đ": u"d", u"þ": u"th", u"ł": u"l"}
+"""Letters that don't fold to plain ones (i.e. without their accents)"""
+
+
+def trigrams(text):
+    """The set of trigrams of some (folded) text: those of each word,
+    padded (as PostgreSQL's pg_trgm does) so that word starts weigh more
+
+    :rtype set[unicode]
+    """
+    grams = set()
+    for word in _WORD.findall(text):
+        padded = u"  %s " % word
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def _sounds(word, length=4):
+    """The primary and alternate codes for how a (folded) word sounds,
+    as Double Metaphone does, though (much) simplified: no more than
+    `length` consonant sounds (or digits), and any vowel only at the start
+
+    :rtype tuple[unicode, unicode]
+    """
+    word = u"".join(_LETTERS.get(c, c) for c in word if c.isalnum())
+    primary, alternate = [], []
+
+    def add(sound, alt=None):
+        primary.append(sound)
+        alternate.append(sound if alt is None else alt)
+
+    i = 1 if word[:2] in _SILENT_STARTS else 0
+    while i < len(word):
+        c = word[i]
+        after = word[i + 1:i + 2]
+        three = word[i:i + 3]
+        # Doubled letters sound as one
+        step = 2 if after == c else 1
+        if c in _VOWELS:
+            if i == 0:
+                add(u"A")
+        elif c.isdigit():
+            add(c)
+        elif c == u"b":
+            add(u"P")
+        elif c == u"c":
+            if after == u"h":
+                add(u"X", u"K")
+                step = 2
+            elif after and after in u"eiy":
+                add(u"S")
+            else:
+                add(u"K")
+                step = 2 if after == u"k" else step
+        elif c == u"d":
+            if three in (u"dge", u"dgi", u"dgy"):
+                add(u"J")
+                step = 2
+            else:
+                add(u"T")
+        elif c in u"fv":
+            add(u"F")
+        elif c == u"g":
+            if after == u"h":
+                # Silent, as in "night", unless at the start
+                if i == 0:
+                    add(u"K")
+                step = 2
+            elif after == u"n" and i + 2 == len(word):
+                step = 2
+            elif after and after in u"eiy":
+                add(u"J", u"K")
+            else:
+                add(u"K")
+        elif c == u"h":
+            before = word[i - 1:i]
+            if (not before or before in _VOWELS) and after and \
+                    after in _VOWELS:
+                add(u"H")
+        elif c == u"j":
+            add(u"J", u"H")
+        elif c in u"kq":
+            add(u"K")
+        elif c in u"lmnr":
+            add(c.upper())
+        elif c == u"p":
+            if after == u"h":
+                add(u"F")
+                step = 2
+            else:
+                add(u"P")
+        elif c == u"s":
+            if after == u"h":
+                add(u"X")
+                step = 2
+            elif three == u"sch":
+                add(u"SK", u"X")
+                step = 3
+            elif three in (u"sio", u"sia"):
+                add(u"X", u"S")
+            else:
+                add(u"S")
+        elif c == u"t":
+            if after == u"h":
+                add(u"0", u"T")
+                step = 2
+            elif three in (u"tio", u"tia"):
+                add(u"X")
+            elif three != u"tch":
+                add(u"T")
+        elif c == u"w":
+            if after and after in _VOWELS:
+                add(u"W", u"F")
+        elif c == u"x":
+            add(u"S" if i == 0 else u"KS")
+        elif c == u"z":
+            add(u"S")
+        i += step
+    return tuple(_collapsed(u"".join(codes))[:length]
+                 for codes in (primary, alternate))
+
+
+def _collapsed(code):
+    return u"".join(c for i, c in enumerate(code) if not i or code[i - 1] != c)
+
+
+def sounds(text):
+    """The distinct codes for how some (folded) text sounds, primary first:
+    those of its words (but its stop words) run together,
+    so how the words are split up (e.g. by Alexa) matters less
+
+    :rtype tuple[unicode]
+    """
+    words = _WORD.findall(text)
+    words = [w for w in words if w not in STOP_WORDS] or words
+    codes = [_sounds(w) for w in words]
+    primary = u"".join(p for p, _ in codes)
+    alternate = u"".join(a for _, a in codes)
+    if alternate == primary:
+        return (primary,) if primary else ()
+    return primary, alternate
+
+
+class PhoneticIndex(object):
+    """Texts by how they sound (see `sounds`), for looking up those
+    sounding the same as some other text, whatever the spelling"""
+
+    def __init__(self, items=()):
+        """
+        :param items: (key, folded text) pairs
+        """
+        self._keys = {}
+        for key, text in items:
+            self.add(key, text)
+
+    def add(self, key, text):
+        for code in sounds(text):
+            self._keys.setdefault(code, []).append(key)
+
+    def lookup(self, text):
+        """The keys of the texts sounding like some (folded) text
+
+        :rtype list
+        """
+        found, seen = [], set()
+        for code in sounds(text):
+            for key in self._keys.get(code, ()):
+                if key not in seen:
+                    seen.add(key)
+                    found.append(key)
+        return found
+
+
+class TrigramIndex(object):
+    """An inverted index of texts by their trigrams, to find those sharing
+    the most with some other text, without comparing it with every one"""
+
+    def __init__(self, items=()):
+        """
+        :param items: (key, folded text) pairs
+        """
+        self._postings = {}
+        """The keys of the texts having each trigram"""
+        self._sizes = {}
+        """How many trigrams each key's text has"""
+        for key, text in items:
+            self.add(key, text)
+
+    def add(self, key, text):
+        grams = trigrams(text)
+        self._sizes[key] = len(grams)
+        postings = self._postings
+        for gram in grams:
+            postings.setdefault(gram, []).append(key)
+
+    def __len__(self):
+        return len(self._sizes)
+
+    def shortlist(self, text, limit=50, min_overlap=0.5):
+        """The keys of (at most `limit`) texts sharing the most trigrams
+        with some (folded) text, and at least `min_overlap` of its own.
+        Ties go to the shorter texts, i.e. those with fewer other words.
+
+        :rtype list
+        """
+        grams = trigrams(text)
+        if not grams:
+            return []
+        shared = self._shared(grams)
+        needed = max(1, int(math.ceil(min_overlap * len(grams))))
+        sizes = self._sizes
+        return heapq.nlargest(limit,
+                              (k for k, n in shared.items() if n >= needed),
+                              key=lambda k: (shared[k], -sizes[k]))
+
+    def ranked(self, text, keys):
+        """Some keys, those whose texts share the most trigrams with some
+        (folded) text first, as in `shortlist`
+
+        :rtype list
+        """
+        shared = self._shared(trigrams(text))
+        sizes = self._sizes
+        return sorted(keys, key=lambda k: (-shared[k], sizes.get(k, 0)))
+
+    def _shared(self, grams):
+        """How many of the trigrams each text has (if any)"""
+        shared = Counter()
+        for gram in grams:
+            shared.update(self._postings.get(gram, ()))
+        return shared
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+#
+#   Copyright 2017 Nick Boultbee
+#   This file is part of squeeze-alexa.
+#
+#   squeeze-alexa is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   See LICENSE for full license
+
+import threading
+from functools import partial
+
+from squeezealexa.circuit_breaker import CircuitBreaker
+from squeezealexa.ssl_wrap import SslSocketWrapper, create_context
+from squeezealexa.utils import print_d, print_w
+
+
+class ConnectionPool(object):
+    """Keeps connections to the CLI proxy open across (Lambda) invocations,
+    checking them cheaply before handing them out, and replacing broken
+    ones in the background."""
+
+    def __init__(self, factory, max_idle=1, breaker=None):
+        """
+        :param factory: callable returning a new, connected transport
+                        (taking any `deadline` for connecting)
+        :param max_idle: how many spare connections to keep open
+        :param breaker: the CircuitBreaker for connecting to the server
+        """
+        self._factory = factory
+        self.max_idle = max_idle
+        self.breaker = breaker or CircuitBreaker()
+        self._idle = []
+        self._lock = threading.Lock()
+        self._pending = None
+        self.created = 0
+
+    @classmethod
+    def for_server(cls, hostname, port, ca_file=None, cert_file=None,
+                   verify_hostname=False, max_idle=1):
+        """A pool of TLS connections to the given server,
+        all sharing the one (expensive to build) TLS context"""
+        context = create_context(ca_file, cert_file, verify_hostname)
+        return cls(partial(SslSocketWrapper, hostname, port,
+                           context=context),
+                   max_idle=max_idle)
+
+    def acquire(self, deadline=None):
+        """Returns a healthy connection, reusing an open one if possible
+
+        :param deadline: the Deadline for making any new connection
+        """
+        while True:
+            with self._lock:
+                conn = self._idle.pop() if self._idle else None
+                pending = self._pending
+            if conn is None:
+                break
+            if conn.is_alive():
+                print_d("Reusing open connection to %s" % conn)
+                return conn
+            conn.close()
+
+        if pending:
+            # No longer than we'd have to connect ourselves
+            pending.join(deadline and deadline.remaining())
+            with self._lock:
+                conn = self._idle.pop() if self._idle else None
+            if conn and conn.is_alive():
+                print_d("Using connection to %s made in background" % conn)
+                return conn
+        return self._connect(deadline)
+
+    def release(self, conn):
+        """Returns a connection to the pool for later reuse"""
+        if conn is None:
+            return
+        with self._lock:
+            if conn.is_connected and len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def discard(self, conn):
+        """Throws away a (broken) connection, and starts to replace it"""
+        if conn is not None:
+            conn.close()
+        self.refill()
+
+    def refill(self):
+        """Opens a replacement connection in the background,
+        if there's room for one and one isn't already on its way"""
+        with self._lock:
+            if self._pending or len(self._idle) >= self.max_idle:
+                return
+            self._pending = threading.Thread(target=self._connect_idle,
+                                             name="squeeze-reconnect")
+            self._pending.daemon = True
+            self._pending.start()
+
+    def close(self):
+        """Closes all idle connections"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+    def _connect(self, deadline=None):
+        """A new connection, unless the server's been failing recently
+        :raises CircuitOpenError if not even trying"""
+        self.breaker.check()
+        try:
+            conn = (self._factory() if deadline is None
+                    else self._factory(deadline=deadline))
+        except Exception:
+            self.breaker.failed()
+            raise
+        self.breaker.succeeded()
+        self.created += 1
+        return conn
+
+    def _connect_idle(self):
+        try:
+            conn = self._connect()
+        except Exception as e:
+            print_w("Couldn't reconnect in the background (%s)" % e)
+            conn = None
+        with self._lock:
+            if conn is not None:
+                self._idle.append(conn)
+            self._pending = None
+
+    def __len__(self):
+        return len(self._idle)
@@ -39,6 +39,11 @@ SERVER_SSL_PORT = 19090
 """The above proxy server's listening port (that accepts TLS connections).
 For stunnel, this will be the same as `accept = ...`"""
 
+EXTRA_SERVERS = []
+"""Any more servers' CLI proxies, as (hostname, port) pairs, e.g. for an LMS
+in each building. All their players can be used, each through its own server.
+They must share the settings here, e.g. credentials and certificates."""
+
 SERVER_USERNAME = None
 """A string containing the Squeezebox CLI username, or None if not required."""
 
@@ -51,6 +56,29 @@ DEFAULT_PLAYER = None
 DEBUG_LMS = False
 """Dump LMS CLI communication to log if True"""
 
+LISTEN_FOR_CHANGES = False
+"""Keep the players' state up to date from LMS notifications, over a
+connection of its own, so status and now-playing need no requests.
+Only worth it where the skill keeps running (i.e. not on Lambda)"""
+
+SNAPSHOT_DIR = '/tmp'
+"""Where to save a snapshot of each server's players and library, so that
+a (Lambda) cold start can use them at once, instead of asking the server.
+Any snapshot bundled with the deployment (i.e. in the project root) is used
+until one has been saved here. None disables snapshots."""
+
+FUZZY_CANDIDATES = 50
+"""How many of the library's artists or albums most like what was heard
+are scored (slowly) to pick the best. More may find worse-heard ones."""
+
+FUZZY_MIN_OVERLAP = 0.5
+"""The fraction of the trigrams (three-letter chunks) of what was heard
+that an artist or album must share, to be a candidate at all"""
+
+RESPONSE_MARGIN_SECS = 1.0
+"""Give up waiting for LMS this many seconds before the Lambda timeout,
+leaving time to tell the user about it"""
+
 # ------------------------- TLS (SSL) Configuration ---------------------------
 
 CERT_FILE = 'squeeze-alexa.pem'
@@ -0,0 +1,366 @@
+# -*- coding: utf-8 -*-
+#
+#   Copyright 2017 Nick Boultbee
+#   This file is part of squeeze-alexa.
+#
+#   squeeze-alexa is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   See LICENSE for full license
+
+"""asyncio access to LMS (Python 3 only).
+
+AsyncServer runs the Server's own command methods, collected in a Batch
+just as `Server.batch` does, but sends that over an AsyncConnection.
+So commands from any number of coroutines can be in flight at once on the
+one connection, while building them, matching and parsing their responses,
+the circuit breaker and the cache all stay shared with the blocking Server.
+"""
+
+import asyncio
+from functools import partial
+
+from squeezealexa.squeezebox.batch import Batch, Future
+from squeezealexa.squeezebox.multiplexer import Multiplexer
+from squeezealexa.squeezebox.parsing import Tokenizer, values
+from squeezealexa.squeezebox.records import Album, Artist, Genre, Playlist
+from squeezealexa.squeezebox.server import Server, SqueezeboxException, \
+    SqueezeboxScanning, SqueezeboxTimeout
+from squeezealexa.ssl_wrap import Error, Timeout, create_context
+from squeezealexa.utils import Deadline, print_d, print_w
+
+
+class AsyncConnection(object):
+    """A connection to the CLI (via TLS, if given a context) for asyncio.
+    A task reads each line as it arrives, and hands it to the same
+    Multiplexer as blocking connections use, to find its request."""
+
+    _CONNECT_TIMEOUT = 5
+    _LINE_LIMIT = 16 * 1024 * 1024
+    """Longest response line allowed (big listings are one line)"""
+
+    def __init__(self, hostname, port=9090, context=None, timeout=None):
+        self.hostname = hostname
+        self.port = port
+        self.context = context
+        self.timeout = timeout or self._CONNECT_TIMEOUT
+        """Seconds to allow for connecting (including the TLS handshake)"""
+        self.authenticated = False
+        self.is_connected = False
+        self.multiplexer = None
+        self._reader = None
+        self._writer = None
+        self._read_task = None
+        self._answers = {}
+        """The future for each Pending request"""
+        self._unsent = []
+
+    @classmethod
+    def for_server(cls, hostname, port, ca_file=None, cert_file=None,
+                   verify_hostname=False):
+        return cls(hostname, port,
+                   context=create_context(ca_file, cert_file,
+                                          verify_hostname))
+
+    async def connect(self, deadline=None):
+        """:type deadline Deadline"""
+        deadline = deadline or Deadline()
+        kwargs = {}
+        if self.context:
+            kwargs = {"ssl": self.context, "server_hostname": self.hostname}
+        try:
+            self._reader, self._writer = await asyncio.wait_for(
+                asyncio.open_connection(self.hostname, self.port,
+                                        limit=self._LINE_LIMIT, **kwargs),
+                deadline.timeout(self.timeout))
+        except asyncio.TimeoutError:
+            raise Timeout("Timed out connecting to %s" % self)
+        self.authenticated = False
+        self.multiplexer = Multiplexer(self)
+        self.is_connected = True
+        self._read_task = asyncio.ensure_future(self._read_lines())
+
+    def close(self):
+        self.is_connected = False
+        self.authenticated = False
+        if self._read_task:
+            self._read_task.cancel()
+            self._read_task = None
+        if self._writer:
+            self._writer.close()
+            self._writer = None
+        self._unsent = []
+        self._fail_waiting(Error("Closed connection to %s" % self))
+
+    def _fail_waiting(self, error):
+        answers, self._answers = self._answers, {}
+        for future in answers.values():
+            if not future.done():
+                future.set_exception(error)
+
+    async def _read_lines(self):
+        try:
+            while True:
+                line = await self._reader.readline()
+                if not line:
+                    print_w("%s closed the connection" % self)
+                    break
+                self.multiplexer.dispatch(line.decode('utf-8').rstrip("\n"))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print_w("Couldn't read from %s (%s)" % (self, e))
+        self.is_connected = False
+        self._fail_waiting(Error("No further response from %s" % self))
+
+    def send(self, data, timeout=None):
+        """Queues the data to be written along with anything else sent
+        before the loop next runs, so LMS gets them all together
+
+        :returns whether that worked
+        """
+        if not self.is_connected:
+            return False
+        if not self._unsent:
+            asyncio.get_event_loop().call_soon(self._write)
+        self._unsent.append(data)
+        return True
+
+    def _write(self):
+        data, self._unsent = "".join(self._unsent), []
+        if self._writer is not None:
+            self._writer.write(data.encode('utf-8'))
+
+    async def request(self, lines, timeout=None):
+        """Sends the lines, then waits (for up to `timeout` seconds)
+        for their responses, whatever else is in flight meanwhile
+
+        :returns their response lines, in order
+        """
+        pending = self.multiplexer.send(lines, timeout=timeout,
+                                        on_response=self._answered)
+        if pending is None:
+            raise Error("Couldn't send to %s" % self)
+        loop = asyncio.get_event_loop()
+        futures = [loop.create_future() for _ in pending]
+        self._answers.update(zip(pending, futures))
+        try:
+            return await asyncio.wait_for(asyncio.gather(*futures), timeout)
+        except asyncio.TimeoutError:
+            # Just as blocking connections give up
+            self.close()
+            raise Timeout("No response from %s within %.1fs"
+                          % (self, timeout))
+
+    def _answered(self, pending):
+        future = self._answers.pop(pending, None)
+        if future is not None and not future.done():
+            future.set_result(pending.response)
+
+    def __str__(self):
+        return "{hostname}:{port}".format(**self.__dict__)
+
+
+def _resolved(result):
+    """The value of a command method's result, once its batch is sent"""
+    while isinstance(result, Future):
+        result = result.result()
+    if isinstance(result, list):
+        return [_resolved(r) for r in result]
+    return result
+
+
+class AsyncServer(object):
+    """A Server's commands as coroutines, which can overlap (e.g. with
+    asyncio.gather) on one AsyncConnection. The commands that don't page
+    through listings (see `COMMANDS`) are the Server's own methods, run by
+    `run`; listings are paged here, but cached in the Server's cache."""
+
+    COMMANDS = frozenset([
+        "player_request", "play", "pause", "resume", "stop", "next",
+        "previous", "change_volume", "set_power", "set_all_power",
+        "set_shuffle", "set_repeat", "playlist_play", "playlist_clear",
+        "playlist_resume", "change_song", "play_album_with_id",
+        "play_genres", "play_random_mix", "is_stopped", "get_now_playing",
+        "get_milliseconds", "get_info_total", "get_library_version",
+        "is_scanning", "rescan"])
+    """Server methods available here as coroutines"""
+
+    def __init__(self, connection, server=None, user=None, password=None):
+        """
+        :type connection AsyncConnection
+        :param server: the (unconnected) Server whose commands to run
+        """
+        self.connection = connection
+        self.server = server or Server(user=user, password=password)
+
+    @classmethod
+    async def create(cls, connection, **kwargs):
+        """An AsyncServer connected, logged in and with its players"""
+        server = cls(connection, **kwargs)
+        if not connection.is_connected:
+            await server.connect()
+        await server.refresh_status()
+        return server
+
+    def __getattr__(self, name):
+        if name not in self.COMMANDS:
+            raise AttributeError("AsyncServer has no command %r" % name)
+        return partial(self.run, getattr(self.server, name))
+
+    async def run(self, method, *args, **kwargs):
+        """Calls a Server command method, sending its commands (and any
+        that follow from their results) over this connection
+
+        :returns what the method would have, if not batched
+        """
+        batch = Batch(None)
+        with self.server.collecting(batch):
+            result = method(*args, **kwargs)
+        while len(batch):
+            items = batch.take()
+            try:
+                results = await self._request(
+                    [line for line, _, _ in items], raw=True)
+            except Exception as e:
+                batch.fail(e, items)
+                raise
+            with self.server.collecting(batch):
+                batch.resolve(items, results)
+        return _resolved(result)
+
+    async def connect(self):
+        """(Re)connects, and logs in if need be"""
+        await self.connection.connect(self.server.deadline)
+        if self.server.user and self.server.password:
+            await self.log_in()
+
+    async def log_in(self):
+        server = self.server
+        reply = await self._exchange(["login %s %s"
+                                      % (server.user, server.password)])
+        if reply[0] != "%s ******" % server.user:
+            raise SqueezeboxException(
+                "Couldn't log in to squeezebox: response was '%s'"
+                % reply[0])
+        self.connection.authenticated = True
+
+    async def _request(self, lines, raw=False):
+        if not self.connection.is_connected:
+            await self.connect()
+        return await self._exchange(lines, raw=raw)
+
+    async def _exchange(self, lines, raw=False):
+        server = self.server
+        server.breaker.check(str(self))
+        try:
+            responses = await self.connection.request(
+                lines, timeout=server._timeout_for(lines))
+        except Timeout as e:
+            server.breaker.failed()
+            raise SqueezeboxTimeout(str(e))
+        except Error as e:
+            server.breaker.failed()
+            raise SqueezeboxException(str(e))
+        server.breaker.succeeded()
+        return Server._parse_responses(lines, responses, raw=raw)
+
+    async def _fetch(self, line):
+        """The result of a listing page, from the cache if possible"""
+        result, stale = self.server.cache.get(line)
+        if result is not None:
+            if stale:
+                asyncio.ensure_future(self._revalidate(line))
+            return result
+        return await self._refetch(line)
+
+    async def _revalidate(self, line):
+        """Refreshes a stale cached result, in the background"""
+        print_d("Revalidating %s" % line)
+        try:
+            await self._refetch(line)
+        except Exception as e:
+            print_w("Couldn't revalidate %s (%s)" % (line, e))
+
+    async def _refetch(self, line):
+        result = (await self._request([line], raw=True))[0]
+        self.server._remember(line, result)
+        return result
+
+    async def _paged(self, command, params="", player_id=None,
+                     page_size=None, count_key="count"):
+        """Generates the (escaped) result of each page of a listing command
+        (see Server._paged)"""
+        size = page_size or Server._PAGE_SIZE
+        start = 0
+        while True:
+            result = await self._fetch(Server._page_at(command, start, size,
+                                                       params, player_id))
+            yield result
+            start += size
+            total = values(result, count_key)
+            if not (total and start < int(total[-1])):
+                return
+
+    async def refresh_status(self):
+        """Loads the players (see Server.refresh_status)"""
+        results = [result async for result in self._paged(
+            "serverstatus", page_size=Server._PLAYERS_PAGE_SIZE,
+            count_key="player count")]
+        self.server.players = Server._players_from(results)
+
+    async def records(self, command, record, params="", limit=None,
+                      player_id=None):
+        """The records of a listing, stopping after `limit` (if given)
+
+        :raises SqueezeboxScanning if the library is being rescanned
+        """
+        tokenizer = Tokenizer.for_record(record)
+        records = []
+        pages = self._paged(command, params, player_id=player_id)
+        try:
+            async for result in pages:
+                if not records and "rescan" in result:
+                    raise SqueezeboxScanning("%s is rescanning" % self)
+                records.extend(tokenizer.records(result))
+                if limit is not None and len(records) >= limit:
+                    return records[:limit]
+        finally:
+            await pages.aclose()
+        return records
+
+    async def _records(self, command, record, params="", limit=None):
+        """All the records of a listing, or "Scanning" """
+        try:
+            return await self.records(command, record, params, limit=limit,
+                                      player_id=self.server.cur_player_id)
+        except SqueezeboxScanning:
+            return "Scanning"
+
+    async def get_genres(self):
+        return await self.records("genres", Genre)
+
+    async def get_playlists(self):
+        return await self.records("playlists", Playlist)
+
+    async def get_artists_with_search_term(self, search_term, limit=None):
+        return await self._records("artists", Artist,
+                                   "search:%s" % search_term, limit=limit)
+
+    async def get_albums_with_search_term(self, search_term, limit=None):
+        return await self._records("albums", Album,
+                                   "search:%s tags:lay" % search_term,
+                                   limit=limit)
+
+    async def get_albums_with_artist_id(self, artist_id, limit=None):
+        return await self._records("albums", Album,
+                                   "artist_id:%s tags:ly" % artist_id,
+                                   limit=limit)
+
+    def close(self):
+        self.connection.close()
+
+    def __str__(self):
+        return "Squeezebox server at %s (async)" % self.connection
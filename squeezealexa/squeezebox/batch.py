@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+#
+#   Copyright 2017 Nick Boultbee
+#   This file is part of squeeze-alexa.
+#
+#   squeeze-alexa is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   See LICENSE for full license
+
+from squeezealexa.squeezebox.parsing import unescape
+
+
+class BatchPending(Exception):
+    """A batched command's result was wanted before the batch was sent"""
+
+
+class Future(object):
+    """The result of a command in a Batch, available once that's sent"""
+
+    __slots__ = ("_result", "_error", "_done", "_callbacks")
+
+    def __init__(self):
+        self._result = None
+        self._error = None
+        self._done = False
+        self._callbacks = []
+
+    @property
+    def done(self):
+        return self._done
+
+    def result(self):
+        """:raises BatchPending if the batch hasn't been sent yet"""
+        if not self._done:
+            raise BatchPending("Batch not sent yet")
+        if self._error is not None:
+            raise self._error
+        return self._result
+
+    def set_result(self, result):
+        self._result = result
+        self._finish()
+
+    def set_exception(self, error):
+        self._error = error
+        self._finish()
+
+    def _finish(self):
+        self._done = True
+        callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback(self)
+
+    def add_done_callback(self, callback):
+        if self._done:
+            callback(self)
+        else:
+            self._callbacks.append(callback)
+
+    def then(self, func):
+        """A Future of func applied to this one's result"""
+        future = Future()
+
+        def chain(done):
+            try:
+                future.set_result(func(done.result()))
+            except Exception as e:
+                future.set_exception(e)
+
+        self.add_done_callback(chain)
+        return future
+
+    @classmethod
+    def gather(cls, futures):
+        """A Future of the list of all the futures' results"""
+        gathered = cls()
+        futures = list(futures)
+        remaining = [len(futures)]
+
+        def one_done(done):
+            remaining[0] -= 1
+            if not remaining[0] and not gathered.done:
+                try:
+                    gathered.set_result([f.result() for f in futures])
+                except Exception as e:
+                    gathered.set_exception(e)
+
+        if not futures:
+            gathered.set_result([])
+        for future in futures:
+            future.add_done_callback(one_done)
+        return gathered
+
+    def __repr__(self):
+        if not self._done:
+            return "Future(pending)"
+        return "Future(%r)" % (self._error or self._result,)
+
+
+def then(result, func):
+    """Applies func to a result now, or to (a list of) Future(s) once done"""
+    if isinstance(result, Future):
+        return result.then(func)
+    if isinstance(result, list) and any(isinstance(r, Future)
+                                        for r in result):
+        return Future.gather(result).then(func)
+    return func(result)
+
+
+class Batch(object):
+    """Commands from any number of calls, sent in one pipelined write.
+    Each caller gets a Future per command line instead of its result."""
+
+    def __init__(self, request):
+        """
+        :param request: callable taking lines (and `raw`), returning their
+                        results in order
+        """
+        self._request = request
+        self._items = []
+        self.sent = False
+
+    def add(self, lines, raw=False):
+        """Adds lines to the batch
+
+        :rtype list[Future]
+        """
+        futures = [Future() for _ in lines]
+        self._items += [(line, raw, future)
+                        for line, future in zip(lines, futures)]
+        return futures
+
+    def send(self):
+        """Sends everything added, resolving all the futures"""
+        items = self.take()
+        if not items:
+            return
+        try:
+            results = self._request([line for line, _, _ in items], raw=True)
+            if len(results) != len(items):
+                raise ValueError("Got %d results for %d commands"
+                                 % (len(results), len(items)))
+        except Exception as e:
+            self.fail(e, items)
+            raise
+        self.resolve(items, results)
+
+    def take(self):
+        """Removes everything added so far, for sending some other way
+        (then `resolve` or `fail` them)
+
+        :rtype list[tuple]
+        """
+        self.sent = True
+        items, self._items = self._items, []
+        return items
+
+    def resolve(self, items, results):
+        """Resolves the futures of some items with their raw results"""
+        for (line, raw, future), result in zip(items, results):
+            future.set_result(result if raw else self.unquote(result))
+
+    def fail(self, error, items=None):
+        """Fails all the (remaining) futures with the error"""
+        items = self._items if items is None else items
+        self._items = []
+        for _, _, future in items:
+            if not future.done:
+                future.set_exception(error)
+
+    @staticmethod
+    def unquote(result):
+        return ' '.join(unescape(token) for token in result.split(' '))
+
+    def __len__(self):
+        return len(self._items)
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+#
+#   Copyright 2017 Nick Boultbee
+#   This file is part of squeeze-alexa.
+#
+#   squeeze-alexa is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   See LICENSE for full license
+
+import threading
+import time
+from collections import OrderedDict
+
+from squeezealexa.utils import PY2, print_d
+
+if PY2:
+    from urllib import unquote
+else:
+    from urllib.parse import unquote
+
+
+class ResponseCache(object):
+    """The (escaped) results of library queries, by normalized command.
+
+    Each command has its own TTL (commands without one aren't cached).
+    After that, a result is still served for `stale_for` seconds more,
+    but flagged so the caller can fetch a fresh one in the background.
+    The least recently used results are dropped once they add up to
+    more than `max_bytes`."""
+
+    def __init__(self, ttls, stale_for=3600, max_bytes=4 * 1024 * 1024,
+                 clock=time.time):
+        """
+        :param ttls: seconds to keep results for, by command name
+        """
+        self.ttls = dict(ttls)
+        self.stale_for = stale_for
+        self.max_bytes = max_bytes
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._revalidating = set()
+        self.size = 0
+        """Roughly how many bytes the cached results take"""
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key_for(line):
+        """The command, without any player ID and with its tagged
+        parameters in order, so equivalent commands share a result"""
+        words = [unquote(w) for w in line.split(' ') if w]
+        if len(words) > 1 and ':' in words[0]:
+            words = words[1:]
+        if not words:
+            return ''
+        positional = [w for w in words[1:] if ':' not in w]
+        tagged = sorted(w.lower() if w.startswith("search:") else w
+                        for w in words[1:] if ':' in w)
+        return ' '.join([words[0].lower()] + positional + tagged)
+
+    def ttl_for(self, line):
+        key = self.key_for(line)
+        return self.ttls.get(key.split(' ', 1)[0], 0)
+
+    def get(self, line):
+        """The cached result for a command line, if any, and whether it
+        should now be fetched again. That's only True once per stale result
+
+        :rtype tuple[str, bool]
+        """
+        key = self.key_for(line)
+        if key.split(' ', 1)[0] not in self.ttls:
+            return None, False
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None, False
+            result, expires = entry
+            if now >= expires + self.stale_for:
+                self._remove(key)
+                self.misses += 1
+                return None, False
+            # Now the most recently used
+            self._entries[key] = self._entries.pop(key)
+            self.hits += 1
+            if now < expires or key in self._revalidating:
+                return result, False
+            self._revalidating.add(key)
+            return result, True
+
+    def put(self, line, result):
+        """Caches the result of a command line, if the command has a TTL"""
+        ttl = self.ttl_for(line)
+        if ttl <= 0 or result is None:
+            return
+        key = self.key_for(line)
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (result, self._clock() + ttl)
+            self.size += len(key) + len(result)
+            while self.size > self.max_bytes and self._entries:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= len(key) + len(entry[0])
+        self._revalidating.discard(key)
+
+    def invalidate(self, reason="invalidated"):
+        """Forgets everything, e.g. once the library has changed"""
+        with self._lock:
+            if self._entries:
+                print_d("Dropping %d cached result(s): %s"
+                        % (len(self._entries), reason))
+            self._entries.clear()
+            self._revalidating.clear()
+            self.size = 0
+
+    def __contains__(self, line):
+        return self.key_for(line) in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __str__(self):
+        return ("cache of %d result(s), %d bytes (%d hits, %d misses)"
+                % (len(self), self.size, self.hits, self.misses))
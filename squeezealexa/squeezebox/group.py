@@ -0,0 +1,311 @@
+# -*- coding: utf-8 -*-
+#
+#   Copyright 2017 Nick Boultbee
+#   This file is part of squeeze-alexa.
+#
+#   squeeze-alexa is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   See LICENSE for full license
+
+import threading
+
+from squeezealexa.squeezebox.server import SqueezeboxException
+from squeezealexa.utils import print_w
+
+
+class ServerGroup(object):
+    """Several Squeezebox servers (e.g. one per building) used as one.
+
+    Their players are merged, and each player's commands go to the server
+    it's on. Queries about the libraries, and anything for all the players,
+    go to every server at once, so take as long as the slowest of them.
+    Searches that return library IDs (artists, albums) only go to the
+    current player's server, as IDs mean nothing to any other server,
+    and its players can only play from its own library anyway."""
+
+    def __init__(self, servers, cur_player_id=None):
+        """
+        :type servers list[Server]
+        """
+        if not servers:
+            raise ValueError("A ServerGroup needs at least one server")
+        self.servers = list(servers)
+        self._players = None
+        self._owners = None
+        self._cur_player_id = cur_player_id
+
+    @property
+    def deadline(self):
+        return self.servers[0].deadline
+
+    @deadline.setter
+    def deadline(self, deadline):
+        for server in self.servers:
+            server.deadline = deadline
+
+    def _each(self, func):
+        """Calls func(server) for every server, concurrently
+
+        :returns each server's result (or None if it failed), in order
+        :raises the first failure, if they all failed
+        """
+        results = [None] * len(self.servers)
+        errors = [None] * len(self.servers)
+
+        def call(i, server):
+            try:
+                results[i] = func(server)
+            except Exception as e:
+                errors[i] = e
+
+        if len(self.servers) == 1:
+            call(0, self.servers[0])
+        else:
+            threads = [threading.Thread(target=call, args=(i, server),
+                                        name="squeeze-group-%d" % i)
+                       for i, server in enumerate(self.servers)]
+            for thread in threads:
+                thread.daemon = True
+                thread.start()
+            for thread in threads:
+                thread.join()
+        failed = [(s, e) for s, e in zip(self.servers, errors) if e]
+        if len(failed) == len(self.servers):
+            raise failed[0][1]
+        for server, e in failed:
+            print_w("Leaving out %s: %r" % (server, e))
+        return results
+
+    @property
+    def players(self):
+        """All the servers' players, by ID (merged until the next refresh)
+
+        :rtype dict[str, Player]
+        """
+        if self._players is None:
+            self._merge_players()
+        return self._players
+
+    def _merge_players(self):
+        """Gathers every server's players, noting which server has each"""
+        players = {}
+        owners = {}
+        for server, owned in zip(self.servers,
+                                 self._each(lambda s: s.players)):
+            for pid, player in (owned or {}).items():
+                if pid not in players:
+                    players[pid] = player
+                    owners[pid] = server
+        self._players = players
+        self._owners = owners
+
+    def _forget_players(self):
+        self._players = None
+        self._owners = None
+
+    @property
+    def player_names(self):
+        return {p.name or "unknown" for p in self.players.values()}
+
+    def server_for(self, player_id=None):
+        """The server that a player (or the current one) is on
+
+        :rtype Server
+        """
+        default = not player_id
+        player_id = player_id or self.cur_player_id
+        if self._owners is None or player_id not in self._owners:
+            # Perhaps it's only just appeared
+            self._merge_players()
+        try:
+            server = self._owners[player_id]
+        except KeyError:
+            raise SqueezeboxException("No server has player %s" % player_id)
+        if default:
+            # So its commands without a player go to ours
+            server.cur_player_id = player_id
+        return server
+
+    def _route(self, player_id):
+        """The server for a player, and that player's ID"""
+        player_id = player_id or self.cur_player_id
+        return self.server_for(player_id), player_id
+
+    @property
+    def cur_player_id(self):
+        """The player to use by default: if not set, the first server's"""
+        if self._cur_player_id is None:
+            for server in self.servers:
+                if server.players:
+                    self._cur_player_id = server.cur_player_id
+                    break
+        return self._cur_player_id
+
+    @cur_player_id.setter
+    def cur_player_id(self, player_id):
+        self._cur_player_id = player_id
+
+    def refresh_status(self):
+        self._each(lambda server: server.refresh_status())
+        self._forget_players()
+
+    def refresh(self, lazy=False):
+        self._each(lambda server: server.refresh(lazy=lazy))
+        self._forget_players()
+
+    def is_stale(self):
+        return any(server.is_stale() for server in self.servers)
+
+    def flush(self):
+        for server in self.servers:
+            server.flush()
+
+    def player_request(self, line, player_id=None, raw=False, wait=True):
+        server, pid = self._route(player_id)
+        return server.player_request(line, player_id=pid, raw=raw,
+                                     wait=wait)
+
+    def play(self, player_id=None):
+        server, pid = self._route(player_id)
+        server.play(player_id=pid)
+
+    def play_random_mix(self, genre_list, player_id=None):
+        server, pid = self._route(player_id)
+        return server.play_random_mix(genre_list, player_id=pid)
+
+    def play_genres(self, genre_list, player_id=None):
+        server, pid = self._route(player_id)
+        return server.play_genres(genre_list, player_id=pid)
+
+    def is_stopped(self, player_id=None):
+        server, pid = self._route(player_id)
+        return server.is_stopped(player_id=pid)
+
+    def get_now_playing(self, player_id=None):
+        server, pid = self._route(player_id)
+        return server.get_now_playing(player_id=pid)
+
+    def next(self, player_id=None):
+        server, pid = self._route(player_id)
+        server.next(player_id=pid)
+
+    def previous(self, player_id=None):
+        server, pid = self._route(player_id)
+        server.previous(player_id=pid)
+
+    def playlist_play(self, path, player_id=None):
+        server, pid = self._route(player_id)
+        server.playlist_play(path, player_id=pid)
+
+    def playlist_clear(self):
+        self.server_for().playlist_clear()
+
+    def playlist_resume(self, name, resume, wipe=False):
+        self.server_for().playlist_resume(name, resume, wipe=wipe)
+
+    def change_song(self, path):
+        self.server_for().change_song(path)
+
+    def change_volume(self, delta, player_id=None):
+        server, pid = self._route(player_id)
+        server.change_volume(delta, player_id=pid)
+
+    def get_milliseconds(self):
+        return self.server_for().get_milliseconds()
+
+    def pause(self, player_id=None):
+        server, pid = self._route(player_id)
+        server.pause(player_id=pid)
+
+    def resume(self, player_id=None, fade_in_secs=1):
+        server, pid = self._route(player_id)
+        server.resume(player_id=pid, fade_in_secs=fade_in_secs)
+
+    def stop(self, player_id=None):
+        server, pid = self._route(player_id)
+        server.stop(player_id=pid)
+
+    def set_shuffle(self, on=True, player_id=None):
+        server, pid = self._route(player_id)
+        server.set_shuffle(on, player_id=pid)
+
+    def set_repeat(self, on=True, player_id=None):
+        server, pid = self._route(player_id)
+        server.set_repeat(on, player_id=pid)
+
+    def set_power(self, on=True, player_id=None):
+        server, pid = self._route(player_id)
+        server.set_power(on, player_id=pid)
+
+    def set_all_power(self, on=True):
+        self._each(lambda server: server.set_all_power(on))
+
+    def play_album_with_id(self, album_id, player_id=None):
+        server, pid = self._route(player_id)
+        return server.play_album_with_id(album_id, player_id=pid)
+
+    @staticmethod
+    def _merged(listings):
+        """The records of each server's listing, less any with the name of
+        one already seen"""
+        seen = set()
+        merged = []
+        for records in listings:
+            for record in records or []:
+                if record.name not in seen:
+                    seen.add(record.name)
+                    merged.append(record)
+        return merged
+
+    def get_genres(self):
+        """:rtype list[Genre]"""
+        return self._merged(self._each(lambda server: server.get_genres()))
+
+    def get_playlists(self):
+        """:rtype list[Playlist]"""
+        return self._merged(self._each(lambda s: s.get_playlists()))
+
+    @property
+    def genres(self):
+        return [g.name for g in self.get_genres()]
+
+    @property
+    def playlists(self):
+        return [p.name for p in self.get_playlists()]
+
+    def get_info_total(self, name):
+        totals = self._each(lambda server: server.get_info_total(name))
+        return sum(int(total or 0) for total in totals)
+
+    def is_scanning(self):
+        scanning = self._each(lambda server: server.is_scanning())
+        return "Scanning" if "Scanning" in scanning else None
+
+    def rescan(self):
+        results = self._each(lambda server: server.rescan())
+        if "Scanning" in results:
+            return "Scanning"
+        return results[0]
+
+    @property
+    def index(self):
+        """The current player's server's library, in memory"""
+        return self.server_for().index
+
+    def get_artists_with_search_term(self, search_term, limit=None):
+        return self.server_for().get_artists_with_search_term(
+            search_term, limit=limit)
+
+    def get_albums_with_search_term(self, search_term, limit=None):
+        return self.server_for().get_albums_with_search_term(
+            search_term, limit=limit)
+
+    def get_albums_with_artist_id(self, artist_id, limit=None):
+        return self.server_for().get_albums_with_artist_id(artist_id,
+                                                           limit=limit)
+
+    def __str__(self):
+        return "group of %s" % ", ".join(str(s) for s in self.servers)
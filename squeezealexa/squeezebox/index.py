@@ -0,0 +1,308 @@
+# -*- coding: utf-8 -*-
+#
+#   Copyright 2017 Nick Boultbee
+#   This file is part of squeeze-alexa.
+#
+#   squeeze-alexa is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   See LICENSE for full license
+
+"""A server's library (artists, albums, genres and playlists) in memory,
+so intents can be matched against it without asking LMS each time."""
+
+import time
+
+from squeezealexa.matching import PhoneticIndex, TrigramIndex
+from squeezealexa.squeezebox.parsing import Tokenizer
+from squeezealexa.squeezebox.records import Album, Artist, Genre, Playlist
+from squeezealexa.utils import fold, print_d, print_w, simplified
+
+
+def _by_year(album):
+    """For ordering albums by year (unknown first), then name"""
+    return album.year or 0, album.name or "", album.id
+
+
+class LibraryIndex(object):
+    """Everything in a server's library that intents look for, each listing
+    bulk-loaded (with big pages) when first wanted. Every `check_secs`,
+    it asks the server (in one round trip) for its last scan time and
+    totals, and reloads only the listings those say have changed.
+    Playlists, which aren't counted, are reloaded at every check."""
+
+    _LISTINGS = {"artists": ("artists", Artist, ""),
+                 "albums": ("albums", Album, "tags:lyaSS"),
+                 "genres": ("genres", Genre, ""),
+                 "playlists": ("playlists", Playlist, "")}
+    """The command, record type and parameters of each listing"""
+    _PAGE_SIZE = 2000
+    """Items per page when loading, far more than for searches"""
+
+    def __init__(self, server, check_secs=60, clock=time.time):
+        """
+        :type server Server
+        """
+        self.server = server
+        self.check_secs = check_secs
+        self._clock = clock
+        self.artists = {}
+        """The Artists, by ID"""
+        self.albums = {}
+        """The Albums, by ID"""
+        self.genres = []
+        self.playlists = []
+        self._albums_by_artist = {}
+        self._in_year_order = set()
+        """The artists whose albums have been put in order (when first
+        wanted, rather than all of them at every (re)load)"""
+        self._forms = {}
+        """Each artist's and album's name, folded and simplified"""
+        self._trigrams = {}
+        self._sounds = {}
+        self.loaded = set()
+        """The listings loaded so far"""
+        self.version = None
+        """What `Server.get_library_version` said when last checked"""
+        self.checked = None
+        self.dirty = False
+        """Whether anything's been loaded from the server since the last
+        snapshot was used (or saved)"""
+        self._snapshot = None
+        self._from_snapshot = set()
+        """The listings still good to take from the snapshot"""
+
+    def _listing(self, name):
+        command, record, params = self._LISTINGS[name]
+        # Kept here, so there's no need for a copy in the server's cache
+        return list(self.server.iter_records(
+            command, Tokenizer.for_record(record), params,
+            page_size=self._PAGE_SIZE, cached=False))
+
+    def use_snapshot(self, snapshot):
+        """Takes listings from a Snapshot (when they're wanted) instead of
+        the server, until the next check says they've changed
+        (due at once for a snapshot saved longer ago than that)"""
+        self._snapshot = snapshot
+        self._from_snapshot = set(self._LISTINGS) & set(snapshot.sections)
+        self.version = snapshot.version
+        self.checked = snapshot.saved
+
+    def listing(self, name):
+        """The records of a loaded listing"""
+        if name in ("artists", "albums"):
+            return list(getattr(self, name).values())
+        return getattr(self, name)
+
+    def load(self, names):
+        """(Re)loads some listings, all at once
+
+        :raises SqueezeboxScanning if the library's being rescanned
+        """
+        if not names:
+            return
+        if self.version is None:
+            self.version = self.server.get_library_version()
+            self.checked = self._clock()
+        start = time.time()
+        listings = {}
+        for name in names:
+            if name in self._from_snapshot and name not in self.loaded:
+                listings[name] = self._snapshot.section(name)
+                if not self._forms and "names" in self._snapshot:
+                    self._forms = self._snapshot.section("names")
+            else:
+                listings[name] = self._listing(name)
+                self.dirty = True
+        if "artists" in listings:
+            self.artists = {a.id: a for a in listings["artists"]}
+        if "albums" in listings:
+            self.albums = {a.id: a for a in listings["albums"]}
+        if "genres" in listings:
+            self.genres = listings["genres"]
+        if "playlists" in listings:
+            self.playlists = listings["playlists"]
+        if "artists" in listings or "albums" in listings:
+            self._build()
+        self.loaded.update(names)
+        print_d("Loaded %s in %.2fs"
+                % (", ".join(sorted(names)), time.time() - start))
+
+    def _build(self):
+        by_artist = {}
+        for album in self.albums.values():
+            for artist_id in album.contributors:
+                by_artist.setdefault(artist_id, []).append(album)
+        self._albums_by_artist = by_artist
+        self._in_year_order = set()
+        forms = {}
+        known = self._forms
+        for records in (self.artists, self.albums):
+            for record in records.values():
+                name = record.name or ""
+                if name not in forms:
+                    forms[name] = known.get(name) or (fold(name),
+                                                      simplified(name))
+        self._forms = forms
+        self._trigrams = {}
+        self._sounds = {}
+
+    def folded(self, name):
+        """A name, folded (see `fold`), as when it was loaded"""
+        forms = self._forms.get(name or "")
+        return forms[0] if forms else fold(name or "")
+
+    def simplified(self, name):
+        """A name, simplified (see `simplified`), as when it was loaded"""
+        forms = self._forms.get(name or "")
+        return forms[1] if forms else simplified(name or "")
+
+    def changed(self):
+        """The server's library version now, and which of the loaded
+        listings have changed since the last one
+
+        :rtype tuple[tuple, list[str]]
+        """
+        version = self.server.get_library_version()
+        self.checked = self._clock()
+        old = self.version
+        if old is None or version[0] != old[0]:
+            changed = {"albums", "artists", "genres"}
+        else:
+            changed = {name for name, new, was in
+                       zip(("albums", "artists", "genres"),
+                           version[1:], old[1:]) if new != was}
+        if changed:
+            print_d("Library has changed (%s, was %s)" % (version, old))
+            self.server.cache.invalidate("library changed")
+            self._from_snapshot -= changed
+        return version, sorted(self.loaded & (changed | {"playlists"}))
+
+    def refresh(self, *names):
+        """Loads any of the listings that aren't yet, and reloads any
+        loaded listings that have changed, if it's time to check"""
+        wanted = set(names) - self.loaded
+        since = None if self.checked is None else self._clock() - self.checked
+        if since is not None and since >= self.check_secs:
+            version, stale = self.changed()
+            self.load(wanted | set(stale))
+            # Only now, so a failed reload is tried again at the next check
+            self.version = version
+        elif wanted:
+            self.load(wanted)
+
+    def _current(self, *names):
+        """Refreshes the listings, if possible. During a rescan, it's not,
+        but what's already loaded is still good enough to use
+
+        :raises SqueezeboxScanning if there's nothing loaded yet
+        """
+        try:
+            self.refresh(*names)
+        except Exception as e:
+            if not set(names) <= self.loaded:
+                raise
+            print_w("Using library as of %s (%s)" % (self.version, e))
+
+    def _matching(self, records, term):
+        """The records whose names contain every word of the term,
+        ignoring case and accents, as LMS's `search:` does"""
+        words = fold(term).split()
+        return [r for r in records
+                if all(w in self.folded(r.name) for w in words)]
+
+    def _indexed(self, name, cls, indexes):
+        """The listing's records, and their index of the given class,
+        building it if this is the first time it's wanted"""
+        self._current(name)
+        records = getattr(self, name)
+        if name not in indexes:
+            indexes[name] = cls((r.id, self.folded(r.name))
+                                for r in records.values())
+        return records, indexes[name]
+
+    def _like(self, name, term, limit, min_overlap):
+        """The records most like the term (see `TrigramIndex.shortlist`),
+        along with those sounding like it (see `PhoneticIndex`), though
+        no more of those than half the limit, the most like it first"""
+        records, trigrams = self._indexed(name, TrigramIndex, self._trigrams)
+        sounds = self._indexed(name, PhoneticIndex, self._sounds)[1]
+        folded = fold(term)
+        keys = trigrams.ranked(folded, sounds.lookup(folded))[:limit // 2]
+        sounding = set(keys)
+        keys += [key for key in trigrams.shortlist(folded, limit, min_overlap)
+                 if key not in sounding]
+        return [records[key] for key in keys[:limit]]
+
+    def _sounding_like(self, name, term):
+        records, sounds = self._indexed(name, PhoneticIndex, self._sounds)
+        return [records[key] for key in sounds.lookup(fold(term))]
+
+    def artists_like(self, term, limit=50, min_overlap=0.5):
+        """The artists most like the term, best first, to score further
+
+        :rtype list[Artist]
+        """
+        return self._like("artists", term, limit, min_overlap)
+
+    def albums_like(self, term, limit=50, min_overlap=0.5):
+        """:rtype list[Album]"""
+        return self._like("albums", term, limit, min_overlap)
+
+    def artists_sounding_like(self, term):
+        """The artists that sound like the term, however it's spelt
+        (e.g. "shoppin" for "Chopin")
+
+        :rtype list[Artist]
+        """
+        return self._sounding_like("artists", term)
+
+    def albums_sounding_like(self, term):
+        """:rtype list[Album]"""
+        return self._sounding_like("albums", term)
+
+    def artists_matching(self, term):
+        """:rtype list[Artist]"""
+        self._current("artists")
+        return self._matching(self.artists.values(), term)
+
+    def albums_matching(self, term):
+        """:rtype list[Album]"""
+        self._current("albums")
+        return self._matching(self.albums.values(), term)
+
+    def albums_by(self, *artist_ids):
+        """All the albums any of the artists contributed to, oldest first
+
+        :rtype list[Album]
+        """
+        self._current("albums")
+        lists = [self._albums_of(artist_id) for artist_id in artist_ids]
+        if len(lists) == 1:
+            return list(lists[0])
+        albums = {album.id: album for albums in lists for album in albums}
+        return sorted(albums.values(), key=_by_year)
+
+    def _albums_of(self, artist_id):
+        albums = self._albums_by_artist.get(artist_id, [])
+        if artist_id not in self._in_year_order:
+            albums.sort(key=_by_year)
+            self._in_year_order.add(artist_id)
+        return albums
+
+    @property
+    def genre_names(self):
+        self._current("genres")
+        return [g.name for g in self.genres]
+
+    @property
+    def playlist_names(self):
+        self._current("playlists")
+        return [p.name for p in self.playlists]
+
+    def __str__(self):
+        return ("index of %d artists, %d albums, %d genres, %d playlists"
+                % (len(self.artists), len(self.albums), len(self.genres),
+                   len(self.playlists)))
@@ -0,0 +1,292 @@
+# -*- coding: utf-8 -*-
+#
+#   Copyright 2017 Nick Boultbee
+#   This file is part of squeeze-alexa.
+#
+#   squeeze-alexa is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   See LICENSE for full license
+
+"""Player state kept up to date from LMS's own notifications
+(see `subscribe` in the CLI docs), so it can be answered from memory."""
+
+import threading
+import time
+
+from squeezealexa.squeezebox.parsing import Tokenizer, iter_pairs, \
+    unescape, values
+from squeezealexa.squeezebox.records import Player
+from squeezealexa.squeezebox.server import Server
+from squeezealexa.utils import print_d, print_w
+
+
+class PlayerStatus(object):
+    """What a player's doing, as last heard"""
+
+    __slots__ = ("connected", "power", "mode", "volume",
+                 "title", "artist", "album", "updated")
+
+    def __init__(self):
+        self.connected = True
+        self.power = None
+        self.mode = None
+        self.volume = None
+        self.title = None
+        self.artist = None
+        self.album = None
+        self.updated = None
+
+    @property
+    def known(self):
+        """Whether it's been fully loaded, not just notified about"""
+        return self.mode is not None and self.volume is not None
+
+    def __repr__(self):
+        return "PlayerStatus(%s)" % ", ".join(
+            "%s=%r" % (k, getattr(self, k)) for k in self.__slots__)
+
+
+class LiveState(object):
+    """The players, and what they're doing, as told by a stream of
+    CLI lines: responses to our queries, and notifications of changes."""
+
+    _STATUS_QUERY = "status - 1 tags:al"
+    _STATUS_KEYS = frozenset(["player_connected", "power", "mode",
+                              "mixer volume", "title", "artist", "album"])
+
+    def __init__(self, clock=time.time):
+        self._clock = clock
+        self._changed = threading.Condition()
+        self.players = {}
+        """The Players, by ID"""
+        self._paging = {}
+        """The Players from the serverstatus pages so far, by ID"""
+        self.statuses = {}
+        """The PlayerStatus of each player, by ID"""
+        self.connected = False
+        """Whether notifications are being received at the moment"""
+        self.rescans = 0
+        """How many library rescans have finished since we started"""
+
+    @property
+    def live(self):
+        """Whether it's up to date: connected, and everything loaded"""
+        if not (self.connected and self.players):
+            return False
+        return all(self.status(pid).known for pid in self.players)
+
+    def status(self, player_id):
+        """:rtype PlayerStatus"""
+        with self._changed:
+            status = self.statuses.get(player_id)
+            if status is None:
+                status = self.statuses[player_id] = PlayerStatus()
+            return status
+
+    def sync_commands(self):
+        """The commands to (re)load everything"""
+        return [self._players_page(0)]
+
+    @staticmethod
+    def _players_page(start):
+        return "serverstatus %d %d" % (start, Server._PLAYERS_PAGE_SIZE)
+
+    def handle(self, line):
+        """Updates the state from a line received
+
+        :returns any commands to send to find out more
+        :rtype list[str]
+        """
+        with self._changed:
+            follow_up = self._handle(line)
+            self._changed.notify_all()
+        return follow_up
+
+    def _handle(self, line):
+        words = line.split(' ')
+        if words[0] == "serverstatus":
+            return self._players_from(line)
+        if words[0] == "rescan":
+            if words[1:] == ["done"]:
+                self.rescans += 1
+            return []
+        if len(words) < 2:
+            return []
+        player_id = unescape(words[0])
+        if ':' not in player_id:
+            return []
+        status = self.status(player_id)
+        status.updated = self._clock()
+        command, args = words[1], [unescape(w) for w in words[2:]]
+        if command == "playlist" and args:
+            command, args = "playlist " + args[0], args[1:]
+        query = "%s %s" % (player_id, self._STATUS_QUERY)
+        arg = args[0] if args else None
+
+        if command == "status":
+            self._update(status, line)
+        elif command == "power" and arg in ("0", "1"):
+            status.power = arg == "1"
+        elif command == "mixer" and arg == "volume" and len(args) > 1:
+            value = args[1]
+            if value[0] in "+-?":
+                return ["%s mixer volume ?" % player_id]
+            status.volume = int(float(value))
+        elif command == "mode" and arg not in (None, "?"):
+            status.mode = arg
+        elif command in ("play", "playlist play"):
+            status.mode = "play"
+        elif command in ("stop", "playlist stop"):
+            status.mode = "stop"
+        elif command in ("pause", "playlist pause"):
+            if arg in ("0", "1"):
+                status.mode = "pause" if arg == "1" else "play"
+            else:
+                return ["%s mode ?" % player_id]
+        elif command == "playlist newsong":
+            status.title = arg
+            status.mode = "play"
+            return [query]
+        elif command == "playlist clear":
+            status.title = status.artist = status.album = None
+            status.mode = "stop"
+        elif command == "client":
+            status.connected = arg not in ("disconnect", "forget")
+            return self.sync_commands()
+        return []
+
+    def _players_from(self, line):
+        """Updates the players from a page of serverstatus,
+        asking for the next page (if any) once it's been read"""
+        words = line.split(' ', 2)
+        start = int(words[1]) if words[1:2] and words[1].isdigit() else 0
+        players = self._paging if start else {}
+        commands = []
+        for player in Tokenizer.for_record(Player).records(line):
+            players[player.id] = player
+            status = self.status(player.id)
+            status.connected = bool(player.connected)
+            status.power = player.power
+            if not status.known:
+                commands.append("%s %s" % (player.id, self._STATUS_QUERY))
+        end = start + Server._PLAYERS_PAGE_SIZE
+        total = values(line, "player count")
+        if total and end < int(total[-1]):
+            self._paging = players
+            return [self._players_page(end)] + commands
+        self._paging = {}
+        self.players = players
+        for pid in list(self.statuses):
+            if pid not in players:
+                del self.statuses[pid]
+        return commands
+
+    def _update(self, status, line):
+        status.title = status.artist = status.album = None
+        for key, value in iter_pairs(line, keys=self._STATUS_KEYS):
+            if key == "player_connected":
+                status.connected = value == "1"
+            elif key == "power":
+                status.power = value == "1"
+            elif key == "mixer volume":
+                status.volume = int(float(value))
+            else:
+                setattr(status, key, value)
+
+    def wait(self, predicate, timeout=None):
+        """Waits until predicate(self) is true, returning whether it is"""
+        deadline = None if timeout is None else time.time() + timeout
+        with self._changed:
+            while not predicate(self):
+                remaining = None if deadline is None \
+                    else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._changed.wait(remaining)
+            return True
+
+    def set_connected(self, connected):
+        with self._changed:
+            self.connected = connected
+            self._changed.notify_all()
+
+    def __str__(self):
+        return "%s state of %d player(s)" % (
+            "live" if self.live else "stale", len(self.players))
+
+
+class Listener(object):
+    """Keeps a LiveState up to date, from a connection of its own that's
+    subscribed to LMS's notifications, read by a background thread.
+    It reconnects (after a pause) whenever that connection's lost."""
+
+    SUBSCRIPTIONS = ("client", "mixer", "mode", "pause", "play",
+                     "playlist", "power", "rescan", "stop")
+    """The notifications needed to keep the state current"""
+
+    def __init__(self, connect, state=None, user=None, password=None,
+                 retry_secs=5.0):
+        """
+        :param connect: callable returning a new, connected transport
+        """
+        self._connect = connect
+        self.state = state or LiveState()
+        self.user = user
+        self.password = password
+        self.retry_secs = retry_secs
+        self._transport = None
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run,
+                                        name="squeeze-listener")
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._running = False
+        transport = self._transport
+        if transport:
+            transport.close()
+
+    def _run(self):
+        while self._running:
+            try:
+                self._listen()
+            except Exception as e:
+                print_w("Stopped listening to LMS (%s)" % e)
+            self.state.set_connected(False)
+            if self._running:
+                time.sleep(self.retry_secs)
+
+    def _listen(self):
+        transport = self._transport = self._connect()
+        lines = []
+        if self.user and self.password:
+            lines.append("login %s %s" % (self.user, self.password))
+        lines.append("subscribe %s" % ",".join(self.SUBSCRIPTIONS))
+        lines += self.state.sync_commands()
+        if not self._send(transport, lines):
+            return
+        self.state.set_connected(True)
+        print_d("Listening for changes on %s" % transport)
+        while self._running:
+            line = transport.readline()
+            if line is None:
+                return
+            follow_up = self.state.handle(line)
+            if follow_up and not self._send(transport, follow_up):
+                return
+
+    @staticmethod
+    def _send(transport, lines):
+        return transport.send("\n".join(lines) + "\n")
+
+    def __str__(self):
+        return "Listener for %s" % self.state
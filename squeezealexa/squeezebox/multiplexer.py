@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+#
+#   Copyright 2017 Nick Boultbee
+#   This file is part of squeeze-alexa.
+#
+#   squeeze-alexa is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   See LICENSE for full license
+
+from collections import deque
+
+from squeezealexa.utils import PY2, print_d, print_w, Deadline
+
+if PY2:
+    from urllib import unquote
+else:
+    from urllib.parse import unquote
+
+
+class Pending(object):
+    """A request sent to the server, and (eventually) its response"""
+
+    __slots__ = ("line", "key", "response", "wait", "on_response")
+
+    def __init__(self, line, wait=True, on_response=None):
+        self.line = line
+        self.key = self.key_for(line)
+        self.response = None
+        self.wait = wait
+        self.on_response = on_response
+        """Called with this, once answered (e.g. if not waited for)"""
+
+    @staticmethod
+    def key_for(line):
+        """The words LMS will echo back at the start of the response"""
+        words = [unquote(w) for w in line.split(' ')]
+        if words[0] == 'login':
+            # The password is masked in the response
+            return tuple(words[:2])
+        if words[-1] == '?':
+            words.pop()
+        return tuple(words)
+
+    def matches(self, words):
+        key = self.key
+        if len(words) < len(key):
+            return False
+        for i, word in enumerate(key):
+            if unquote(words[i]) != word:
+                return False
+        return True
+
+    @property
+    def done(self):
+        return self.response is not None
+
+    def __repr__(self):
+        return "Pending(%r)" % self.line
+
+
+class Multiplexer(object):
+    """Matches each response line to the request it answers, by the command
+    that LMS echoes back, so that any number of requests can be in flight
+    on one connection. Lines not answering any request (e.g. from `listen`)
+    are passed on as notifications instead."""
+
+    _MAX_UNACKNOWLEDGED = 100
+    """Give up tracking replies we're not waiting for after this many"""
+
+    def __init__(self, transport, on_notification=None):
+        self.transport = transport
+        self.on_notification = on_notification
+        self._pending = deque()
+
+    @classmethod
+    def of(cls, transport, on_notification=None):
+        """The transport's multiplexer, shared by everything using it,
+        so replies to requests from its last user can still be matched"""
+        mux = getattr(transport, "multiplexer", None)
+        if mux is None:
+            mux = cls(transport)
+            transport.multiplexer = mux
+        mux.on_notification = on_notification
+        return mux
+
+    @property
+    def in_flight(self):
+        return len(self._pending)
+
+    def send(self, lines, wait=True, timeout=None, on_response=None):
+        """Sends the lines in one write. If not waiting for them,
+        their responses are dropped (or passed to `on_response`)
+        whenever they're read, along with others'.
+
+        :returns the list of Pending requests, or None if sending failed
+        """
+        pending = [Pending(line, wait=wait, on_response=on_response)
+                   for line in lines]
+        if not self.transport.send("\n".join(lines) + "\n", timeout=timeout):
+            return None
+        self._pending.extend(pending)
+        self._forget_unacknowledged()
+        return pending
+
+    def collect(self, pending, timeout=None):
+        """Reads responses until all of the given requests are answered
+
+        :returns their response lines, or None if the connection failed
+        """
+        deadline = Deadline(timeout)
+        while not all(p.done for p in pending):
+            line = self.transport.readline(timeout=deadline.remaining())
+            if line is None:
+                self._pending.clear()
+                return None
+            self.dispatch(line)
+        return [p.response for p in pending]
+
+    def request(self, lines, timeout=None):
+        pending = self.send(lines, timeout=timeout)
+        return pending and self.collect(pending, timeout=timeout)
+
+    def dispatch(self, line):
+        """Delivers a received line to its request, or as a notification"""
+        words = line.split(' ')
+        for i, pending in enumerate(self._pending):
+            if pending.matches(words):
+                del self._pending[i]
+                pending.response = line
+                if pending.on_response:
+                    pending.on_response(pending)
+                return pending
+        if self.on_notification:
+            self.on_notification(line)
+        else:
+            print_d("Ignoring unsolicited \"%s\"" % line[:100])
+        return None
+
+    def _forget_unacknowledged(self):
+        unwanted = [p for p in self._pending if not p.wait]
+        excess = len(unwanted) - self._MAX_UNACKNOWLEDGED
+        for pending in unwanted[:max(excess, 0)]:
+            print_w("Never got a response to %r" % pending)
+            self._pending.remove(pending)
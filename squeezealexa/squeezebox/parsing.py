@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+#
+#   Copyright 2017 Nick Boultbee
+#   This file is part of squeeze-alexa.
+#
+#   squeeze-alexa is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   See LICENSE for full license
+
+"""Parsing of CLI responses as they come off the wire, i.e. still escaped.
+
+LMS escapes every token (so a response is plain ASCII, and a space always
+separates tokens), which means a response can be split up in one pass,
+and only the parts actually wanted need unescaping.
+"""
+
+from collections import namedtuple
+
+from squeezealexa.utils import PY2
+
+if PY2:
+    from urllib import quote, unquote as _unquote
+
+    def unquote(text):
+        # py2's unquote makes unicode of each byte, so do it on UTF-8
+        if isinstance(text, unicode):
+            return _unquote(text.encode('utf-8')).decode('utf-8', 'replace')
+        return _unquote(text)
+else:
+    from urllib.parse import quote, unquote
+
+
+def unescape(token):
+    """Unescapes a token, if it needs it"""
+    return unquote(token) if '%' in token else token
+
+
+def result_of(line, response):
+    """The result part of a response line, i.e. without the echoed command.
+    LMS echoes each token of the command, escaped, so it's the same number
+    of tokens (less the `?` of a query, which is replaced by the result).
+
+    :type line str
+    :type response str
+    :rtype str
+    """
+    if line.startswith('login '):
+        echoed = 1
+    else:
+        echoed = line.count(' ') + (0 if line.endswith('?') else 1)
+    parts = response.split(' ', echoed)
+    return parts[echoed] if len(parts) > echoed else ''
+
+
+def iter_pairs(response, keys=None):
+    """Generates (key, value) for each `key:value` tag of an escaped
+    response, in one pass. Tokens without a separator are skipped.
+
+    :param keys: if given, only these keys are yielded (and unescaped)
+    """
+    for token in response.split(' '):
+        # LMS escapes the separator, but we still allow an unescaped one
+        i = token.find('%3A')
+        size = 3
+        if i < 0 or ':' in token[:i]:
+            i = token.find(':')
+            size = 1
+            if i < 0:
+                continue
+        key = token[:i]
+        if '%' in key:
+            key = unquote(key)
+        if keys is not None and key not in keys:
+            continue
+        value = token[i + size:]
+        yield key, unquote(value) if '%' in value else value
+
+
+def pairs(response, keys=None):
+    """All the (key, value) tags of an escaped response
+
+    :rtype list[tuple[str, str]]
+    """
+    return list(iter_pairs(response, keys))
+
+
+def values(response, key):
+    """The value of each `key` tag of an escaped response"""
+    return [v for _, v in iter_pairs(response, keys=(key,))]
+
+
+class Tokenizer(object):
+    """Splits an escaped listing result into a typed record per item,
+    in one pass. Items start with the `start` tag; other tags are only
+    kept (and then unescaped and converted) if they're wanted.
+    These are best built once per tag set, with for_tags (or for_record)."""
+
+    _tokenizers = {}
+
+    def __init__(self, name, tags, start="id", types=None, record=None):
+        """
+        :param name: the name of the record type
+        :param tags: the tags to keep, which become the record's fields
+        :param types: callables converting some tags' values, by tag
+        :param record: the record type, if not just a namedtuple of the tags
+        """
+        if start not in tags:
+            raise ValueError("Records must include their %r tag" % start)
+        self.tags = tuple(tags)
+        self.start = start
+        self.record = record or namedtuple(name, self.tags)
+        self._slots = {}
+        for i, tag in enumerate(self.tags):
+            self._slots[tag] = i
+            self._slots[quote(tag, safe='')] = i
+        types = types or {}
+        self._types = [types.get(tag) for tag in self.tags]
+        self._keys = frozenset(self.tags + ("count",))
+
+    @classmethod
+    def for_tags(cls, name, tags, start="id", types=None):
+        """A shared Tokenizer for the tag set"""
+        key = (name, tuple(tags), start)
+        tokenizer = cls._tokenizers.get(key)
+        if tokenizer is None:
+            tokenizer = cls._tokenizers[key] = cls(name, tags, start, types)
+        return tokenizer
+
+    @classmethod
+    def for_record(cls, record):
+        """A shared Tokenizer for a record type with `TAGS` (and `TYPES`),
+        the first tag starting each item"""
+        tokenizer = cls._tokenizers.get(record)
+        if tokenizer is None:
+            tokenizer = cls(record.__name__, record.TAGS,
+                            start=record.TAGS[0],
+                            types=getattr(record, "TYPES", None),
+                            record=record)
+            cls._tokenizers[record] = tokenizer
+        return tokenizer
+
+    def records(self, response):
+        """Generates a record for each item of the (escaped) response"""
+        slots = self._slots
+        start = self.start
+        fields = None
+        for token in response.split(' '):
+            key, sep, value = token.partition('%3A')
+            if not sep or ':' in key:
+                key, sep, value = token.partition(':')
+                if not sep:
+                    continue
+            i = slots.get(key)
+            if i is None:
+                continue
+            if key == start:
+                if fields is not None:
+                    yield self._make(fields)
+                fields = [None] * len(self.tags)
+            elif fields is None:
+                continue
+            fields[i] = value
+        if fields is not None:
+            yield self._make(fields)
+
+    def record_of(self, response):
+        """A single record from all of an (escaped) response, e.g. of
+        `status`. Missing tags are None, and later ones win"""
+        slots = self._slots
+        fields = [None] * len(self.tags)
+        for key, value in iter_pairs(response, keys=slots):
+            fields[slots[key]] = value
+        for i, convert in enumerate(self._types):
+            if convert and fields[i] is not None:
+                fields[i] = convert(fields[i])
+        return self.record(*fields)
+
+    def _make(self, fields):
+        for i, convert in enumerate(self._types):
+            value = fields[i]
+            if value is None:
+                continue
+            if '%' in value:
+                value = unquote(value)
+            fields[i] = convert(value) if convert else value
+        return self.record(*fields)
+
+    def pairs(self, response):
+        """Generates (key, value) for the wanted tags (and count)"""
+        return iter_pairs(response, keys=self._keys)
+
+    def __repr__(self):
+        return "Tokenizer(%s: %s)" % (self.record.__name__,
+                                      ", ".join(self.tags))
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+#
+#   Copyright 2017 Nick Boultbee
+#   This file is part of squeeze-alexa.
+#
+#   squeeze-alexa is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   See LICENSE for full license
+
+"""Typed records for what LMS lists: players and the library's artists,
+albums, genres and playlists. Each is parsed once (see `Tokenizer`),
+with numeric fields converted, and is a slotted tuple so it stays small.
+
+`TAGS` are the CLI tags for the record's fields (in order),
+and `TYPES` convert some of them, by tag.
+"""
+
+from collections import namedtuple
+
+
+def number(value):
+    """An int from a numeric tag, or 0 if LMS left it blank"""
+    try:
+        return int(value)
+    except ValueError:
+        return 0
+
+
+def numbers(value):
+    """The ints of a comma-separated tag, e.g. `artist_ids`"""
+    return tuple(number(v) for v in value.split(",") if v)
+
+
+def flag(value):
+    return value == "1"
+
+
+def seconds(value):
+    """A float from a time tag, or 0.0 if LMS left it blank"""
+    try:
+        return float(value)
+    except ValueError:
+        return 0.0
+
+
+class Player(namedtuple("Player", "id name model power connected ip")):
+    """A Squeezebox player, as of the last `serverstatus`"""
+
+    __slots__ = ()
+    TAGS = ("playerid", "name", "model", "power", "connected", "ip")
+    TYPES = {"power": flag, "connected": flag}
+
+    def __str__(self):
+        return "{name} [{short}]".format(name=self.name, short=self.id[-5:])
+
+
+class Artist(namedtuple("Artist", "id name")):
+    __slots__ = ()
+    TAGS = ("id", "artist")
+    TYPES = {"id": number}
+
+
+class Album(namedtuple("Album", "id name year artist artist_id "
+                                "artist_ids")):
+    """An album. Its `artist` is only there if asked for (tag `a`),
+    its `artist_id` with tag `S`, and the IDs of all its contributing
+    artists, `artist_ids`, with tag `SS`"""
+
+    __slots__ = ()
+    TAGS = ("id", "album", "year", "artist", "artist_id", "artist_ids")
+    TYPES = {"id": number, "year": number, "artist_id": number,
+             "artist_ids": numbers}
+
+    def __new__(cls, id, name, year, artist=None, artist_id=None,
+                artist_ids=None):
+        return super(Album, cls).__new__(cls, id, name, year, artist,
+                                         artist_id, artist_ids)
+
+    @property
+    def contributors(self):
+        """The IDs of all its artists, as far as is known"""
+        if self.artist_ids:
+            return self.artist_ids
+        return (self.artist_id,) if self.artist_id is not None else ()
+
+
+class Genre(namedtuple("Genre", "id name")):
+    __slots__ = ()
+    TAGS = ("id", "genre")
+    TYPES = {"id": number}
+
+
+class Playlist(namedtuple("Playlist", "id name")):
+    __slots__ = ()
+    TAGS = ("id", "playlist")
+    TYPES = {"id": number}
+
+
+class NowPlaying(namedtuple("NowPlaying", "title album artist duration time "
+                                          "mode volume player_name connected "
+                                          "power scanning")):
+    """What a player's playing (if anything) and doing, from one `status`.
+    Anything LMS didn't say is None, e.g. the track's fields when there's
+    nothing in the playlist"""
+
+    __slots__ = ()
+    TAGS = ("title", "album", "artist", "duration", "time", "mode",
+            "mixer volume", "player_name", "player_connected", "power",
+            "rescan")
+    TYPES = {"duration": seconds, "time": seconds, "mixer volume": number,
+             "player_connected": flag, "power": flag, "rescan": flag}
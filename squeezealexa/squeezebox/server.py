@@ -12,10 +12,21 @@
 
 from __future__ import print_function
 
-import re
+import socket
 import time
-
-from squeezealexa.utils import with_example, PY2, print_d
+from contextlib import contextmanager
+
+from squeezealexa.circuit_breaker import CircuitBreaker
+from squeezealexa.squeezebox.batch import Batch, then
+from squeezealexa.squeezebox.cache import ResponseCache
+from squeezealexa.squeezebox.index import LibraryIndex
+from squeezealexa.squeezebox.multiplexer import Multiplexer
+from squeezealexa.squeezebox.parsing import result_of, values, Tokenizer
+from squeezealexa.squeezebox.records import Album, Artist, Genre, \
+    NowPlaying, Player, Playlist, number
+from squeezealexa.squeezebox.write_behind import WriteBehindQueue
+from squeezealexa.ssl_wrap import Error, Timeout
+from squeezealexa.utils import PY2, print_d
 if PY2:
     import urllib
 else:
@@ -26,69 +37,181 @@ class SqueezeboxException(Exception):
     """Errors communicating with the Squeezebox"""
 
 
-class SqueezeboxPlayerSettings(dict):
-    """Encapsulates player settings"""
-
-    def __init__(self, player_id=None):
-        super(SqueezeboxPlayerSettings, self).__init__()
-        if player_id:
-            self['playerid'] = player_id
-
-    @property
-    def id(self):
-        return self['playerid']
+class SqueezeboxTimeout(SqueezeboxException):
+    """The Squeezebox server didn't answer in time"""
 
-    def __getattr__(self, key):
-        return self.get(key, None)
 
-    def __str__(self):
-        try:
-            return "{name} [{short}]".format(short=self['playerid'][-5:],
-                                             **self)
-        except KeyError:
-            return "Unidentified Squeezebox player: %r" % self
+class SqueezeboxScanning(SqueezeboxException):
+    """The library is being rescanned, so can't be listed"""
 
 
 class Server(object):
     """Encapsulates access to a Squeezebox player via a Squeezecenter server"""
 
     _TIMEOUT = 10
+    """Default seconds to wait for a command's response"""
+    _TIMEOUTS = {"login": 3, "serverstatus": 3,
+                 "mode": 2, "time": 2, "mixer": 2, "power": 2, "pause": 2,
+                 "play": 2, "stop": 2, "status": 3,
+                 "genres": 5, "playlists": 5, "artists": 5, "albums": 5}
+    """Per-command timeouts, by (first word of) command"""
     _MAX_FAILURES = 3
+    """Consecutive failures before giving the server a rest"""
     _MAX_CACHE_SECS = 60  # 600
+    """Seconds before the players' statuses are refreshed"""
+    _CACHE_TTLS = {"genres": 3600, "playlists": 600,
+                   "artists": 900, "albums": 900}
+    """Seconds to cache library listings for, by command"""
+    _NOW_PLAYING = "status - 1 tags:adl"
+    """The (tagged) query for what's playing: album, artist and duration"""
+    _batch = None
+    """The Batch collecting commands, while in `batch()`"""
+    _players = None
+    _cur_player_id = None
+    _logging_in = False
+    _index = None
+    _PAGE_SIZE = 255
+    """Items to ask for at a time, in listings"""
+    _PLAYERS_PAGE_SIZE = 99
+    """Players to ask for at a time, with serverstatus"""
+
+    def __init__(self, ssl_wrap=None, user=None, password=None,
+                 cur_player_id=None, debug=False, deadline=None,
+                 breaker=None, cache=None, state=None, connect=None):
+        """Nothing is sent until it's needed: connecting (if need be),
+        logging in and loading the players all wait for the first command.
+
+        :param connect: callable returning a connection, if not given one
+        """
 
-    def __init__(self, ssl_wrap, user=None, password=None,
-                 cur_player_id=None, debug=False):
-
-        self.ssl_wrap = ssl_wrap
         self._debug = debug
+        self.deadline = deadline
+        """The (Deadline) time by which all responses must have arrived"""
+        self.breaker = breaker or CircuitBreaker(self._MAX_FAILURES)
+        """Fails requests fast while the server keeps failing them"""
+        self._writes = WriteBehindQueue(self._drain)
+        """Commands sent in the background, as we needn't wait for them"""
+        self.cache = (cache if cache is not None
+                      else ResponseCache(self._CACHE_TTLS))
+        """Library listings, until they expire or the library changes"""
+        self._last_scan = None
+        self._rescans = 0
+        self.state = state
+        """The players' LiveState, if it's being kept (see Listener)"""
         self.user = user
         self.password = password
-        if user and password:
-            self.log_in()
-            print_d("Authenticated with %s!" % self)
-        self.players = {}
-        self.refresh_status()
+        self._connect = connect
+        self.ssl_wrap = None
+        self._mux = None
+        if ssl_wrap is not None:
+            self.use_connection(ssl_wrap)
+        self.cur_player_id = cur_player_id
+        self._created_time = time.time()
 
-        keys = list(self.players)  # returns keys in a list
-        self.cur_player_id = cur_player_id or keys[0]
-        print_d("Default player is now %s " % self.cur_player_id[-5:])
+    @property
+    def players(self):
+        """The players, by ID (loaded when first wanted)
 
-        self.__genres = []
-        self.__playlists = []
-        self._created_time = time.time()
+        :rtype dict[str, Player]
+        """
+        if self._players is None:
+            self.refresh_status()
+        return self._players
+
+    @players.setter
+    def players(self, players):
+        self._players = players
+
+    @property
+    def cur_player_id(self):
+        """The player to use by default: if not set, the first one"""
+        if self._cur_player_id is None and self.players:
+            self._cur_player_id = list(self.players)[0]
+            print_d("Default player is now %s " % self._cur_player_id[-5:])
+        return self._cur_player_id
+
+    @cur_player_id.setter
+    def cur_player_id(self, player_id):
+        self._cur_player_id = player_id
+
+    @property
+    def index(self):
+        """This server's library, in memory (loaded when first wanted)
+
+        :rtype LibraryIndex
+        """
+        if self._index is None:
+            self._index = LibraryIndex(self, check_secs=self._MAX_CACHE_SECS)
+        return self._index
 
     @property
     def player_names(self):
-        return {p.get("name", "unknown") for p in self.players.values()}
+        return {p.name or "unknown" for p in self.players.values()}
 
     def is_stale(self):
         return (time.time() - self._created_time) > self._MAX_CACHE_SECS
 
+    def refresh(self, lazy=False):
+        """Reloads the players' statuses, keeping the existing connection
+        open. Library listings are cached separately, in `cache`
+
+        :param lazy: if set, only when they're next wanted
+        """
+        if lazy:
+            self.players = None
+        else:
+            self.refresh_status()
+        self._created_time = time.time()
+
+    def use_connection(self, ssl_wrap):
+        """Switches to a (possibly already authenticated) connection.
+        Any login is left until it's next used."""
+        self._writes.flush()
+        self.ssl_wrap = ssl_wrap
+        self._mux = Multiplexer.of(ssl_wrap, on_notification=self._notified)
+
+    def release_connection(self):
+        """Finishes sending, then gives up the connection (e.g. to be pooled
+        until the next invocation), unless there's no way to connect again.
+        The next command connects as if for the first time.
+
+        :returns the connection released, if any
+        """
+        self._writes.flush()
+        if not self._connect:
+            return None
+        conn, self.ssl_wrap, self._mux = self.ssl_wrap, None, None
+        return conn
+
+    def _ensure_ready(self):
+        """Connects and logs in, if that's not been done yet"""
+        if self.ssl_wrap is None:
+            if not self._connect:
+                raise SqueezeboxException("No connection for %s" % self)
+            try:
+                self.use_connection(self._connect())
+            except (socket.error, Error) as e:
+                raise SqueezeboxException("Couldn't connect to the server "
+                                          "(%s)" % e)
+        elif not self.ssl_wrap.is_connected:
+            self._reconnect()
+        wants_login = self.user and self.password and not self._logging_in
+        if wants_login and not self.ssl_wrap.authenticated:
+            self.log_in()
+            print_d("Authenticated with %s!" % self)
+
     def log_in(self):
-        result = self.__a_request("login %s %s" % (self.user, self.password))
+        self._logging_in = True
+        try:
+            reply = self._exchange(["login %s %s"
+                                    % (self.user, self.password)])
+        finally:
+            self._logging_in = False
+        result = reply[0] if reply else None
         if result != "%s ******" % self.user:
             raise SqueezeboxException(
                 "Couldn't log in to squeezebox: response was '%s'" % result)
+        self.ssl_wrap.authenticated = True
 
     def __a_request(self, line, raw=False, wait=True):
         reply = self._request([line], raw=raw, wait=wait)
@@ -106,175 +229,340 @@ class Server(object):
     def _unquote(response):
         return ' '.join(urllib.unquote(s) for s in response.split(' '))
 
+    @contextmanager
+    def batch(self):
+        """Collects the commands of any Server methods called within,
+        and sends them all in one pipelined write at the end.
+        Until then, those methods return Futures instead of results.
+        Listings aren't batched (as they're paged)."""
+        if self._batch is not None:
+            yield self._batch
+            return
+        batch = Batch(self._request)
+        try:
+            with self.collecting(batch):
+                yield batch
+        except Exception as e:
+            batch.fail(e)
+            raise
+        batch.send()
+
+    @contextmanager
+    def collecting(self, batch):
+        """Adds the commands of any Server methods called within to the
+        given Batch, leaving it to the caller to send (see AsyncServer)"""
+        previous, self._batch = self._batch, batch
+        try:
+            yield batch
+        finally:
+            self._batch = previous
+
     def _request(self, lines, raw=False, wait=True):
         """
         Send multiple pipelined requests to the server, if connected,
-        and return their responses,
-        assuming order is maintained (which seems safe).
+        and return their responses (matched up to each request by the
+        command the server echoes back).
+        If not waiting, they're queued to be sent in the background.
+        In a batch, they're added to that, returning Futures.
 
         :type lines list[str]
         :rtype list[str]
         """
-        if not self.ssl_wrap.is_connected:
+        if self._batch is not None:
+            futures = self._batch.add([line.rstrip() for line in lines],
+                                      raw=raw)
+            return futures if wait else []
+        if not wait:
+            self._writes.put([line.rstrip() for line in lines])
             return []
+        # Keep everything in order, and the connection to ourselves
+        self._writes.flush()
+        return self._exchange(lines, raw=raw)
+
+    def _exchange(self, lines, raw=False, wait=True):
         if not (lines and len(lines)):
             return []
-        lines = [l.rstrip() for l in lines]
+        lines = [line.rstrip() for line in lines]
+        pending = self._send(lines, wait=wait)
+        if not wait:
+            return []
+        return self._collect(lines, pending, raw=raw)
 
-        first_word = lines[0].split()[0]
-        if not (self.ssl_wrap.is_connected or first_word == 'login'):
-            print_d("Can't do '%s' - not connected" % first_word, self)
-            return
+    def _send(self, lines, wait=True, on_response=None):
+        """Sends the lines, without waiting for their responses
+
+        :rtype list[Pending]
+        """
+        self.breaker.check(str(self))
+        self._ensure_ready()
 
         if self._debug:
             print_d("sent <<<< " + "\n..<< ".join(lines))
 
-        request = "\n".join(lines) + "\n"
-        raw_response = self.ssl_wrap.communicate(request, wait=wait)
+        try:
+            pending = self._mux.send(lines, wait=wait,
+                                     timeout=self._timeout_for(lines),
+                                     on_response=on_response)
+        except Timeout as e:
+            self.breaker.failed()
+            raise SqueezeboxTimeout(str(e))
+        if pending is None:
+            self.breaker.failed()
+            raise SqueezeboxException("Couldn't send to %s" % self)
         if not wait:
-            return []
-        if not raw_response:
+            self.breaker.succeeded()
+        return pending
+
+    def _collect(self, lines, pending, raw=False):
+        """Waits for the responses to some sent lines, and parses them
+
+        :rtype list[str]
+        """
+        try:
+            responses = self._mux.collect(pending,
+                                          timeout=self._timeout_for(lines))
+        except Timeout as e:
+            self.breaker.failed()
+            raise SqueezeboxTimeout(str(e))
+        if responses is None:
+            self.breaker.failed()
             raise SqueezeboxException(
                 "No further response from %s. Login problem?" % self)
-
-        raw_response = raw_response.rstrip("\n")
-        response = raw_response if raw else self._unquote(raw_response)
+        self.breaker.succeeded()
+        output = self._parse_responses(lines, responses, raw=raw)
 
         if self._debug:
-            print_d("rec >>>> " + "\n..>> ".join(response.splitlines()))
-
-        def start_point(text):
+            print_d("rec >>>> " + "\n..>> ".join(output))
+        return output
 
-            if first_word == 'login':
-                return 6
+    def _paged(self, command, params="", player_id=None, page_size=None,
+               count_key="count", cached=True):
+        """Generates the (escaped) result of each page of a listing command,
+        e.g. `albums 0 255 tags:ly`, `albums 255 255 tags:ly`...
+        Each page is requested before the previous one is yielded,
+        so it's on its way while that's used.
 
-            delta = -1 if text.endswith('?') else 1
+        :param cached: whether to use (and fill) the cache for these pages
+        """
+        size = page_size or self._PAGE_SIZE
 
-            start = len(self._unquote(text) if raw else text) + delta
-            return start
+        def line_at(start):
+            return self._page_at(command, start, size, params, player_id)
 
-        resp_lines = response.splitlines()
-        if len(lines) != len(resp_lines):
-            raise ValueError("Response problem: %s != %s"
-                             % (lines, resp_lines))
-
-        output = [resp_line[start_point(line):]
-                  for line, resp_line in zip(lines, resp_lines)]
-        return output
+        start = 0
+        line = line_at(start)
+        result, pending = self._fetch(line, cached)
+        try:
+            while result is not None or pending:
+                if pending:
+                    result = self._collect([line], pending, raw=True)[0]
+                    pending = None
+                    if cached:
+                        self._remember(line, result)
+                start += size
+                total = values(result, count_key)
+                page, result = result, None
+                if total and start < int(total[-1]):
+                    line = line_at(start)
+                    result, pending = self._fetch(line, cached)
+                yield page
+        finally:
+            # If stopped early, just drop its response when it arrives
+            for p in pending or []:
+                p.wait = False
 
     @staticmethod
-    def __pairs_from(response):
-        """Split and unescape a response"""
-
-        # print_d("__pairs_from, response: %s" % response)
+    def _page_at(command, start, size, params="", player_id=None):
+        """The line requesting one page of a listing command"""
+        prefix = "%s " % player_id if player_id else ""
+        return ("%s%s %d %d %s" % (prefix, command, start, size,
+                                   params)).rstrip()
 
-        def demunge(string):
-            s = urllib.unquote(string)
-            return tuple(s.split(':', 1))
+    def _fetch(self, line, cached=True):
+        """The cached result of a line, or else its (sent) Pending request
 
-        # output = filter(lambda t: len(t) == 2,
-        #                 map(demunge, response.split(' ')))
-        demunged = map(demunge, response.split(' '))
-        output = [d for d in demunged if len(d) == 2]
-        # print_d("output: %s" % output)
-        return output
-
-    @staticmethod
-    def __pairs_from2(response):
+        :rtype tuple[str, list[Pending]]
         """
-        Split and unescape a response
-
-        input:
-            :10382150 artist:Olafur Arnalds
-            id:10388296 artist:Ólafur Arnalds
-            id:10380560 artist:Ólafur Arnalds And Nils Frahm
-            id:10380558 artist:Ólafur Arnalds & Nils Frahm
-            count:4
-
-        output:
-            {'10388296': '\xc3\x93lafur Arnalds',
-             '10380558': '\xc3\x93lafur Arnalds & Nils Frahm',
-             '10380560': '\xc3\x93lafur Arnalds And Nils Frahm',
-              None: 'Olafur Arnalds'}
-
-        input:
-            albums 0 255 artist_id%3A10378560 tags%3Aly
-            id%3A7129733 album%3ABlackfield year%3A2005
-            id%3A7129734 album%3ABlackfield%20II year%3A2007
-            id%3A7129736 album%3ABlackfield%20IV year%3A2013
-            id%3A7129737 album%3ABlackfield%20V year%3A2017
-            id%3A7129735 album%3AWelcome%20to%20My%20DNA year%3A2011
-            count%3A5
-
-        output:
-            [('id', '7129733'), ('album', 'Blackfield'), ('year', '2005'),
-             ('id', '7129734'), ('album', 'Blackfield II'), ('year', '2007'),
-             ('id', '7129736'), ('album', 'Blackfield IV'), ('year', '2013'),
-             ('id', '7129737'), ('album', 'Blackfield V'), ('year', '2017'),
-             ('id', '7129735'), ('album', 'Welcome to My DNA'), ('year',
-                                                                      '2011'),
-             ('count', '5')]
-
-        input:
-            artists 0 255 search:blackfield
-            id:10378560 artist:Blackfield
-            count:1
-
-        output:
-           [('id', '10378560'), ('artist', 'Blackfield'),
-            ('count', '1')]
+        result, stale = self.cache.get(line) if cached else (None, False)
+        if result is not None:
+            if stale:
+                self._revalidate([line])
+            return result, None
+        self._writes.flush()
+        return None, self._send([line])
+
+    def _remember(self, line, result):
+        """Caches a raw result, unless the library's being rescanned"""
+        if not self.cache.ttl_for(line):
+            return
+        if "rescan" in result:
+            self.cache.invalidate("library is being rescanned")
+        else:
+            self.cache.put(line, result)
+
+    def _revalidate(self, lines):
+        """Refreshes some stale cached results, in the background"""
+        print_d("Revalidating %d cached result(s)" % len(lines))
+        self._writes.put(lines)
+
+    def iter_records(self, command, tokenizer, params="", limit=None,
+                     page_size=None, player_id=None, cached=True):
+        """Generates a typed record for each item of a listing command,
+        as split up by the Tokenizer, stopping after `limit` (if given)
+
+        :param cached: False for bulk loads, kept elsewhere (e.g. an index)
+        :raises SqueezeboxScanning if the library is being rescanned
         """
-        # print_d("__pairs_from2, response: %s" % response)
-
-        def demunge(string):
-            s = urllib.unquote(string)
+        pages = self._paged(command, params, player_id=player_id,
+                            page_size=page_size, cached=cached)
+        items = 0
+        try:
+            for result in pages:
+                if not items and "rescan" in result:
+                    raise SqueezeboxScanning("%s is rescanning" % self)
+                for record in tokenizer.records(result):
+                    items += 1
+                    if limit is not None and items > limit:
+                        return
+                    yield record
+        finally:
+            pages.close()
+
+    def _records(self, command, record, params="", limit=None):
+        """All the records of a listing, or "Scanning" """
+        try:
+            return list(self.iter_records(command,
+                                          Tokenizer.for_record(record),
+                                          params, limit=limit,
+                                          player_id=self.cur_player_id))
+        except SqueezeboxScanning:
+            return "Scanning"
 
-            return tuple(s.split(':', 1))
+    def _reconnect(self):
+        """Reopens a lost connection (logging in again, if needed)"""
+        print_d("Reconnecting to %s" % self)
+        try:
+            self.ssl_wrap.reconnect(deadline=self.deadline)
+        except (socket.error, Error) as e:
+            self.breaker.failed()
+            raise SqueezeboxException("Couldn't reconnect to %s (%s)"
+                                      % (self, e))
+        # The connection alone is enough for a half-open probe
+        self.breaker.succeeded()
+        self.use_connection(self.ssl_wrap)
+
+    def _drain(self, lines):
+        """Sends lines from the background queue, not waiting for replies.
+        Those to (revalidated) listings are cached whenever they're read"""
+        self._send([line.rstrip() for line in lines], wait=False,
+                   on_response=self._remember_pending)
+
+    def _remember_pending(self, pending):
+        self._remember(pending.line, result_of(pending.line, pending.response))
+
+    def flush(self):
+        """Waits for any commands still being sent in the background"""
+        self._writes.flush()
+
+    def _notified(self, line):
+        if self._debug:
+            print_d("Notification: %s" % line)
 
-        words = "|".join(["id", "album", "artist", "count", "year"])
-        pattern = r"(^|\W)({kwds})(?=\W|$)".format(kwds=words)
-        d = re.sub(pattern, r"_\2", response)[1:]
+    @classmethod
+    def _parse_responses(cls, lines, responses, raw=False):
+        """The results from each request's response line
 
-        # print_d("__pairs_from2, d: %s" % d)
+        :type lines list[str]
+        :type responses list[str]
+        :rtype list[str]
+        """
+        if len(lines) != len(responses):
+            raise ValueError("Response problem: %s != %s"
+                             % (lines, responses))
+        results = [result_of(line, response)
+                   for line, response in zip(lines, responses)]
+        return results if raw else [cls._unquote(r) for r in results]
+
+    def _timeout_for(self, lines):
+        """The seconds to allow for the given commands, within any deadline
+        :raises SqueezeboxTimeout if there's no time left at all"""
+        limit = max(self._TIMEOUTS.get(self._command_of(line), self._TIMEOUT)
+                    for line in lines)
+        if not self.deadline:
+            return limit
+        if self.deadline.expired:
+            raise SqueezeboxTimeout("Out of time before sending %r" % lines)
+        return self.deadline.timeout(limit)
 
-        output = filter(lambda t: len(t) == 2,
-                        map(demunge, d.split('_')))
-        # print_d("__pairs_from2, output: %s" % output)
-        return output
+    @staticmethod
+    def _command_of(line):
+        """The command name of a CLI line (i.e. without any player ID)"""
+        words = line.split(' ', 2)
+        if len(words) > 1 and (':' in words[0] or '%3A' in words[0]):
+            return words[1]
+        return words[0]
 
     def refresh_status(self):
         """Updates the list of the Squeezebox players available and other
          server metadata."""
 
+        if self._live:
+            self.players = dict(self.state.players)
+            if self.state.rescans != self._rescans:
+                self.cache.invalidate("library rescanned")
+                self._rescans = self.state.rescans
+            return
         print_d("Refreshing server and player statuses...")
-        pairs = self.__pairs_from(
-            self.__a_request("serverstatus 0 99", raw=True))
-        self.players = {}
-        player_id = None
-        for key, val in pairs:
-            if key == "playerid":
-                player_id = val
-                self.players[player_id] = SqueezeboxPlayerSettings(player_id)
-            elif player_id:
-                # Don't worry, playerid is *always* the first entry...
-                self.players[player_id][key] = val
+        results = list(self._paged("serverstatus",
+                                   page_size=self._PLAYERS_PAGE_SIZE,
+                                   count_key="player count"))
+        self.players = self._players_from(results)
+        last_scan = values(results[0], "lastscan") if results else None
+        if last_scan:
+            if self._last_scan and last_scan[0] != self._last_scan:
+                self.cache.invalidate("library rescanned")
+            self._last_scan = last_scan[0]
         if self._debug:
             print_d("Found %d player(s): %s" %
                     (len(self.players), self.players))
+
+    @property
+    def _live(self):
+        """Whether player state can be answered from memory"""
+        return self.state is not None and self.state.live
+
+    @staticmethod
+    def _players_from(results):
+        """Builds the players from the (escaped) results of `serverstatus`,
+        one per page
+
+        :type results list[str]
+        :rtype dict[str, Player]
+        """
+        tokenizer = Tokenizer.for_record(Player)
+        players = {}
+        for result in results:
+            for player in tokenizer.records(result):
+                players[player.id] = player
+        count = values(results[0], "player count") if results else []
         try:
-            assert (int(dict(pairs)['player count']) == len(self.players))
+            assert int(count[0]) == len(players)
         except Exception as e:
             raise SqueezeboxException("Player count broken (%r). Data: %s"
-                                      % (e, pairs))
+                                      % (e, results))
+        return players
 
     def player_request(self, line, player_id=None, raw=False, wait=True):
-        """Makes a single request to a particular player (or the current)"""
+        """Makes a single request to a particular player (or the current).
+        If not waiting, it's queued to be sent in the background."""
 
         try:
             player_id = (player_id or
                          self.cur_player_id or
-                         list(self.players.values())[0]["playerid"])
-
+                         list(self.players.values())[0].id)
+            if not wait:
+                self._request(["%s %s" % (player_id, line)], wait=False)
+                return None
             return self._request(["%s %s" % (player_id, line)],
                                  raw=raw, wait=wait)[0]
         except IndexError:
@@ -309,48 +597,50 @@ class Server(object):
         """Returns whether the player is in any sort of non-playing mode"""
 
         response = self.player_request("mode ?", player_id=player_id)
-        return "play" != response
+        return then(response, lambda mode: "play" != mode)
 
-    def get_current(self, player_id=None):
-        return self.get_status(player_id)
+    def get_now_playing(self, player_id=None):
+        """What a player's playing and doing, in a single `status` query
+        (or none at all, if that's known live)
 
-    def get_track_details(self, player_id=None):
-        # keys = ["genre", "artist", "current_title"]
-        keys = ["current_title", "album", "artist"]
+        :rtype NowPlaying
+        """
         pid = player_id or self.cur_player_id
+        if self._live and pid in self.state.players:
+            return self._now_playing_from(self.state.players[pid],
+                                          self.state.status(pid))
+        response = self.player_request(self._NOW_PLAYING, player_id=pid,
+                                       raw=True)
+        return then(response, Tokenizer.for_record(NowPlaying).record_of)
 
-        response = self._request(["%s %s ?" % (pid, s)
-                                  for s in keys])
-        # print_d(response)
-        # response: ['Lit', 'Kiasmos (HDTracks 24-44.1)', 'Kiasmos']
-        return dict(zip(keys, response))
+    def get_genres(self):
+        """:rtype list[Genre]"""
+        return list(self.iter_records("genres", Tokenizer.for_record(Genre)))
+
+    def get_playlists(self):
+        """:rtype list[Playlist]"""
+        return list(self.iter_records("playlists",
+                                      Tokenizer.for_record(Playlist)))
 
     @property
     def genres(self):
-        if not self.__genres:
-            response = self.__a_request("genres 0 255", raw=True)
-            print_d(response)
-            self.__genres = [v for k, v in self.__pairs_from(response)
-                             if k == 'genre']
-            print_d(with_example("Loaded %d LMS genres", self.__genres))
-        return self.__genres
+        """The names of all the genres, from the index"""
+        return self.index.genre_names
 
     @property
     def playlists(self):
-        if not self.__playlists:
-            resp = self.__a_request("playlists 0 255", raw=True)
-            self.__playlists = [v for k, v in self.__pairs_from(resp)
-                                if k == 'playlist']
-            print_d(with_example("Loaded %d LMS playlists", self.__playlists))
-        return self.__playlists
-
-    def get_status(self, player_id=None):
-        """ask the server for a status"""
-        response = self.player_request("status - 2", player_id=player_id,
-                                       raw=True)
-        if "rescan" in response:
-            return "Scanning"
-        return dict(self.__pairs_from(response))
+        """The names of all the playlists, from the index"""
+        return self.index.playlist_names
+
+    @staticmethod
+    def _now_playing_from(player, status):
+        """A NowPlaying from live state, which doesn't follow the time"""
+        return NowPlaying(title=status.title, album=status.album,
+                          artist=status.artist, duration=None, time=None,
+                          mode=status.mode, volume=status.volume,
+                          player_name=player.name,
+                          connected=status.connected, power=status.power,
+                          scanning=None)
 
     def next(self, player_id=None):
         self.player_request("playlist jump +1", player_id=player_id)
@@ -373,27 +663,29 @@ class Server(object):
 
     def change_song(self, path):
         """Queue up a song"""
-        self.player_request("playlist clear")
-        self.player_request("playlist insert %s" % (urllib.quote(path)))
+        with self.batch():
+            self.player_request("playlist clear")
+            self.player_request("playlist insert %s" % (urllib.quote(path)))
 
     def change_volume(self, delta, player_id=None):
         if not delta:
             return
         cmd = "mixer volume %s%.1f" % ('+' if delta > 0 else '', float(delta))
-        self.player_request(cmd, player_id=player_id)
+        self.player_request(cmd, player_id=player_id, wait=False)
 
     def get_milliseconds(self):
-        secs = self.player_request("time ?") or 0
-        return float(secs) * 1000.0
+        secs = self.player_request("time ?")
+        return then(secs, lambda secs: float(secs or 0) * 1000.0)
 
     def pause(self, player_id=None):
-        self.player_request("pause 1", player_id=player_id)
+        self.player_request("pause 1", player_id=player_id, wait=False)
 
     def resume(self, player_id=None, fade_in_secs=1):
-        self.player_request("pause 0 %d" % fade_in_secs, player_id=player_id)
+        self.player_request("pause 0 %d" % fade_in_secs, player_id=player_id,
+                            wait=False)
 
     def stop(self, player_id=None):
-        self.player_request("stop", player_id=player_id)
+        self.player_request("stop", player_id=player_id, wait=False)
 
     def set_shuffle(self, on=True, player_id=None):
         self.player_request("playlist shuffle %d" % int(bool(on) * 2),
@@ -404,63 +696,46 @@ class Server(object):
                             player_id=player_id)
 
     def set_power(self, on=True, player_id=None):
-        self.player_request("power %d" % int(bool(on)), player_id=player_id)
+        self.player_request("power %d" % int(bool(on)), player_id=player_id,
+                            wait=False)
 
     def set_all_power(self, on=True):
         value = int(bool(on))
         self._request(["%s power %d" % (p, value)
-                       for p in self.players.keys()])
+                       for p in self.players.keys()], wait=False)
 
     def __str__(self):
-        return "Squeezebox server at %s" % self.ssl_wrap
+        return "Squeezebox server at %s" % (self.ssl_wrap or "(not connected)")
 
-    def get_artists_with_search_term(self, search_term):
+    def get_artists_with_search_term(self, search_term, limit=None):
         """
         ask the server for artists matching search_term
         e.g. artists 0 255 search:blackfield
-        """
-
-        # if isinstance(search_term, unicode):
-        #    print_d("unicode search_term")
-        #    search_term = str(search_term)
-
-        # print_d("search_term: %s" % search_term)
-        # q_search_term = urllib.quote(search_term)
-        # print_d("quoted search_term: %s" % q_search_term)
 
-        cmd = ("artists 0 255 search:%s" % search_term)
-        response = self.player_request(cmd)
-
-        if "rescan" in response:
-            return "Scanning"
-
-        return self.__pairs_from2(response)
+        :rtype list[Artist]
+        """
+        return self._records("artists", Artist, "search:%s" % search_term,
+                             limit=limit)
 
-    def get_albums_with_search_term(self, search_term):
+    def get_albums_with_search_term(self, search_term, limit=None):
         """
         ask the server for albums matching search_term
-        e.g. albums 0 255 search:last samurai
-        """
-
-        cmd = ("albums 0 255 search:%s tags:lay" % search_term)
-        response = self.player_request(cmd)
-        if "rescan" in response:
-            return "Scanning"
+        e.g. albums 0 255 search:last samurai tags:lay
 
-        return self.__pairs_from2(response)
+        :rtype list[Album]
+        """
+        return self._records("albums", Album,
+                             "search:%s tags:lay" % search_term, limit=limit)
 
-    def get_albums_with_artist_id(self, artist_id):
+    def get_albums_with_artist_id(self, artist_id, limit=None):
         """
         ask the server for albums belonging to artist_id
         e.g. albums 0 255 artist_id:10378560 tags:ly
-        """
-
-        cmd = ("albums 0 255 artist_id:%s tags:ly" % artist_id)
-        response = self.player_request(cmd)
-        if "rescan" in response:
-            return "Scanning"
 
-        return self.__pairs_from2(response)
+        :rtype list[Album]
+        """
+        return self._records("albums", Album,
+                             "artist_id:%s tags:ly" % artist_id, limit=limit)
 
     def play_album_with_id(self, album_id, player_id=None):
         """
@@ -477,20 +752,39 @@ class Server(object):
         ask the server if it's currently scanning the library
         """
         response = self.player_request("rescan ?")
-        if "rescan" in response:
-            return "Scanning"
-
-        return None
+        return then(response,
+                    lambda response: "Scanning" if "rescan" in response
+                    else None)
 
     def rescan(self):
         """
         ask the server to rescan the library
         """
-        response = self.player_request("rescan ?")
-        if "rescan" in response:
-            return "Scanning"
+        def start(response):
+            if "rescan" in response:
+                return "Scanning"
+            result = self.__a_request("rescan") or 0
+            self.cache.invalidate("rescan requested")
+            return result
+
+        return then(self.player_request("rescan ?"), start)
+
+    def get_library_version(self):
+        """When the library was last scanned, and its total albums, artists
+        and genres, all in one round trip. Any change in these means
+        the library has (probably) changed
+
+        :rtype tuple
+        """
+        names = ("albums", "artists", "genres")
+        lines = ["serverstatus 0 0"] + ["info total %s ?" % n for n in names]
+
+        def version(results):
+            last_scan = values(results[0], "lastscan")
+            return (last_scan[0] if last_scan else None,) + tuple(
+                number(total) for total in results[1:])
 
-        return self.__a_request("rescan") or 0
+        return then(self._request(lines, raw=True), version)
 
     def get_info_total(self, name):
         """ask the server for the total number of items of name"""
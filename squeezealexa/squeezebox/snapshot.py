@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+#
+#   Copyright 2017 Nick Boultbee
+#   This file is part of squeeze-alexa.
+#
+#   squeeze-alexa is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   See LICENSE for full license
+
+"""Snapshots of a server's players and library index, on disk, so that
+a (Lambda) cold start has them at once, instead of asking LMS.
+
+The file is a fixed header, a table of sections, then each section:
+`marshal`led plain data, e.g. a tuple of plain tuples, one per record.
+It's read through `mmap`, and each section only decoded when it's first
+wanted.
+"""
+
+import marshal
+import mmap
+import os
+import struct
+import sys
+import time
+
+from squeezealexa.squeezebox.records import Album, Artist, Genre, Player, \
+    Playlist
+from squeezealexa.utils import print_d, print_w
+
+_MAGIC = b"SQAS"
+_HEADER = struct.Struct("<4sHBBd")
+"""Magic, format, Python major & minor version (for marshal), saved time"""
+_SECTION = struct.Struct("<12sII")
+"""Name, offset and length of each section"""
+
+
+class Snapshot(object):
+    """A saved snapshot, whose sections are decoded when first wanted"""
+
+    FORMAT = 2
+    """Bumped whenever the layout, any record type, or how names are
+    normalised for matching, changes"""
+    SECTIONS = {"players": Player, "artists": Artist, "albums": Album,
+                "genres": Genre, "playlists": Playlist}
+    """The record type of each section (besides `version`, and `names`:
+    each name's forms for matching, see `LibraryIndex.folded`)"""
+
+    def __init__(self, data, sections, saved, path=None):
+        self._data = data
+        self.sections = sections
+        """The offset and length of each section, by name"""
+        self.saved = saved
+        """When it was saved"""
+        self.path = path
+        self._decoded = {}
+
+    @classmethod
+    def load(cls, path):
+        """The snapshot at path, or None if there isn't a usable one
+
+        :rtype Snapshot
+        """
+        try:
+            with open(path, "rb") as f:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (IOError, OSError, ValueError) as e:
+            print_d("No snapshot at %s (%s)" % (path, e))
+            return None
+        try:
+            return cls.from_bytes(data, path)
+        except (ValueError, struct.error) as e:
+            print_w("Ignoring snapshot %s: %s" % (path, e))
+            data.close()
+            return None
+
+    @classmethod
+    def from_bytes(cls, data, path=None):
+        magic, version, major, minor, saved = _HEADER.unpack_from(data, 0)
+        if magic != _MAGIC or version != cls.FORMAT:
+            raise ValueError("not a format %d snapshot" % cls.FORMAT)
+        if (major, minor) != sys.version_info[:2]:
+            raise ValueError("made by Python %d.%d" % (major, minor))
+        count, = struct.unpack_from("<H", data, _HEADER.size)
+        sections = {}
+        offset = _HEADER.size + 2
+        for i in range(count):
+            name, start, length = _SECTION.unpack_from(data, offset)
+            sections[name.rstrip(b"\0").decode("ascii")] = (start, length)
+            offset += _SECTION.size
+        return cls(data, sections, saved, path)
+
+    def __contains__(self, name):
+        return name in self.sections
+
+    def section(self, name):
+        """The decoded section: records, or else as saved"""
+        if name not in self._decoded:
+            start, length = self.sections[name]
+            value = marshal.loads(self._data[start:start + length])
+            record = self.SECTIONS.get(name)
+            if record:
+                value = [record._make(fields) for fields in value]
+            self._decoded[name] = value
+        return self._decoded[name]
+
+    @property
+    def version(self):
+        """The library version (see `Server.get_library_version`)"""
+        return tuple(self.section("version"))
+
+    @property
+    def players(self):
+        """:rtype dict[str, Player]"""
+        return {p.id: p for p in self.section("players")}
+
+    def restore(self, server):
+        """Gives a new Server the players and library index saved,
+        to use until (lazily) checked against the live server"""
+        if "players" in self:
+            server.players = self.players
+        if "version" in self:
+            server.index.use_snapshot(self)
+        print_d("Restored %s from %s, saved %.0fs ago"
+                % (", ".join(sorted(self.sections)), self.path,
+                   time.time() - self.saved))
+
+    @classmethod
+    def save(cls, path, server):
+        """Atomically writes a snapshot of a Server's players and index"""
+        index = server.index
+        sections = {}
+        if index.version is not None:
+            sections["version"] = index.version
+        if server._players:
+            sections["players"] = list(server._players.values())
+        for name in index.loaded:
+            sections[name] = index.listing(name)
+        if index._forms:
+            sections["names"] = index._forms
+        blobs = []
+        for name in sorted(sections):
+            value = sections[name]
+            if name in cls.SECTIONS:
+                value = tuple(tuple(r) for r in value)
+            blobs.append((name, marshal.dumps(value, 2)))
+
+        offset = _HEADER.size + 2 + _SECTION.size * len(blobs)
+        parts = [_HEADER.pack(_MAGIC, cls.FORMAT, sys.version_info[0],
+                              sys.version_info[1], time.time()),
+                 struct.pack("<H", len(blobs))]
+        for name, blob in blobs:
+            parts.append(_SECTION.pack(name.encode("ascii"), offset,
+                                       len(blob)))
+            offset += len(blob)
+        parts += [blob for _, blob in blobs]
+        temp = "%s.%d.tmp" % (path, os.getpid())
+        try:
+            with open(temp, "wb") as f:
+                f.write(b"".join(parts))
+            os.rename(temp, path)
+        except (IOError, OSError) as e:
+            print_w("Couldn't save snapshot to %s (%s)" % (path, e))
+            return False
+        index.dirty = False
+        print_d("Saved %s to %s (%d bytes)"
+                % (", ".join(sorted(sections)), path, offset))
+        return True
+
+    @classmethod
+    def save_changes(cls, path, server, saved=None):
+        """Saves a snapshot, if the Server's index has loaded anything from
+        the server, or its players aren't those saved
+
+        :param saved: what this returned last time
+        :returns the players now saved
+        """
+        players = server._players
+        index = server._index
+        if (index and index.dirty) or (players and players != saved):
+            if cls.save(path, server):
+                return players
+        return saved
+
+    def close(self):
+        self._data.close()
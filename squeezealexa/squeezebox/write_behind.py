@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+#
+#   Copyright 2017 Nick Boultbee
+#   This file is part of squeeze-alexa.
+#
+#   squeeze-alexa is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   See LICENSE for full license
+
+import threading
+
+from squeezealexa.utils import print_d, print_w
+
+
+class WriteBehindQueue(object):
+    """Commands whose results we don't need, sent strictly in order
+    by a background thread. It doesn't wait for their replies: those are
+    read (and dropped) by whoever next reads from the connection."""
+
+    def __init__(self, exchange):
+        """
+        :param exchange: callable sending some lines
+        """
+        self._exchange = exchange
+        self._lock = threading.Lock()
+        self._queue = []
+        self._worker = None
+        self.failures = 0
+
+    def put(self, lines):
+        """Queues the lines, returning at once"""
+        with self._lock:
+            self._queue.extend(lines)
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._work,
+                                                name="squeeze-write-behind")
+                self._worker.daemon = True
+                self._worker.start()
+
+    def _work(self):
+        while True:
+            with self._lock:
+                lines, self._queue = self._queue, []
+                if not lines:
+                    self._worker = None
+                    return
+            try:
+                self._exchange(lines)
+                print_d("Sent %d command(s) in the background" % len(lines))
+            except Exception as e:
+                self.failures += 1
+                print_w("Couldn't send %r in the background (%s)"
+                        % (lines, e))
+
+    def flush(self):
+        """Waits until everything queued has been sent (not answered)"""
+        with self._lock:
+            worker = self._worker
+        if worker is not None and worker is not threading.current_thread():
+            worker.join()
+
+    def __len__(self):
+        return len(self._queue)
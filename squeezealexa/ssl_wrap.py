@@ -10,53 +10,288 @@
 #
 #   See LICENSE for full license
 
+import select
 import socket
+import time
+from collections import deque
 
 import ssl
 import _ssl
 
-from squeezealexa.utils import print_d, print_w
+from squeezealexa.utils import print_d, print_w, Deadline
 
 
 class Error(Exception):
     pass
 
 
+class Timeout(Error):
+    """The server took too long to respond"""
+
+
+def _is_timeout(e):
+    # Python 2's SSL sockets time out with a plain SSLError
+    return isinstance(e, socket.timeout) or "timed out" in str(e)
+
+
+_CLIENT_PROTOCOL = getattr(ssl, "PROTOCOL_TLS_CLIENT",
+                           getattr(ssl, "PROTOCOL_TLS", ssl.PROTOCOL_SSLv23))
+"""Negotiates the best version both ends support (see _harden_context)"""
+
+
+def create_context(ca_file=None, cert_file=None, verify_hostname=False):
+    """Builds a hardened TLS context for talking to the CLI proxy.
+    This is comparatively expensive, so build it once and share it."""
+
+    context = ssl.SSLContext(_CLIENT_PROTOCOL)
+    # Certificate checks are only as strict as configured below
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    _harden_context(context)
+    try:
+        if ca_file:
+            context.load_verify_locations(ca_file)
+        if cert_file:
+            context.verify_mode = ssl.CERT_REQUIRED
+            context.check_hostname = verify_hostname
+            context.load_cert_chain(cert_file)
+    except ssl.SSLError as e:
+        print_d("Problem with Cert/CA (+key) files (%s). "
+                "Does it include the private key?" % e)
+        raise e
+    except IOError as e:
+        print_d("Problem loading Cert/CA files at %s or %s (%s)" %
+                (ca_file, cert_file, e))
+        raise e
+    return context
+
+
+def _harden_context(context):
+    # TLS 1.2 or 1.3 only
+    if hasattr(context, "minimum_version"):
+        context.minimum_version = ssl.TLSVersion.TLSv1_2
+    else:
+        for name in ["OP_NO_SSLv2", "OP_NO_SSLv3",
+                     "OP_NO_TLSv1", "OP_NO_TLSv1_1"]:
+            context.options |= getattr(ssl, name, 0)
+    # disallow ciphers with known vulnerabilities
+    context.set_ciphers(ssl._RESTRICTED_SERVER_CIPHERS)
+    # Prefer the server's ciphers by default so that we get stronger
+    # encryption
+    context.options |= getattr(_ssl, "OP_CIPHER_SERVER_PREFERENCE", 0)
+    # Use single use keys in order to improve forward secrecy
+    context.options |= getattr(_ssl, "OP_SINGLE_DH_USE", 0)
+    context.options |= getattr(_ssl, "OP_SINGLE_ECDH_USE", 0)
+
+
+class SessionCache(object):
+    """Remembers the last TLS session for each server, so that reconnects
+    can resume it with an abbreviated handshake, and keeps statistics
+    so we can see how well that's working.
+
+    Note that Python can't serialise sessions, so these only live as long
+    as the process (which, for Lambda, is as long as the container)."""
+
+    def __init__(self, max_timings=100):
+        self._sessions = {}
+        self.hits = 0
+        self.misses = 0
+        self.timings = deque(maxlen=max_timings)
+        """Recent (handshake seconds, was resumed) pairs"""
+
+    @property
+    def supported(self):
+        return hasattr(ssl.SSLSocket, "session")
+
+    def get(self, key):
+        return self._sessions.get(key)
+
+    def put(self, key, session):
+        if session is not None:
+            self._sessions[key] = session
+
+    def discard(self, key):
+        self._sessions.pop(key, None)
+
+    def record(self, secs, offered, resumed):
+        """Records a handshake, and whether a session was offered / reused"""
+        self.timings.append((secs, resumed))
+        if offered:
+            if resumed:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return float(self.hits) / total if total else 0.0
+
+    def mean_handshake(self, resumed):
+        secs = [t for t, r in self.timings if r == resumed]
+        return sum(secs) / len(secs) if secs else None
+
+    def stats(self):
+        return {"handshakes": len(self.timings),
+                "resumed": self.hits,
+                "not resumed": self.misses,
+                "hit rate": self.hit_rate,
+                "mean full secs": self.mean_handshake(False),
+                "mean resumed secs": self.mean_handshake(True)}
+
+    def __str__(self):
+        full = self.mean_handshake(False)
+        resumed = self.mean_handshake(True)
+        return ("%d TLS handshakes, %.0f%% resumed. "
+                "Average %s full, %s resumed"
+                % (len(self.timings), self.hit_rate * 100,
+                   "%.0f ms" % (full * 1000) if full is not None else "-",
+                   "%.0f ms" % (resumed * 1000)
+                   if resumed is not None else "-"))
+
+
+class LineReader(object):
+    """Reads newline-terminated responses from a socket-like `recv`.
+
+    Bytes are accumulated in one buffer, which is only ever scanned once
+    for newlines, and each line is decoded on its own as it completes,
+    so reading a response is linear in its size."""
+
+    BUFFER_SIZE = 64 * 1024
+
+    def __init__(self, recv, buffer_size=BUFFER_SIZE, encoding='utf-8'):
+        self._recv = recv
+        self.buffer_size = buffer_size
+        self.encoding = encoding
+        self._buf = bytearray()
+        self._start = 0
+        """Where the next (incomplete) line starts"""
+        self._scanned = 0
+        """How far we've already looked for a newline"""
+
+    def readline(self):
+        """Returns the next line (without its newline), or None at EOF"""
+        buf = self._buf
+        while True:
+            end = buf.find(b'\n', self._scanned)
+            if end >= 0:
+                line = buf[self._start:end].decode(self.encoding)
+                self._start = self._scanned = end + 1
+                return line
+            self._scanned = len(buf)
+            data = self._recv(self.buffer_size)
+            if not data:
+                return None
+            if self._start:
+                # Only compact when we need more data: amortised linear
+                del buf[:self._start]
+                self._scanned -= self._start
+                self._start = 0
+            buf += data
+
+    def feed(self, data):
+        """Adds data that was received some other way, to be read in turn"""
+        self._buf += data
+
+    def read_lines(self, count):
+        """Reads up to `count` lines, fewer only if the stream ended"""
+        lines = []
+        while len(lines) < count:
+            line = self.readline()
+            if line is None:
+                break
+            lines.append(line)
+        return lines
+
+    @property
+    def buffered(self):
+        """The number of bytes read but not yet returned"""
+        return len(self._buf) - self._start
+
+    def clear(self):
+        del self._buf[:]
+        self._start = self._scanned = 0
+
+
 class SslSocketWrapper(object):
-    _MAX_FAILURES = 3
+    _PEEK_SIZE = 4096
+    _CONNECT_TIMEOUT = 5
+
+    sessions = SessionCache()
+    """TLS sessions for resumption, shared by all connections"""
 
     def __init__(self, hostname, port=9090,
                  ca_file=None, cert_file=None,
-                 verify_hostname=False):
+                 verify_hostname=False, context=None, timeout=None,
+                 deadline=None):
 
         self.hostname = hostname
         self.port = port
-        self.failures = 0
-        context = ssl.SSLContext(ssl.PROTOCOL_TLSv1)
-        self.__harden_context(context)
-        try:
-            if ca_file:
-                context.load_verify_locations(ca_file)
-            if cert_file:
-                context.verify_mode = ssl.CERT_REQUIRED
-                context.check_hostname = verify_hostname
-                context.load_cert_chain(cert_file)
-        except ssl.SSLError as e:
-            print_d("Problem with Cert/CA (+key) files (%s). "
-                    "Does it include the private key?" % e)
-            raise e
-        except IOError as e:
-            print_d("Problem loading Cert/CA files at %s or %s (%s)" %
-                    (ca_file, cert_file, e))
-            raise e
-
-        self._ssl_sock = context.wrap_socket(socket.socket(),
-                                             server_hostname=hostname)
+        self.timeout = timeout or self._CONNECT_TIMEOUT
+        """Seconds to allow for connecting (including the TLS handshake)"""
+        self.authenticated = False
+        """Whether a CLI login has succeeded on this connection"""
+        self.multiplexer = None
+        """What's matching up responses on this connection, if anything"""
+        self.context = context or create_context(ca_file, cert_file,
+                                                 verify_hostname)
+        self._ssl_sock = None
+        self._reader = None
+        self._expires = None
+        self.is_connected = False
+        self.connect(deadline)
+
+    @property
+    def _session_key(self):
+        return self.hostname, self.port
+
+    def connect(self, deadline=None):
+        """(Re)connects to the server, using the existing TLS context,
+        and resuming any previous TLS session with it.
+        Each step takes no longer than `timeout`, nor past any deadline.
+
+        :type deadline Deadline
+        """
+        deadline = deadline or Deadline()
+        kwargs = {"server_hostname": self.hostname}
+        session = self.sessions.get(self._session_key)
+        if session is not None:
+            kwargs["session"] = session
+        sock = socket.socket()
         try:
-            self._ssl_sock.connect((hostname, port))
-        except (ssl.SSLError, socket.gaierror):
+            sock.settimeout(self._timeout_within(deadline))
+            sock.connect((self.hostname, self.port))
+            start = time.time()
+            try:
+                sock.settimeout(self._timeout_within(deadline))
+                self._ssl_sock = self.context.wrap_socket(sock, **kwargs)
+            except ValueError as e:
+                # Sessions are only valid for the context that made them.
+                # The failed wrap has taken (and closed) the socket, too.
+                print_d("Can't resume TLS session (%s)" % e)
+                self.sessions.discard(self._session_key)
+                kwargs.pop("session")
+                session = None
+                sock = socket.socket()
+                sock.settimeout(self._timeout_within(deadline))
+                sock.connect((self.hostname, self.port))
+                start = time.time()
+                sock.settimeout(self._timeout_within(deadline))
+                self._ssl_sock = self.context.wrap_socket(sock, **kwargs)
+        except (ssl.SSLError, socket.gaierror, socket.timeout) as e:
+            sock.close()
+            if _is_timeout(e):
+                raise Timeout("Timed out connecting to %s" % self)
             print_w("Couldn't connect to %s with TLS" % (self,))
             raise
+        secs = time.time() - start
+        resumed = bool(getattr(self._ssl_sock, "session_reused", False))
+        self.sessions.record(secs, session is not None, resumed)
+        self.sessions.put(self._session_key,
+                          getattr(self._ssl_sock, "session", None))
+        print_d("%s handshake with %s took %.0f ms%s" %
+                (self._ssl_sock.version(), self, secs * 1000,
+                 " (resumed)" if resumed else ""))
         peer_cert = self._ssl_sock.getpeercert()
         if peer_cert is None:
             raise Error("No certificate configured at %s" % self)
@@ -69,38 +304,130 @@ class SslSocketWrapper(object):
             except Exception:
                 data = subject_data
             print_d("Validated cert for %s" % (data,))
+        self._reader = LineReader(self._recv)
+        self.authenticated = False
+        self.multiplexer = None
         self.is_connected = True
 
-    @staticmethod
-    def __harden_context(context):
-        # disallow ciphers with known vulnerabilities
-        context.set_ciphers(ssl._RESTRICTED_SERVER_CIPHERS)
-        # Prefer the server's ciphers by default so that we get stronger
-        # encryption
-        context.options |= getattr(_ssl, "OP_CIPHER_SERVER_PREFERENCE", 0)
-        # Use single use keys in order to improve forward secrecy
-        context.options |= getattr(_ssl, "OP_SINGLE_DH_USE", 0)
-        context.options |= getattr(_ssl, "OP_SINGLE_ECDH_USE", 0)
-
-    def communicate(self, data, wait=True):
-        eof = False
-        response = ''
-        num_lines = data.count("\n")
+    def _timeout_within(self, deadline):
+        """The seconds to allow for the next step of connecting
+        :raises socket.timeout if the deadline has already passed"""
+        timeout = deadline.timeout(self.timeout)
+        if timeout <= 0:
+            raise socket.timeout("timed out")
+        return timeout
+
+    def close(self):
+        """Closes the connection, if open. It can be re-opened with connect"""
+        self.is_connected = False
+        self.authenticated = False
+        if self._ssl_sock is not None:
+            # With TLS 1.3, resumable sessions only arrive after the
+            # handshake, so this is the best one to remember
+            self.sessions.put(self._session_key,
+                              getattr(self._ssl_sock, "session", None))
+            try:
+                self._ssl_sock.close()
+            except (socket.error, ssl.SSLError) as e:
+                print_d("Problem closing %s (%s)" % (self, e))
+            self._ssl_sock = None
+
+    def reconnect(self, deadline=None):
+        self.close()
+        self.connect(deadline)
+
+    def is_alive(self):
+        """A cheap, non-blocking check that an idle connection is still
+        usable - i.e. the peer hasn't hung up on us since we last used it.
+        Any data waiting (e.g. replies not waited for) is kept to be read,
+        so it still reaches whatever asked for it."""
+
+        if not self.is_connected or self._ssl_sock is None:
+            return False
         try:
+            readable, _, _ = select.select([self._ssl_sock], [], [], 0)
+        except (ValueError, socket.error):
+            return False
+        if not (readable or self._ssl_sock.pending()):
+            return True
+        timeout = self._ssl_sock.gettimeout()
+        try:
+            self._ssl_sock.setblocking(False)
+            data = self._ssl_sock.recv(self._PEEK_SIZE)
+        except ssl.SSLWantReadError:
+            # Only TLS housekeeping records (e.g. session tickets)
+            return True
+        except (socket.error, ssl.SSLError) as e:
+            print_d("Connection to %s is broken (%s)" % (self, e))
+            return False
+        finally:
+            self._ssl_sock.settimeout(timeout)
+        if not data:
+            print_d("Connection to %s was closed by the server" % self)
+            return False
+        print_d("Kept %d unread bytes from %s" % (len(data), self))
+        self._reader.feed(data)
+        return True
+
+    def _recv(self, size):
+        if self._expires is not None:
+            remaining = self._expires - time.time()
+            if remaining <= 0:
+                raise socket.timeout("timed out")
+            self._ssl_sock.settimeout(remaining)
+        return self._ssl_sock.recv(size)
+
+    def send(self, data, timeout=None):
+        """Sends the data, returning whether that worked"""
+        try:
+            self._ssl_sock.settimeout(timeout)
             self._ssl_sock.sendall(data.encode('utf-8'))
-            if not wait:
-                return None
-            while not eof:
-                response += self._ssl_sock.recv().decode('utf-8')
-                eof = response.count("\n") == num_lines or not response
-            return response
+            return True
         except socket.error as e:
-            print_d("Couldn't communicate with Squeezebox (%s)" % e)
-            self.failures += 1
-            if self.failures >= self._MAX_FAILURES:
-                print_w("Too many Squeezebox failures. Disconnecting")
-                self.is_connected = False
+            self._failed(e, timeout)
+            return False
+
+    def readline(self, timeout=None):
+        """The next line received (without its newline),
+        or None if the connection failed or was closed"""
+        self._expires = None if timeout is None else time.time() + timeout
+        try:
+            line = self._reader.readline()
+        except socket.error as e:
+            self._failed(e, timeout)
+            return None
+        if line is None:
+            print_w("%s closed the connection" % self)
+            self.close()
+        return line
+
+    def _failed(self, e, timeout):
+        if _is_timeout(e):
+            # Any late response would be out of step with later requests
+            waited = "" if timeout is None else " within %.1fs" % timeout
+            print_w("Timed out waiting for %s%s" % (self, waited))
+            self.close()
+            raise Timeout("No response from %s%s" % (self, waited))
+        # Whether to try again (and when) is up to the caller's breaker
+        print_w("Couldn't communicate with %s (%s). Disconnecting"
+                % (self, e))
+        self.close()
+
+    def communicate(self, data, wait=True, timeout=None):
+        """Sends the data, then waits (for up to `timeout` seconds in total)
+        for as many lines of response as were sent"""
+        if not self.send(data, timeout=timeout):
+            return None
+        if not wait:
             return None
+        deadline = Deadline(timeout)
+        lines = []
+        for _ in range(data.count("\n")):
+            line = self.readline(timeout=deadline.remaining())
+            if line is None:
+                break
+            lines.append(line)
+        return "".join(line + "\n" for line in lines)
 
     def __str__(self):
         return "{hostname}:{port}".format(**self.__dict__)
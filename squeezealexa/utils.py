@@ -13,7 +13,7 @@
 from __future__ import print_function
 import random
 import re
-import string
+import time
 import unicodedata
 import sys
 
@@ -24,6 +24,45 @@ Unicode = unicode if PY2 else str
 print_d = print_w = print
 
 
+class Deadline(object):
+    """A point in time by which some work must be finished"""
+
+    def __init__(self, secs=None):
+        self.expires = None if secs is None else time.time() + secs
+
+    @classmethod
+    def from_context(cls, context, margin=0):
+        """The deadline for a Lambda invocation,
+        less `margin` seconds to respond in"""
+        try:
+            millis = context.get_remaining_time_in_millis()
+        except AttributeError:
+            return cls()
+        return cls(millis / 1000.0 - margin)
+
+    def remaining(self):
+        """Seconds left, or None if there's no deadline"""
+        if self.expires is None:
+            return None
+        return max(0.0, self.expires - time.time())
+
+    @property
+    def expired(self):
+        return self.expires is not None and time.time() >= self.expires
+
+    def timeout(self, limit=None):
+        """The time left, but no more than `limit` seconds"""
+        remaining = self.remaining()
+        if remaining is None:
+            return limit
+        return remaining if limit is None else min(limit, remaining)
+
+    def __str__(self):
+        remaining = self.remaining()
+        return ("no deadline" if remaining is None
+                else "%.1fs remaining" % remaining)
+
+
 def english_join(items, final="and"):
     """Like join, but in English (no Oxford commas...)"""
     items = list(filter(None, items))
@@ -66,66 +105,25 @@ def with_example(template, lst):
     return msg
 
 
-# from http://www.carlosble.com/2010/12/understanding-python-and-unicode/
-def get_unicode(str_or_unicode, encoding='utf-8'):
-    if isinstance(str_or_unicode, unicode):
-        return str_or_unicode
-    return unicode(str_or_unicode, encoding, errors='ignore')
-
-
-def get_string(str_or_unicode, encoding='utf-8'):
-    if isinstance(str_or_unicode, unicode):
-        return str_or_unicode.encode(encoding)
-    return str_or_unicode
-
-
-def strip_accents(text):
-    """
-    Strip accents from input string.
-
-    :param text: input string.
-    :type text: string or unicode.
-
-    :returns: processed string.
-    :rtype: String.
-    """
-    text = get_unicode(text)
-
-    text = unicodedata.normalize('NFD', text)
-    text = text.encode('ascii', 'ignore')
-
-    return get_string(text)
-
-
-def recover_key(my_dict, value):
-    """recover the key from the dictionary value"""
-    for a_key in my_dict.keys():
-        if my_dict[a_key] == value:
-            return a_key
-    return None
-
-
-def sanitize_4(user_input, stop_words):
-    """sanitize using standard list comprehension"""
-    return [w for w in user_input if w.lower() not in stop_words]
+def fold(text):
+    """Lower-cased unicode, without accents, for matching names as LMS's
+    searches do (e.g. "Ólafur" matches "olafur")"""
+    if not isinstance(text, Unicode):
+        text = text.decode('utf-8', 'ignore')
+    return u"".join(c for c in unicodedata.normalize('NFD', text)
+                    if not unicodedata.combining(c)).lower()
 
 
-def remove_stop_words(original_s):
-    """remove punctuation"""
-    s2 = original_s.translate(None, string.punctuation)
-    # print_d("s2 (no punct): '%s'" % s2)
+STOP_WORDS = ["a", "an", "the", "on", "in",
+              "of", "at", "by", "to", "for", "from"]
 
-    # split
-    user_input = s2.split(" ")
-    stop_words = ["a", "an", "the", "on", "in",
-                  "of", "at", "by", "to", "for", "from"]
 
-    # sanitize
-    s1 = sanitize_4(user_input, stop_words)
+_PUNCTUATION = re.compile(r"[^\w\s]+", re.UNICODE)
 
-    # rejoin
-    s3 = " ".join(s1)
-    # print_d("(sanitize_4): '%s'" % s3)
 
-    return s3
-    pass
+def simplified(text):
+    """Folded text (see `fold`), with punctuation as spaces, and without
+    stop words (unless that's all it is), for scoring how alike names are
+    (e.g. "I'm Not in Love" is "i m not love")"""
+    words = _PUNCTUATION.sub(u" ", fold(text)).split()
+    return u" ".join([w for w in words if w not in STOP_WORDS] or words)
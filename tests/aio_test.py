@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+#
+#   Copyright 2017 Nick Boultbee
+#   This file is part of squeeze-alexa.
+#
+#   squeeze-alexa is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   See LICENSE for full license
+
+import pytest
+
+from squeezealexa.utils import PY2
+
+if PY2:
+    pytest.skip("asyncio needs Python 3", allow_module_level=True)
+
+import asyncio
+import time
+
+from squeezealexa.squeezebox.aio import AsyncConnection, AsyncServer
+from squeezealexa.squeezebox.cache import ResponseCache
+from squeezealexa.squeezebox.server import Server, SqueezeboxTimeout
+from squeezealexa.ssl_wrap import create_context
+from tests.helpers import CertificateTestCase, FakeClock
+from tests.simulator import Simulator, Library
+
+KITCHEN = "00:04:20:12:34:00"
+
+
+class AsyncServerTest(CertificateTestCase):
+    """Server commands as coroutines, against a simulated LMS over TLS"""
+
+    def setUp(self):
+        self.sim = Simulator(Library.generate(players=2), user="bob",
+                             password="s3cret", cert_file=self.cert_file,
+                             key_file=self.key_file).start()
+        self.addCleanup(self.sim.stop)
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.addCleanup(asyncio.set_event_loop, None)
+        self.addCleanup(self.loop.close)
+        self.connection = AsyncConnection("127.0.0.1", self.sim.port,
+                                          context=create_context())
+        # Closing finishes once the loop's run again
+        self.addCleanup(self.wait_for, asyncio.sleep(0.01))
+        self.addCleanup(self.connection.close)
+        self.clock = FakeClock()
+        server = Server(user="bob", password="s3cret",
+                        cache=ResponseCache(Server._CACHE_TTLS,
+                                            clock=self.clock))
+        self.server = self.wait_for(
+            AsyncServer.create(self.connection, server=server))
+
+    def wait_for(self, coro):
+        return self.loop.run_until_complete(coro)
+
+    def received(self):
+        return [t[2] for t in self.sim.traffic if t[1] == "recv"]
+
+    def test_players(self):
+        assert self.connection.authenticated
+        assert self.server.server.player_names == {"Kitchen", "Living Room"}
+        assert self.server.server.cur_player_id == KITCHEN
+
+    def test_commands(self):
+        self.wait_for(self.server.play_album_with_id(7000001))
+        now = self.wait_for(self.server.get_now_playing())
+        assert (now.title, now.album) == ("Track 1", "Album 0 by Artist 0")
+        self.wait_for(self.server.pause())
+        assert self.wait_for(self.server.is_stopped())
+        assert self.received()[-2:] == ["%s pause 1" % KITCHEN,
+                                        "%s mode ?" % KITCHEN]
+
+    def test_overlapping_queries(self):
+        self.sim.latency = 0.3
+        start = time.time()
+        stopped = self.wait_for(asyncio.gather(
+            *[self.server.is_stopped(player_id=pid)
+              for pid in self.server.server.players]))
+        # Each takes 0.3s to answer, but they're all asked at once
+        assert time.time() - start < 0.55
+        assert stopped == [True, True]
+
+    def test_follow_up_commands(self):
+        assert self.wait_for(self.server.rescan()) == ""
+        assert self.received()[-2:] == ["%s rescan ?" % KITCHEN, "rescan"]
+
+    def test_listings_shared_with_cache(self):
+        albums, artists = self.wait_for(asyncio.gather(
+            self.server.get_albums_with_artist_id(10000001),
+            self.server.get_artists_with_search_term("Artist 1", limit=2)))
+        assert albums[0].name == "Album 0 by Artist 1"
+        assert len(artists) == 2
+        assert len(self.server.server.cache) == 2
+        self.wait_for(self.server.get_albums_with_artist_id(10000001))
+        assert len([line for line in self.received()
+                    if " albums " in line]) == 1
+
+    def test_timeout(self):
+        self.sim.delays = {"mode": 0.3}
+        self.server.server._TIMEOUTS = {"mode": 0.1}
+        with pytest.raises(SqueezeboxTimeout):
+            self.wait_for(self.server.is_stopped())
+        assert not self.connection.is_connected
+        # ...until it's reconnected, when next needed
+        assert self.wait_for(self.server.get_genres())[0].name == "Rock"
+
+    def test_only_commands(self):
+        with pytest.raises(AttributeError):
+            self.server.refresh
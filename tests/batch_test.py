@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+#
+#   Copyright 2017 Nick Boultbee
+#   This file is part of squeeze-alexa.
+#
+#   squeeze-alexa is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   See LICENSE for full license
+
+from unittest import TestCase
+
+import pytest
+
+from squeezealexa.squeezebox.batch import Batch, BatchPending, Future, then
+
+
+class FutureTest(TestCase):
+
+    def test_result(self):
+        future = Future()
+        with pytest.raises(BatchPending):
+            future.result()
+        future.set_result("play")
+        assert future.done
+        assert future.result() == "play"
+
+    def test_then(self):
+        future = Future()
+        stopped = future.then(lambda mode: mode != "play")
+        future.set_result("pause")
+        assert stopped.result() is True
+
+    def test_gather(self):
+        futures = [Future(), Future()]
+        both = then(futures, lambda r: dict(zip("ab", r)))
+        futures[1].set_result("2")
+        assert not both.done
+        futures[0].set_result("1")
+        assert both.result() == {"a": "1", "b": "2"}
+
+    def test_then_without_futures(self):
+        assert then("pause", lambda mode: mode != "play") is True
+
+
+class BatchTest(TestCase):
+
+    def test_one_request(self):
+        requests = []
+
+        def request(lines, raw=False):
+            requests.append(lines)
+            return ["play", "Moody%20Bluez"]
+
+        batch = Batch(request)
+        mode, = batch.add(["ab:cd mode ?"])
+        title, = batch.add(["ab:cd title ?"])
+        assert len(batch) == 2
+        batch.send()
+        assert requests == [["ab:cd mode ?", "ab:cd title ?"]]
+        assert mode.result() == "play"
+        assert title.result() == "Moody Bluez"
+
+    def test_failure(self):
+        def request(lines, raw=False):
+            raise IOError("Connection reset")
+
+        batch = Batch(request)
+        mode, = batch.add(["ab:cd mode ?"])
+        with pytest.raises(IOError):
+            batch.send()
+        with pytest.raises(IOError):
+            mode.result()
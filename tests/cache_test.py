@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+#
+#   Copyright 2017 Nick Boultbee
+#   This file is part of squeeze-alexa.
+#
+#   squeeze-alexa is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   See LICENSE for full license
+
+from unittest import TestCase
+
+from squeezealexa.squeezebox.cache import ResponseCache
+from tests.helpers import FakeClock
+
+
+class ResponseCacheTest(TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.cache = ResponseCache({"albums": 10, "genres": 60},
+                                   stale_for=20, clock=self.clock)
+
+    def test_key_normalized(self):
+        key = ResponseCache.key_for
+        assert key("ab:cd albums 0 255 search:Foo tags:lay") == \
+            key("albums 0 255 tags:lay search%3Afoo")
+        assert key("albums 0 255") != key("albums 255 255")
+
+    def test_hit(self):
+        self.cache.put("albums 0 255 search:x", "id%3A1 count%3A1")
+        assert self.cache.get("ab:cd albums 0 255 search:X") == \
+            ("id%3A1 count%3A1", False)
+        assert self.cache.hits == 1
+
+    def test_uncached_commands(self):
+        self.cache.put("ab:cd mode ?", "play")
+        assert not len(self.cache)
+        assert self.cache.get("ab:cd mode ?") == (None, False)
+        assert not self.cache.misses
+
+    def test_stale_while_revalidate(self):
+        self.cache.put("albums 0 255", "old")
+        self.clock.now += 15
+        assert self.cache.get("albums 0 255") == ("old", True)
+        # Only one caller needs to revalidate it
+        assert self.cache.get("albums 0 255") == ("old", False)
+        self.cache.put("albums 0 255", "new")
+        assert self.cache.get("albums 0 255") == ("new", False)
+
+    def test_expires(self):
+        self.cache.put("albums 0 255", "old")
+        self.cache.put("genres 0 255", "genres")
+        self.clock.now += 31
+        assert self.cache.get("albums 0 255") == (None, False)
+        assert self.cache.get("genres 0 255") == ("genres", False)
+
+    def test_lru_eviction(self):
+        cache = ResponseCache({"albums": 10}, max_bytes=100)
+        cache.put("albums 0 1", "a" * 40)
+        cache.put("albums 1 1", "b" * 40)
+        cache.get("albums 0 1")
+        cache.put("albums 2 1", "c" * 40)
+        assert "albums 0 1" in cache
+        assert "albums 1 1" not in cache
+        assert cache.size <= 100
+
+    def test_invalidate(self):
+        self.cache.put("albums 0 255", "old")
+        self.cache.invalidate()
+        assert not len(self.cache)
+        assert not self.cache.size
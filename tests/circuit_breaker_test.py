@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+#
+#   Copyright 2017 Nick Boultbee
+#   This file is part of squeeze-alexa.
+#
+#   squeeze-alexa is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   See LICENSE for full license
+
+import threading
+from unittest import TestCase
+
+import pytest
+
+from squeezealexa.circuit_breaker import CircuitBreaker, CircuitOpenError
+from tests.helpers import FakeClock
+
+
+class CircuitBreakerTest(TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.breaker = CircuitBreaker(max_failures=2, base_delay=10,
+                                      max_delay=30, clock=self.clock,
+                                      rand=lambda: 0.0)
+
+    def fail(self, times=1):
+        for _ in range(times):
+            assert self.breaker.allow()
+            self.breaker.failed()
+
+    def test_opens_after_consecutive_failures(self):
+        self.fail()
+        self.breaker.succeeded()
+        self.fail()
+        assert self.breaker.state == CircuitBreaker.CLOSED
+        self.fail()
+        assert self.breaker.state == CircuitBreaker.OPEN
+        assert not self.breaker.allow()
+        with pytest.raises(CircuitOpenError) as excinfo:
+            self.breaker.check()
+        assert excinfo.value.retry_in == 10
+
+    def test_half_open_probe(self):
+        self.fail(2)
+        self.clock.now += 10
+        assert self.breaker.state == CircuitBreaker.HALF_OPEN
+        assert self.breaker.allow()
+        # Only the one probe at a time...
+        others = []
+        other = threading.Thread(
+            target=lambda: others.append(self.breaker.allow()))
+        other.start()
+        other.join()
+        assert others == [False]
+        # ...though checks made while probing (e.g. connecting) are part of it
+        assert self.breaker.allow()
+        self.breaker.succeeded()
+        assert self.breaker.state == CircuitBreaker.CLOSED
+        assert self.breaker.trips == 0
+
+    def test_backoff_doubles_to_limit(self):
+        self.fail(2)
+        delays = [self.breaker.retry_in]
+        for _ in range(3):
+            self.clock.now += self.breaker.retry_in
+            self.fail()
+            delays.append(self.breaker.retry_in)
+        assert delays == [10, 20, 30, 30]
+
+    def test_jitter_shortens_delay(self):
+        breaker = CircuitBreaker(max_failures=1, base_delay=10,
+                                 jitter=0.5, clock=self.clock,
+                                 rand=lambda: 1.0)
+        breaker.failed()
+        assert breaker.retry_in == 5
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+#
+#   Copyright 2017 Nick Boultbee
+#   This file is part of squeeze-alexa.
+#
+#   squeeze-alexa is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   See LICENSE for full license
+
+import time
+
+import pytest
+
+from squeezealexa.squeezebox.group import ServerGroup
+from squeezealexa.squeezebox.server import Server, SqueezeboxException
+from squeezealexa.ssl_wrap import SslSocketWrapper
+from tests.helpers import CertificateTestCase
+from tests.simulator import Simulator, Library
+
+HOUSE = "00:04:20:12:34:00"
+BARN = "00:04:20:99:00:01"
+
+
+class ServerGroupTest(CertificateTestCase):
+    """Two simulated LMS instances, one per building"""
+
+    def setUp(self):
+        house = Library.generate(players=1, genres=("Rock", "Jazz"))
+        barn = Library.generate(players=1, genres=("Jazz", "Folk"),
+                                artists=3)
+        barn.players = [(BARN, "Barn")]
+        self.sims = [self.simulate(house), self.simulate(barn)]
+        self.group = ServerGroup([self.server_for(sim) for sim in self.sims])
+
+    def simulate(self, library):
+        sim = Simulator(library, cert_file=self.cert_file,
+                        key_file=self.key_file, delays={"genres": 0.5})
+        self.addCleanup(sim.stop)
+        return sim.start()
+
+    def server_for(self, sim):
+        def connect():
+            ssl = SslSocketWrapper("127.0.0.1", sim.port)
+            self.addCleanup(ssl.close)
+            return ssl
+        return Server(connect=connect)
+
+    def received(self, sim):
+        return [line for _, direction, line in sim.traffic
+                if direction == "recv"]
+
+    def test_merges_players(self):
+        assert set(self.group.players) == {HOUSE, BARN}
+        assert self.group.player_names == {"Kitchen", "Barn"}
+        assert self.group.cur_player_id == HOUSE
+
+    def test_players_merged_once(self):
+        players = self.group.players
+        self.group.pause(player_id=BARN)
+        assert self.group.players is players
+        self.group.refresh_status()
+        assert self.group.players is not players
+        assert set(self.group.players) == set(players)
+
+    def test_routes_by_player(self):
+        self.group.play_album_with_id(7000001, player_id=BARN)
+        self.group.pause(player_id=BARN)
+        self.group.flush()
+        # Sent, but only surely handled once a later request is answered
+        self.group.refresh_status()
+        assert self.sims[1].players[BARN].mode == "pause"
+        assert self.sims[0].players[HOUSE].mode == "stop"
+        assert not any(BARN in line for line in self.received(self.sims[0]))
+        assert self.group.get_now_playing(player_id=BARN).player_name == \
+            "Barn"
+
+    def test_default_player(self):
+        self.group.cur_player_id = BARN
+        self.group.play_album_with_id(7000001)
+        assert not self.group.is_stopped()
+        assert self.sims[1].players[BARN].mode == "play"
+
+    def test_unknown_player(self):
+        with pytest.raises(SqueezeboxException):
+            self.group.pause(player_id="00:00:00:00:00:00")
+
+    def test_library_queries_fan_out(self):
+        start = time.time()
+        assert self.group.genres == ["Rock", "Jazz", "Folk"]
+        # Both servers take 0.5s to answer, but are asked at once
+        assert time.time() - start < 0.9
+        assert self.group.get_info_total("artists") == 53
+
+    def test_all_power(self):
+        self.group.set_all_power(on=False)
+        self.group.flush()
+        self.group.refresh_status()
+        assert [sim.players[pid].power for sim, pid in
+                zip(self.sims, [HOUSE, BARN])] == [0, 0]
+
+    def test_one_server_down(self):
+        self.sims[1].stop()
+        assert self.group.genres == ["Rock", "Jazz"]
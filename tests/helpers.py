@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+#
+#   Copyright 2017 Nick Boultbee
+#   This file is part of squeeze-alexa.
+#
+#   squeeze-alexa is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   See LICENSE for full license
+
+"""Fixtures shared by several tests"""
+
+import shutil
+import tempfile
+from unittest import TestCase
+
+import pytest
+
+from tests.simulator import make_certificate
+
+
+class FakeClock(object):
+    """Only moves on when `now` is changed"""
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class CertificateTestCase(TestCase):
+    """Makes a self-signed certificate (and key) once per class,
+    e.g. for Simulators, in a temporary `dir`, skipping if that fails"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.dir = tempfile.mkdtemp()
+        try:
+            cls.cert_file, cls.key_file = make_certificate(cls.dir)
+        except (OSError, Exception) as e:
+            shutil.rmtree(cls.dir)
+            pytest.skip("Can't make a certificate (%s)" % e)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.dir)
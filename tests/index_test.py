@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+#
+#   Copyright 2017 Nick Boultbee
+#   This file is part of squeeze-alexa.
+#
+#   squeeze-alexa is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   See LICENSE for full license
+
+from unittest import TestCase
+
+import pytest
+
+from squeezealexa.squeezebox.index import LibraryIndex
+from squeezealexa.squeezebox.records import Artist
+from squeezealexa.squeezebox.server import Server, SqueezeboxScanning
+from squeezealexa.ssl_wrap import SslSocketWrapper
+from tests.helpers import CertificateTestCase
+from tests.simulator import Simulator, Library
+
+
+class LibraryIndexTest(CertificateTestCase):
+
+    def setUp(self):
+        library = Library.generate(players=1, artists=20)
+        library.artists.append((10000099, u"Ólafur Arnalds"))
+        library.albums.append({"id": 7000999, "album": u"Living Room Songs",
+                               "year": 2011, "artist_id": 10000099,
+                               "artist": u"Ólafur Arnalds"})
+        self.sim = Simulator(library, cert_file=self.cert_file,
+                             key_file=self.key_file).start()
+        self.addCleanup(self.sim.stop)
+        self.ssl = SslSocketWrapper("127.0.0.1", self.sim.port)
+        self.addCleanup(self.ssl.close)
+        self.now = 1000.0
+        self.index = LibraryIndex(Server(self.ssl), check_secs=60,
+                                  clock=lambda: self.now)
+
+    def requested(self):
+        return [line for _, direction, line in self.sim.traffic
+                if direction == "recv"]
+
+    def listings(self):
+        return [line.split(" ")[0] for line in self.requested()
+                if line.split(" ")[0] in LibraryIndex._LISTINGS]
+
+    def test_searches_from_memory(self):
+        found = self.index.artists_matching("artist 1")
+        assert [a.name for a in found][:2] == ["Artist 1", "Artist 10"]
+        before = len(self.requested())
+        assert self.index.artists_matching("ARTIST 19")[0].id == 10000019
+        assert not self.index.artists_matching("artist 1 nope")
+        assert len(self.requested()) == before
+        assert self.listings() == ["artists"]
+
+    def test_not_cached_twice(self):
+        self.index.artists_matching("artist")
+        assert not len(self.index.server.cache)
+
+    def test_ignores_accents(self):
+        olafur, = self.index.artists_matching("olafur")
+        assert olafur.name == u"Ólafur Arnalds"
+        album, = self.index.albums_by(olafur.id)
+        assert (album.name, album.year) == (u"Living Room Songs", 2011)
+        assert self.index.albums_matching("living songs") == [album]
+
+    def test_like(self):
+        olafur, = self.index.artists_like("olaf arnolds", limit=1)
+        assert olafur.name == u"Ólafur Arnalds"
+        found = self.index.artists_like("artist 19", limit=3)
+        assert [a.name for a in found] == \
+            ["Artist 19", "Artist 1", "Artist 10"]
+        album = self.index.albums_like("living room song")[0]
+        assert album.name == u"Living Room Songs"
+        assert not self.index.albums_like("zzz")
+
+    def test_sounding_like(self):
+        olafur, = self.index.artists_sounding_like("olafur arnolds")
+        assert olafur.name == u"Ólafur Arnalds"
+        assert self.index.artists_like("olafur arnolds", limit=1) == [olafur]
+        album, = self.index.albums_sounding_like("living rume songz")
+        assert album.name == u"Living Room Songs"
+        assert not self.index.albums_sounding_like("chopin")
+
+    def test_names_normalised_once(self):
+        self.index.artists_matching("olafur")
+        self.index.albums_by(10000099)
+        forms = self.index._forms[u"Ólafur Arnalds"]
+        assert forms == (u"olafur arnalds", u"olafur arnalds")
+        assert self.index.folded(u"Ólafur Arnalds") is forms[0]
+        assert self.index.simplified(u"Living Room Songs") == \
+            u"living room songs"
+        assert self.index.simplified(u"Not loaded: The Album") == \
+            u"not loaded album"
+
+    def test_albums_by_artist(self):
+        albums = self.index.albums_by(10000003)
+        assert sorted(a.name for a in albums) == \
+            ["Album %d by Artist 3" % i for i in range(4)]
+        assert all(a.contributors == (10000003,) for a in albums)
+        assert self.index.albums_by(12345) == []
+
+    def test_albums_by_year(self):
+        albums = self.index.albums_by(10000001, 10000099, 10000001)
+        assert len(albums) == 5
+        assert [a.year for a in albums] == sorted(a.year for a in albums)
+        assert u"Living Room Songs" in [a.name for a in albums]
+
+    def test_reloads_only_what_changed(self):
+        self.index.artists_matching("artist")
+        self.index.albums_by(10000001)
+        self.sim.library.albums.append(
+            {"id": 7001000, "album": u"New One", "year": 2017,
+             "artist_id": 10000001, "artist": u"Artist 1"})
+        assert len(self.index.albums_by(10000001)) == 4
+        self.now += 61
+        assert len(self.index.albums_by(10000001)) == 5
+        assert self.listings() == ["artists", "albums", "albums"]
+
+    def test_rescan_reloads_everything(self):
+        assert self.index.genre_names[0] == "Rock"
+        self.index.albums_by(10000001)
+        self.sim.last_scan += 1
+        self.now += 61
+        self.index.albums_by(10000001)
+        assert sorted(self.listings()) == \
+            ["albums", "albums", "genres", "genres"]
+
+    def test_scanning(self):
+        self.sim.scanning = True
+        with pytest.raises(SqueezeboxScanning):
+            self.index.artists_matching("artist")
+        self.sim.scanning = False
+        assert self.index.artists_matching("artist 2")
+        self.sim.scanning = True
+        self.sim.last_scan += 1
+        self.now += 61
+        # Still usable, as it was
+        assert self.index.artists_matching("artist 2")
+        assert self.index.version[0] != str(self.sim.last_scan)
+
+
+class LikeTest(TestCase):
+    """Shortlisting, from an index loaded by hand"""
+
+    def setUp(self):
+        def connect():
+            raise AssertionError("Tried to connect to the server")
+
+        self.index = LibraryIndex(Server(connect=connect))
+        names = [u"Toto", u"Tata", u"Tate", u"Dido", u"Teddy", u"Tut",
+                 u"Tito Puente", u"Tito & Tarantula"]
+        self.index.artists = {i: Artist(i, name)
+                              for i, name in enumerate(names)}
+        self.index.loaded.add("artists")
+        self.index._build()
+
+    def names(self, term, limit):
+        return [a.name for a in self.index.artists_like(term, limit=limit)]
+
+    def test_sound_alikes_dont_crowd_out_the_rest(self):
+        found = self.names("tito", limit=4)
+        assert len(found) == 4
+        assert {u"Tito Puente", u"Tito & Tarantula"} <= set(found)
+        # The ones sounding like it that are most like it, too
+        assert found[0] == u"Toto"
+
+    def test_all_when_room(self):
+        assert len(self.names("tito", limit=50)) == 8
@@ -76,6 +76,11 @@ class IntegrationTests(TestCase):
         assert self.stub.lines == [resp('pause 1', pid=SOME_PID),
                                    resp('pause 0 1', pid=SOME_PID)]
 
+    def test_change_song_batched(self):
+        self.stub.change_song("foo bar.mp3")
+        assert self.stub.lines == [resp('playlist clear'),
+                                   resp('playlist insert foo%20bar.mp3')]
+
     def test_on_random_mix_trickier(self):
         self.stub._genres = GENRES
         intent = {'slots': {'primaryGenre': {'value': 'Jungle band Blues'},
@@ -26,15 +26,22 @@ class FakeSsl(SslSocketWrapper):
         self.is_connected = True
         self.player_name = fake_name
         self.player_id = fake_id
+        self.responses = []
 
-    def communicate(self, data, wait=True):
+    def send(self, data, timeout=None):
         print_d("Faking server status...")
-        stripped = data.rstrip('\n')
-        if data.startswith('serverstatus'):
-            return ('{orig} player%20count:1 playerid:{pid} name:{name}\n'
-                    .format(orig=stripped, name=self.player_name,
+        for line in data.splitlines():
+            if line.startswith('serverstatus'):
+                self.responses.append(
+                    '{orig} player%20count:1 playerid:{pid} name:{name}'
+                    .format(orig=line, name=self.player_name,
                             pid=self.player_id))
-        return stripped + ' OK\n'
+            else:
+                self.responses.append(line + ' OK')
+        return True
+
+    def readline(self, timeout=None):
+        return self.responses.pop(0) if self.responses else None
 
 
 class AllIntentHandlingTest(TestCase):
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+#
+#   Copyright 2017 Nick Boultbee
+#   This file is part of squeeze-alexa.
+#
+#   squeeze-alexa is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   See LICENSE for full license
+
+from unittest import TestCase
+
+from squeezealexa.squeezebox.listener import LiveState, Listener
+from squeezealexa.squeezebox.server import Server
+from squeezealexa.ssl_wrap import SslSocketWrapper
+from tests.helpers import CertificateTestCase
+from tests.simulator import Simulator, Library
+
+STATUS = ("serverstatus 0 99 lastscan%3A1 player%20count%3A1 "
+          "playerid%3Aab%3Acd name%3AKitchen power%3A1 connected%3A1")
+PLAYER_STATUS = ("ab%3Acd status - 1 tags%3Aal player_name%3AKitchen "
+                 "player_connected%3A1 power%3A1 mode%3Aplay "
+                 "mixer%20volume%3A40 title%3ALit artist%3AKiasmos "
+                 "album%3AKiasmos")
+
+
+class LiveStateTest(TestCase):
+
+    def setUp(self):
+        self.state = LiveState()
+        self.state.connected = True
+
+    def test_loads_players_then_statuses(self):
+        assert self.state.handle(STATUS) == ["ab:cd status - 1 tags:al"]
+        assert not self.state.live
+        assert self.state.handle(PLAYER_STATUS) == []
+        assert self.state.live
+        status = self.state.status("ab:cd")
+        assert (status.mode, status.volume, status.title) == \
+            ("play", 40, "Lit")
+        assert self.state.players["ab:cd"].name == "Kitchen"
+
+    def test_loads_players_by_page(self):
+        first = STATUS.replace("count%3A1", "count%3A100")
+        assert self.state.handle(first) == ["serverstatus 99 99",
+                                            "ab:cd status - 1 tags:al"]
+        assert not self.state.players
+        assert self.state.handle(
+            "serverstatus 99 99 player%20count%3A100 playerid%3Aef%3Agh "
+            "name%3ABarn power%3A0 connected%3A1") == \
+            ["ef:gh status - 1 tags:al"]
+        assert sorted(self.state.players) == ["ab:cd", "ef:gh"]
+
+    def test_notifications(self):
+        self.state.handle(STATUS)
+        self.state.handle(PLAYER_STATUS)
+        status = self.state.status("ab:cd")
+        self.state.handle("ab%3Acd pause 1")
+        assert status.mode == "pause"
+        self.state.handle("ab%3Acd mixer volume 55")
+        assert status.volume == 55
+        self.state.handle("ab%3Acd power 0")
+        assert status.power is False
+        assert self.state.handle("ab%3Acd playlist newsong Swayed 3") == \
+            ["ab:cd status - 1 tags:al"]
+        assert (status.mode, status.title) == ("play", "Swayed")
+
+    def test_relative_volume_queried(self):
+        assert self.state.handle("ab%3Acd mixer volume %2B10") == \
+            ["ab:cd mixer volume ?"]
+
+    def test_new_client_reloads(self):
+        self.state.handle(STATUS)
+        assert self.state.handle("ef%3Agh client new") == \
+            ["serverstatus 0 99"]
+
+    def test_counts_rescans(self):
+        assert self.state.handle("rescan done") == []
+        self.state.handle("rescan 1")
+        assert self.state.rescans == 1
+
+    def test_ignores_others(self):
+        assert self.state.handle("login bob ******") == []
+        assert self.state.handle("subscribe mixer%2Cpower") == []
+        assert not self.state.players
+
+
+class ListenerTest(CertificateTestCase):
+    """A Listener following a simulated LMS, over TLS"""
+
+    def setUp(self):
+        self.sim = Simulator(Library.generate(players=2), user="bob",
+                             password="s3cret", cert_file=self.cert_file,
+                             key_file=self.key_file).start()
+        self.addCleanup(self.sim.stop)
+
+        def connect():
+            return SslSocketWrapper("127.0.0.1", self.sim.port)
+
+        self.listener = Listener(connect, user="bob", password="s3cret",
+                                 retry_secs=0.1).start()
+        self.addCleanup(self.listener.stop)
+        self.state = self.listener.state
+        assert self.state.wait(lambda s: s.live, timeout=5)
+        self.ssl = connect()
+        self.addCleanup(self.ssl.close)
+        self.server = Server(self.ssl, user="bob", password="s3cret",
+                             state=self.state)
+
+    def received(self):
+        return [t for t in self.sim.traffic if t[1] == "recv"]
+
+    def test_answers_from_memory(self):
+        before = len(self.received())
+        assert self.server.player_names == {"Kitchen", "Living Room"}
+        self.server.refresh_status()
+        now = self.server.get_now_playing(player_id="00:04:20:12:34:00")
+        assert len(self.received()) == before
+        assert now.title is None
+        assert now.player_name == "Kitchen"
+        assert now.mode == "stop"
+
+    def test_follows_changes(self):
+        pid = self.server.cur_player_id
+        self.server.play_album_with_id(7000001)
+        self.server.change_volume(10)
+        self.server.flush()
+        status = self.state.status(pid)
+        playing = (60, "Album 0 by Artist 0")
+        assert self.state.wait(
+            lambda s: (status.volume, status.album) == playing, timeout=5)
+        assert status.mode == "play"
+        assert status.title == "Track 1"
+        self.server.pause()
+        self.server.flush()
+        assert self.state.wait(lambda s: status.mode == "pause", timeout=5)
+        now = self.server.get_now_playing()
+        assert now.artist == "Artist 0"
+        assert now.mode == "pause"
+
+    def test_rescan_invalidates(self):
+        subscribed, = [t[2] for t in self.received()
+                       if t[2].startswith("subscribe")]
+        assert "rescan" in subscribed.split(" ")[1].split(",")
+        self.server.get_genres()
+        assert len(self.server.cache)
+        self.state.handle("rescan done")
+        self.server.refresh_status()
+        assert not len(self.server.cache)
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+#
+#   Copyright 2017 Nick Boultbee
+#   This file is part of squeeze-alexa.
+#
+#   squeeze-alexa is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   See LICENSE for full license
+
+from unittest import TestCase
+
+from squeezealexa.matching import PhoneticIndex, TrigramIndex, sounds, \
+    trigrams
+from squeezealexa.utils import fold
+
+NAMES = [u"hans zimmer", u"alvin risk & hans zimmer", u"the zombies",
+         u"olafur arnalds", u"nils frahm & olafur arnalds", u"arnold",
+         u"ólafur"]
+
+
+class TrigramsTest(TestCase):
+
+    def test_words_padded(self):
+        assert trigrams(u"ab") == {u"  a", u" ab", u"ab "}
+        assert trigrams(u"a-b") == {u"  a", u" a ", u"  b", u" b "}
+        assert trigrams(u"  ") == set()
+
+    def test_unicode(self):
+        assert u"ól" in {g.strip() for g in trigrams(u"ólafur")}
+
+
+class SoundsTest(TestCase):
+
+    def same(self, heard, name):
+        return bool(set(sounds(fold(heard))) & set(sounds(fold(name))))
+
+    def test_sound_alikes(self):
+        assert self.same(u"shoppin", u"Chopin")
+        assert self.same(u"filip glass", u"Philip Glass")
+        assert self.same(u"chaikovsky", u"Tchaikovsky")
+        assert self.same(u"asgeir", u"Ásgeir")
+        assert self.same(u"jose gonzales", u"José González")
+        assert self.same(u"nik kave", u"Nick Cave")
+        assert not self.same(u"artist 1", u"artist 2")
+
+    def test_alternates(self):
+        assert sounds(u"thelonious") == (u"0LNS", u"TLNS")
+        assert self.same(u"telonious monk", u"Thelonious Monk")
+        assert self.same(u"schubert", u"shubert")
+
+    def test_stop_words(self):
+        assert sounds(u"the wall") == sounds(u"wall")
+        assert sounds(u"the the")
+        assert sounds(u"") == ()
+        assert not self.same(u"chopin", u"shakira")
+
+
+class PhoneticIndexTest(TestCase):
+
+    def test_lookup(self):
+        index = PhoneticIndex(enumerate([u"chopin", u"chopin", u"zimmer",
+                                         u"the wall"]))
+        assert index.lookup(u"shoppin") == [0, 1]
+        assert index.lookup(u"wall") == [3]
+        assert index.lookup(u"ravel") == []
+
+
+class TrigramIndexTest(TestCase):
+
+    def setUp(self):
+        self.index = TrigramIndex(enumerate(NAMES))
+
+    def shortlist(self, text, **kwargs):
+        return [NAMES[k] for k in self.index.shortlist(text, **kwargs)]
+
+    def test_best_first(self):
+        assert len(self.index) == len(NAMES)
+        assert self.shortlist(u"hans zimmer") == \
+            [u"hans zimmer", u"alvin risk & hans zimmer"]
+        assert self.shortlist(u"zimmer", limit=1) == [u"hans zimmer"]
+
+    def test_misheard(self):
+        assert self.shortlist(u"olaf arnolds")[:2] == \
+            [u"olafur arnalds", u"nils frahm & olafur arnalds"]
+        assert self.shortlist(u"the zombie") == [u"the zombies"]
+
+    def test_min_overlap(self):
+        assert u"arnold" in self.shortlist(u"olaf arnolds", min_overlap=0.3)
+        assert u"arnold" not in self.shortlist(u"olaf arnolds",
+                                               min_overlap=0.6)
+        assert self.shortlist(u"xyz") == []
+        assert self.shortlist(u"") == []
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+#
+#   Copyright 2017 Nick Boultbee
+#   This file is part of squeeze-alexa.
+#
+#   squeeze-alexa is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   See LICENSE for full license
+
+from unittest import TestCase
+
+from squeezealexa.squeezebox.multiplexer import Multiplexer, Pending
+
+
+class ScriptedTransport(object):
+    """Replays canned lines, regardless of what was sent"""
+
+    def __init__(self, *lines):
+        self.lines = list(lines)
+        self.sent = []
+
+    def send(self, data, timeout=None):
+        self.sent.append(data)
+        return True
+
+    def readline(self, timeout=None):
+        return self.lines.pop(0) if self.lines else None
+
+
+class PendingTest(TestCase):
+
+    def test_query_key(self):
+        pending = Pending("ab:cd mode ?")
+        assert pending.key == ("ab:cd", "mode")
+        assert pending.matches("ab%3Acd mode play".split())
+        assert not pending.matches("ab%3Acd power 1".split())
+
+    def test_login_is_masked(self):
+        pending = Pending("login bob s3cret")
+        assert pending.matches("login bob ******".split())
+
+    def test_quoted_values(self):
+        pending = Pending("ab:cd playlist play Moody%20Bluez")
+        assert pending.matches("ab%3Acd playlist play Moody%20Bluez".split())
+
+
+class MultiplexerTest(TestCase):
+
+    def test_out_of_order(self):
+        mux = Multiplexer(ScriptedTransport("ab%3Acd album ? Lit",
+                                            "ab%3Acd artist ? Kiasmos"))
+        assert mux.request(["ab:cd artist ?", "ab:cd album ?"]) == [
+            "ab%3Acd artist ? Kiasmos", "ab%3Acd album ? Lit"]
+        assert mux.in_flight == 0
+
+    def test_notifications_interleaved(self):
+        notes = []
+        transport = ScriptedTransport("ab%3Acd playlist newsong Foo 3",
+                                      "ab%3Acd mixer volume 50",
+                                      "ab%3Acd mode play")
+        mux = Multiplexer(transport, on_notification=notes.append)
+        assert mux.request(["ab:cd mode ?"]) == ["ab%3Acd mode play"]
+        assert notes == ["ab%3Acd playlist newsong Foo 3",
+                         "ab%3Acd mixer volume 50"]
+
+    def test_unacknowledged_replies_absorbed(self):
+        transport = ScriptedTransport("ab%3Acd playlist clear",
+                                      "ab%3Acd time 12.3")
+        notes = []
+        mux = Multiplexer(transport, on_notification=notes.append)
+        assert mux.send(["ab:cd playlist clear"], wait=False)
+        assert mux.request(["ab:cd time ?"]) == ["ab%3Acd time 12.3"]
+        assert not notes
+        assert transport.sent == ["ab:cd playlist clear\n",
+                                  "ab:cd time ?\n"]
+
+    def test_dropped_replies_handed_on(self):
+        transport = ScriptedTransport("genres 0 10 count%3A0",
+                                      "ab%3Acd time 12.3")
+        answered = []
+        mux = Multiplexer(transport)
+        assert mux.send(["genres 0 10"], wait=False,
+                        on_response=answered.append)
+        assert not answered
+        mux.request(["ab:cd time ?"])
+        assert [(p.line, p.response) for p in answered] == [
+            ("genres 0 10", "genres 0 10 count%3A0")]
+
+    def test_same_command_many_times(self):
+        transport = ScriptedTransport("rescan 0", "rescan 1")
+        mux = Multiplexer(transport)
+        assert mux.request(["rescan ?", "rescan ?"]) == ["rescan 0",
+                                                         "rescan 1"]
+
+    def test_connection_lost(self):
+        mux = Multiplexer(ScriptedTransport())
+        assert mux.request(["ab:cd mode ?"]) is None
+        assert mux.in_flight == 0
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+#
+#   Copyright 2017 Nick Boultbee
+#   This file is part of squeeze-alexa.
+#
+#   squeeze-alexa is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   See LICENSE for full license
+
+from unittest import TestCase
+
+from squeezealexa.squeezebox.parsing import iter_pairs, pairs, result_of, \
+    values, Tokenizer
+from squeezealexa.squeezebox.records import Album, NowPlaying, Player
+
+
+class ResultOfTest(TestCase):
+
+    def test_escaped_player_id(self):
+        assert result_of("ab:cd status - 2",
+                         "ab%3Acd status - 2 player_name%3AKitchen") == \
+            "player_name%3AKitchen"
+
+    def test_query(self):
+        assert result_of("ab:cd mode ?", "ab%3Acd mode play") == "play"
+
+    def test_login(self):
+        assert result_of("login bob s3cret", "login bob ******") == \
+            "bob ******"
+
+    def test_no_result(self):
+        assert result_of("ab:cd pause 1", "ab%3Acd pause 1") == ""
+
+
+class PairsTest(TestCase):
+
+    def test_escaped(self):
+        assert pairs("player%20count%3A1 playerid%3Aab%3Acd rescan") == [
+            ("player count", "1"), ("playerid", "ab:cd")]
+
+    def test_unescaped_key_escaped_value(self):
+        assert pairs("name:Foo%3ABar") == [("name", "Foo:Bar")]
+
+    def test_only_wanted_keys(self):
+        response = "id%3A1 genre%3ARock id%3A2 genre%3AHip%20Hop count%3A2"
+        assert values(response, "genre") == ["Rock", "Hip Hop"]
+        assert list(iter_pairs(response, keys={"count"})) == [("count", "2")]
+
+
+class TokenizerTest(TestCase):
+    ALBUMS = ("rescan%3A1 id%3A1 album%3AMy_Album year%3A2005 "
+              "artist%3AThe%20id%20year%20band "
+              "id%3A2 album%3AOther%20Side%3A%20Live year%3A "
+              "count%3A2")
+
+    def setUp(self):
+        self.tokenizer = Tokenizer.for_tags("Album",
+                                            ("id", "album", "year"),
+                                            types={"id": int})
+
+    def test_records(self):
+        first, second = self.tokenizer.records(self.ALBUMS)
+        assert first == (1, "My_Album", "2005")
+        assert first.album == "My_Album"
+        assert second.album == "Other Side: Live"
+        assert second.year == ""
+
+    def test_missing_tags(self):
+        records = list(self.tokenizer.records("id:3 album:Solo id:4"))
+        assert records[1] == (4, None, None)
+
+    def test_pairs(self):
+        assert list(self.tokenizer.pairs(self.ALBUMS)) == [
+            ("id", "1"), ("album", "My_Album"), ("year", "2005"),
+            ("id", "2"), ("album", "Other Side: Live"), ("year", ""),
+            ("count", "2")]
+
+    def test_shared(self):
+        assert Tokenizer.for_tags("Album", ("id", "album", "year")) \
+            is self.tokenizer
+
+    def test_for_record(self):
+        tokenizer = Tokenizer.for_record(Album)
+        first, second = tokenizer.records(self.ALBUMS)
+        assert first == Album(1, "My_Album", 2005, "The id year band")
+        assert isinstance(first, Album)
+        assert second.year == 0
+        assert Tokenizer.for_record(Album) is tokenizer
+
+    def test_players(self):
+        tokenizer = Tokenizer.for_record(Player)
+        status = ("lastscan%3A1 player%20count%3A1 playerid%3Aab%3Acd "
+                  "name%3AKitchen power%3A1 connected%3A0")
+        player, = tokenizer.records(status)
+        assert player.id == "ab:cd"
+        assert player.power and not player.connected
+        assert player.model is None
+        assert str(player) == "Kitchen [ab:cd]"
+
+    def test_now_playing(self):
+        status = ("player_name%3AKitchen player_connected%3A1 power%3A1 "
+                  "mode%3Aplay time%3A12.5 duration%3A200.1 "
+                  "mixer%20volume%3A40 playlist_cur_index%3A0 "
+                  "playlist%20index%3A0 id%3A7 title%3AA%20Song "
+                  "artist%3ASomeone album%3AAlbum%3A%20Two")
+        now = Tokenizer.for_record(NowPlaying).record_of(status)
+        assert now == NowPlaying("A Song", "Album: Two", "Someone", 200.1,
+                                 12.5, "play", 40, "Kitchen", True, True,
+                                 None)
+
+    def test_nothing_playing(self):
+        status = "rescan%3A1 player_name%3AKitchen mode%3Astop"
+        now = Tokenizer.for_record(NowPlaying).record_of(status)
+        assert now.title is None and now.duration is None
+        assert now.scanning
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+#
+#   Copyright 2017 Nick Boultbee
+#   This file is part of squeeze-alexa.
+#
+#   squeeze-alexa is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   See LICENSE for full license
+
+import threading
+from unittest import TestCase
+
+import pytest
+
+from squeezealexa.circuit_breaker import CircuitBreaker, CircuitOpenError
+from squeezealexa.pool import ConnectionPool
+from squeezealexa.utils import Deadline
+
+
+class FakeConnection(object):
+    def __init__(self, deadline=None):
+        self.deadline = deadline
+        self.is_connected = True
+        self.alive = True
+
+    def is_alive(self):
+        return self.is_connected and self.alive
+
+    def close(self):
+        self.is_connected = False
+
+
+class ConnectionPoolTest(TestCase):
+
+    def setUp(self):
+        self.pool = ConnectionPool(FakeConnection)
+
+    def test_reuses_released_connection(self):
+        conn = self.pool.acquire()
+        self.pool.release(conn)
+        assert self.pool.acquire() is conn
+        assert self.pool.created == 1
+
+    def test_replaces_dead_connection(self):
+        conn = self.pool.acquire()
+        self.pool.release(conn)
+        conn.alive = False
+        new = self.pool.acquire()
+        assert new is not conn
+        assert not conn.is_connected
+        assert self.pool.created == 2
+
+    def test_discard_reconnects_in_background(self):
+        conn = self.pool.acquire()
+        self.pool.discard(conn)
+        assert not conn.is_connected
+        new = self.pool.acquire()
+        assert new.is_alive()
+        assert self.pool.created == 2
+
+    def test_idle_limit(self):
+        first, second = self.pool.acquire(), self.pool.acquire()
+        self.pool.release(first)
+        self.pool.release(second)
+        assert len(self.pool) == 1
+        assert not second.is_connected
+
+    def test_close(self):
+        conn = self.pool.acquire()
+        self.pool.release(conn)
+        self.pool.close()
+        assert not conn.is_connected
+        assert len(self.pool) == 0
+
+    def test_connects_within_deadline(self):
+        deadline = Deadline(3)
+        assert self.pool.acquire(deadline=deadline).deadline is deadline
+        assert self.pool.acquire().deadline is None
+
+    def test_waits_for_background_connection_within_deadline(self):
+        started, stalled = threading.Event(), threading.Event()
+
+        def connect(deadline=None):
+            if deadline is None:
+                started.set()
+                stalled.wait(5)
+            return FakeConnection(deadline)
+
+        pool = ConnectionPool(connect)
+        pool.refill()
+        started.wait(5)
+        deadline = Deadline(0.1)
+        conn = pool.acquire(deadline=deadline)
+        stalled.set()
+        assert conn.deadline is deadline
+
+    def test_fails_fast_when_server_down(self):
+        calls = []
+
+        def refused():
+            calls.append(1)
+            raise IOError("Connection refused")
+
+        pool = ConnectionPool(refused, breaker=CircuitBreaker(max_failures=2))
+        for _ in range(2):
+            with pytest.raises(IOError):
+                pool.acquire()
+        with pytest.raises(CircuitOpenError):
+            pool.acquire()
+        assert len(calls) == 2
@@ -0,0 +1,550 @@
+# -*- coding: utf-8 -*-
+#
+#   Copyright 2017 Nick Boultbee
+#   This file is part of squeeze-alexa.
+#
+#   squeeze-alexa is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   See LICENSE for full license
+
+"""A stand-in for the LMS CLI, for offline tests and benchmarks.
+
+It speaks the real line protocol (optionally over TLS) on localhost,
+backed by a synthetic library, and can add latency, fragment its replies,
+drop connections or ignore commands. It implements only what squeeze-alexa
+uses, and is in no way a full LMS.
+"""
+
+import os
+import random
+import socket
+import ssl
+import subprocess
+import threading
+import time
+
+from squeezealexa.ssl_wrap import LineReader
+from squeezealexa.utils import PY2, print_d, print_w
+
+if PY2:
+    from urllib import quote, unquote
+else:
+    from urllib.parse import quote, unquote
+
+_SERVER_PROTOCOL = getattr(ssl, "PROTOCOL_TLS_SERVER",
+                           getattr(ssl, "PROTOCOL_TLS", ssl.PROTOCOL_SSLv23))
+
+
+def escape(text):
+    """Escapes a token as LMS does (everything but URI-unreserved chars)"""
+    text = u"%s" % (text,)
+    return quote(text.encode('utf-8'), safe="-_.!~*'()")
+
+
+def make_certificate(directory, name="localhost"):
+    """Creates a self-signed certificate and key (needs `openssl`)
+
+    :returns (cert file, key file) paths
+    """
+    cert_file = os.path.join(directory, "%s.crt" % name)
+    key_file = os.path.join(directory, "%s.key" % name)
+    subprocess.check_output(["openssl", "req", "-x509", "-newkey", "rsa:2048",
+                             "-nodes", "-days", "1", "-subj", "/CN=%s" % name,
+                             "-keyout", key_file, "-out", cert_file],
+                            stderr=subprocess.STDOUT)
+    return cert_file, key_file
+
+
+class Library(object):
+    """A synthetic music library, and the players to play it on"""
+
+    def __init__(self, players=None, genres=None, playlists=None,
+                 artists=None, albums=None):
+        self.players = players or []
+        """(player ID, name) for each player"""
+        self.genres = genres or []
+        self.playlists = playlists or []
+        self.artists = artists or []
+        """(id, name) for each artist"""
+        self.albums = albums or []
+        """dicts of id, album, year, artist_id and artist for each album"""
+
+    @classmethod
+    def generate(cls, players=2, artists=50, albums_per_artist=4,
+                 genres=("Rock", "Jazz", "Blues", "Latin", "Electronica"),
+                 playlists=5, seed=1):
+        """A library with made-up (but repeatable) contents"""
+        rand = random.Random(seed)
+        lib = cls(genres=list(genres),
+                  playlists=["Playlist %d" % i
+                             for i in range(1, playlists + 1)])
+        names = ["Kitchen", "Living Room", "Study", "Bedroom", "Garden"]
+        lib.players = [("00:04:20:12:34:%02x" % i,
+                        names[i] if i < len(names) else "Player %d" % i)
+                       for i in range(players)]
+        album_id = 7000000
+        for i in range(artists):
+            artist_id = 10000000 + i
+            artist = u"Artist %d" % i
+            lib.artists.append((artist_id, artist))
+            for j in range(albums_per_artist):
+                album_id += 1
+                lib.albums.append({"id": album_id,
+                                   "album": u"Album %d by %s" % (j, artist),
+                                   "year": rand.randint(1950, 2017),
+                                   "artist_id": artist_id,
+                                   "artist": artist})
+        return lib
+
+
+class PlayerState(object):
+    """What a simulated player is (pretending to be) doing"""
+
+    def __init__(self, player_id, name):
+        self.id = player_id
+        self.name = name
+        self.mode = "stop"
+        self.power = 1
+        self.volume = 50
+        self.shuffle = 0
+        self.repeat = 0
+        self.playlist = []
+        self.index = 0
+        self.started = None
+
+    @property
+    def current(self):
+        return self.playlist[self.index] if self.playlist else None
+
+    @property
+    def time(self):
+        return time.time() - self.started if self.started else 0.0
+
+
+class Simulator(object):
+    """Serves the LMS CLI protocol for a (synthetic) Library on localhost.
+    Use as a context manager, or call start() and stop()."""
+
+    def __init__(self, library=None, user=None, password=None,
+                 cert_file=None, key_file=None, latency=0.0, jitter=0.0,
+                 delays=None, fragment=None, drop_rate=0.0, silent=(),
+                 scanning=False, seed=None):
+        """
+        :param latency: seconds before answering each (batch of) commands
+        :param jitter: up to this many extra seconds, at random
+        :param delays: extra seconds for particular commands, by name
+        :param fragment: if set, send responses this many bytes at a time
+        :param drop_rate: probability of closing the connection on a command
+        :param silent: names of commands never to answer
+        :param scanning: whether to pretend a library rescan is running
+        """
+        self.library = library or Library.generate()
+        self.user = user
+        self.password = password
+        self.latency = latency
+        self.jitter = jitter
+        self.delays = delays or {}
+        self.fragment = fragment
+        self.drop_rate = drop_rate
+        self.silent = set(silent)
+        self.scanning = scanning
+        self.last_scan = 1500000000
+        """When the library was last scanned, as reported by serverstatus"""
+        self._random = random.Random(seed)
+        self.players = {pid: PlayerState(pid, name)
+                        for pid, name in self.library.players}
+        self.traffic = []
+        """(time, "recv" or "sent", line) for everything seen on the wire"""
+        self.connections = 0
+        self._listeners = {}
+        """Sessions subscribed to notifications, by id"""
+        self._context = None
+        if cert_file:
+            self._context = ssl.SSLContext(_SERVER_PROTOCOL)
+            self._context.load_cert_chain(cert_file, key_file)
+        self._sock = None
+        self._running = False
+        self._lock = threading.Lock()
+
+    @property
+    def port(self):
+        return self._sock.getsockname()[1]
+
+    def start(self):
+        self._sock = socket.socket()
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._sock.bind(("127.0.0.1", 0))
+        self._sock.listen(5)
+        self._running = True
+        self._spawn(self._serve, "lms-simulator")
+        print_d("Simulating LMS CLI on %s" % self)
+        return self
+
+    def stop(self):
+        self._running = False
+        if self._sock:
+            self._sock.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    @staticmethod
+    def _spawn(target, name, *args):
+        thread = threading.Thread(target=target, name=name, args=args)
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def _serve(self):
+        while self._running:
+            try:
+                conn, _ = self._sock.accept()
+            except (socket.error, OSError):
+                break
+            self.connections += 1
+            self._spawn(self._handle, "lms-simulator-conn", conn)
+
+    def _handle(self, conn):
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        session = {"authenticated": not (self.user and self.password),
+                   "conn": conn, "lock": threading.Lock(),
+                   "subscribed": None, "notify": []}
+        try:
+            if self._context:
+                conn = session["conn"] = self._context.wrap_socket(
+                    conn, server_side=True)
+            reader = LineReader(conn.recv)
+            while self._running:
+                # Pipelined commands arrive (and are answered) together,
+                # so network latency only applies once to each batch
+                first = not reader.buffered
+                line = reader.readline()
+                if line is None:
+                    break
+                line = line.rstrip("\r")
+                self._record("recv", line)
+                if self._random.random() < self.drop_rate:
+                    print_d("Simulating dropped connection on %r" % line)
+                    break
+                response = self.respond(line, session)
+                if response is None:
+                    if not session["authenticated"]:
+                        break
+                    continue
+                self._delay(line, first)
+                self._reply(session, response)
+                self._notify(session)
+        except (socket.error, ssl.SSLError, OSError) as e:
+            print_w("Simulator connection failed (%s)" % e)
+        finally:
+            with self._lock:
+                self._listeners.pop(id(session), None)
+            conn.close()
+
+    def _reply(self, session, response):
+        with session["lock"]:
+            self._send(session["conn"], response)
+
+    def _notify(self, session):
+        """Sends the notifications of what the last command changed
+        to every connection subscribed to them"""
+        lines, session["notify"] = session["notify"], []
+        with self._lock:
+            listeners = list(self._listeners.values())
+        for line in lines:
+            command = self._command(line)
+            for listener in listeners:
+                wanted = listener["subscribed"]
+                if wanted == "*" or command in wanted:
+                    try:
+                        self._reply(listener, line)
+                    except (socket.error, ssl.SSLError, OSError) as e:
+                        print_d("Couldn't notify a listener (%s)" % e)
+
+    def _record(self, direction, line):
+        with self._lock:
+            self.traffic.append((time.time(), direction, line))
+
+    def _delay(self, line, first=True):
+        secs = self.delays.get(self._command(line), 0)
+        if first:
+            secs += self.latency + self.jitter * self._random.random()
+        if secs:
+            time.sleep(secs)
+
+    def _send(self, conn, response):
+        self._record("sent", response)
+        data = (response + "\n").encode('utf-8')
+        if not self.fragment:
+            conn.sendall(data)
+            return
+        for i in range(0, len(data), self.fragment):
+            conn.sendall(data[i:i + self.fragment])
+            time.sleep(0.0005)
+
+    def _command(self, line):
+        words = line.split(' ')
+        if len(words) > 1 and unquote(words[0]) in self.players:
+            return words[1]
+        return words[0]
+
+    def respond(self, line, session=None):
+        """The response line for a command line, or None for no reply"""
+        if session is None:
+            session = {"authenticated": True}
+        if PY2:
+            line = line.encode('utf-8')
+        words = [self._decode(unquote(w)) for w in line.split(' ') if w]
+        if not words:
+            return None
+        if words[0] == "login":
+            ok = words[1:3] == [self.user, self.password]
+            session["authenticated"] = ok
+            return "login %s ******" % escape(words[1]) if ok else None
+        if not session["authenticated"]:
+            return None
+        if words[0] in ("subscribe", "listen") and len(words) > 1:
+            return self._subscribe(session, words)
+
+        player = self.players.get(words[0])
+        args = words[1:] if player else words
+        if not args or args[0] in self.silent:
+            return None
+        query = args[-1] == "?"
+        playing = (player.current, player.index) if player else None
+        if player and args[0] in self._TRACK_TAGS:
+            track = player.current
+            result = track[self._TRACK_TAGS[args[0]]] if track else u""
+        elif player:
+            func = getattr(self, "_player_%s" % args[0], None)
+            result = func(player, *args[1:]) if func else None
+        else:
+            func = getattr(self, "_%s" % args[0], None)
+            result = func(*args[1:]) if func else None
+        if query:
+            words[-1] = u"%s" % (result,)
+            return " ".join(escape(w) for w in words)
+        if isinstance(result, list):
+            words += result
+        response = " ".join(escape(w) for w in words)
+        if player and args[0] in self._NOTIFYING:
+            notify = session.setdefault("notify", [])
+            notify.append(response)
+            if player.current and playing != (player.current, player.index):
+                notify.append(" ".join(escape(w) for w in [
+                    player.id, "playlist", "newsong",
+                    player.current["title"], player.index]))
+        return response
+
+    def _subscribe(self, session, words):
+        if words[0] == "listen":
+            wanted = "*" if words[1] == "1" else None
+        else:
+            wanted = set(words[1].split(","))
+        session["subscribed"] = wanted
+        with self._lock:
+            if wanted:
+                self._listeners[id(session)] = session
+            else:
+                self._listeners.pop(id(session), None)
+        return " ".join(escape(w) for w in words)
+
+    @staticmethod
+    def _decode(word):
+        return word.decode('utf-8') if PY2 else word
+
+    # Server commands
+
+    def _serverstatus(self, start=0, count=99, *args):
+        players = list(self.players.values())[int(start):][:int(count)]
+        result = [u"lastscan:%d" % self.last_scan, u"version:7.9.1",
+                  u"player count:%d" % len(self.players)]
+        for p in players:
+            result += [u"playerid:%s" % p.id, u"name:%s" % p.name,
+                       u"model:squeezelite", u"power:%d" % p.power,
+                       u"connected:1"]
+        return result
+
+    @staticmethod
+    def _paged(items, start, count, scanning=False):
+        page = items[int(start):][:int(count)]
+        result = [u"rescan:1"] if scanning else []
+        for item in page:
+            result += item
+        return result + [u"count:%d" % len(items)]
+
+    @staticmethod
+    def _params(args):
+        return dict(a.split(":", 1) for a in args if ":" in a)
+
+    def _genres(self, start=0, count=10, *args):
+        items = [[u"id:%d" % i, u"genre:%s" % g]
+                 for i, g in enumerate(self.library.genres)]
+        return self._paged(items, start, count, self.scanning)
+
+    def _playlists(self, start=0, count=10, *args):
+        items = [[u"id:%d" % i, u"playlist:%s" % p]
+                 for i, p in enumerate(self.library.playlists)]
+        return self._paged(items, start, count, self.scanning)
+
+    def _artists(self, start=0, count=10, *args):
+        search = self._params(args).get("search", "").lower()
+        items = [[u"id:%d" % i, u"artist:%s" % name]
+                 for i, name in self.library.artists
+                 if search in name.lower()]
+        return self._paged(items, start, count, self.scanning)
+
+    def _albums(self, start=0, count=10, *args):
+        params = self._params(args)
+        search = params.get("search", "").lower()
+        artist_id = params.get("artist_id")
+        tags = params.get("tags", "l")
+        items = []
+        for album in self.library.albums:
+            if search not in album["album"].lower():
+                continue
+            if artist_id and str(album["artist_id"]) != artist_id:
+                continue
+            item = [u"id:%d" % album["id"], u"album:%s" % album["album"]]
+            if "y" in tags:
+                item.append(u"year:%d" % album["year"])
+            if "a" in tags:
+                item.append(u"artist:%s" % album["artist"])
+            if "SS" in tags:
+                item.append(u"artist_ids:%d" % album["artist_id"])
+            elif "S" in tags:
+                item.append(u"artist_id:%d" % album["artist_id"])
+            items.append(item)
+        return self._paged(items, start, count, self.scanning)
+
+    def _info(self, total=None, what=None, *args):
+        return len(getattr(self.library, what, [])) if what else 0
+
+    def _rescan(self, *args):
+        return int(self.scanning)
+
+    # Player commands
+
+    _NOTIFYING = {"mixer", "pause", "play", "playlist", "playlistcontrol",
+                  "power", "randomplay", "stop"}
+    """Commands that listeners are told about"""
+
+    _TRACK_TAGS = {"current_title": "title", "title": "title",
+                   "album": "album", "artist": "artist", "genre": "genre"}
+    """Queries about the current track, and what they return"""
+
+    def _player_mode(self, player, *args):
+        return player.mode
+
+    def _player_time(self, player, *args):
+        return "%.1f" % player.time
+
+    def _player_power(self, player, value="?", *args):
+        if value != "?":
+            player.power = int(value)
+        return player.power
+
+    def _player_mixer(self, player, what=None, value="?", *args):
+        if value != "?":
+            if value[0] in "+-":
+                player.volume += float(value)
+            else:
+                player.volume = float(value)
+            player.volume = int(max(0, min(100, player.volume)))
+        return player.volume
+
+    def _player_play(self, player, *args):
+        if player.playlist:
+            player.mode = "play"
+            player.started = player.started or time.time()
+
+    def _player_pause(self, player, value=None, *args):
+        if value == "0" or (value is None and player.mode == "pause"):
+            self._player_play(player)
+        elif player.mode == "play":
+            player.mode = "pause"
+
+    def _player_stop(self, player, *args):
+        player.mode = "stop"
+        player.started = None
+
+    def _album_tracks(self, album):
+        return [{"title": u"Track %d" % i, "album": album["album"],
+                 "artist": album["artist"], "genre": self.library.genres[0]
+                 if self.library.genres else u"", "duration": 180 + i}
+                for i in range(1, 11)]
+
+    def _player_playlist(self, player, action=None, *args):
+        if action == "clear":
+            player.playlist = []
+            player.index = 0
+            self._player_stop(player)
+        elif action == "jump" and args and player.playlist:
+            offset = args[0]
+            if offset[0] in "+-":
+                player.index += int(offset)
+            else:
+                player.index = int(offset)
+            player.index %= len(player.playlist)
+            player.started = time.time()
+        elif action in ("shuffle", "repeat") and args:
+            if args[0] != "?":
+                setattr(player, action, int(args[0]))
+            return getattr(player, action)
+        elif action in ("play", "resume", "addalbum", "insert"):
+            player.playlist = [{"title": u"Something", "album": u"Something",
+                                "artist": u"Someone", "genre": u"Unknown",
+                                "duration": 200}]
+            if action != "insert":
+                self._player_play(player)
+        return []
+
+    def _player_playlistcontrol(self, player, *args):
+        album_id = self._params(args).get("album_id")
+        albums = [a for a in self.library.albums
+                  if str(a["id"]) == album_id]
+        if albums:
+            player.playlist = self._album_tracks(albums[0])
+            player.index = 0
+            self._player_play(player)
+            return [u"count:%d" % len(player.playlist)]
+        return [u"count:0"]
+
+    def _player_randomplay(self, player, *args):
+        album = self._random.choice(self.library.albums)
+        player.playlist = self._album_tracks(album)
+        self._player_play(player)
+
+    def _player_status(self, player, *args):
+        result = [u"player_name:%s" % player.name, u"player_connected:1",
+                  u"power:%d" % player.power, u"mode:%s" % player.mode,
+                  u"time:%.1f" % player.time,
+                  u"mixer volume:%d" % player.volume,
+                  u"playlist repeat:%d" % player.repeat,
+                  u"playlist shuffle:%d" % player.shuffle,
+                  u"playlist_tracks:%d" % len(player.playlist)]
+        if self.scanning:
+            result.insert(0, u"rescan:1")
+        if player.current:
+            result.append(u"playlist_cur_index:%d" % player.index)
+            result += [u"%s:%s" % (k, player.current[k])
+                       for k in ("title", "genre", "artist", "album",
+                                 "duration")]
+        return result
+
+    # Searches are sometimes sent to players
+    def _player_artists(self, player, *args):
+        return self._artists(*args)
+
+    def _player_albums(self, player, *args):
+        return self._albums(*args)
+
+    def __str__(self):
+        return "localhost:%s%s" % (self.port if self._sock else "?",
+                                   " (TLS)" if self._context else "")
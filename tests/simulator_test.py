@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+#
+#   Copyright 2017 Nick Boultbee
+#   This file is part of squeeze-alexa.
+#
+#   squeeze-alexa is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   See LICENSE for full license
+
+import select
+from unittest import TestCase
+
+import pytest
+
+from squeezealexa.squeezebox.cache import ResponseCache
+from squeezealexa.squeezebox.parsing import Tokenizer
+from squeezealexa.squeezebox.records import Artist
+from squeezealexa.squeezebox.server import Server, SqueezeboxTimeout
+from squeezealexa.ssl_wrap import SslSocketWrapper
+from tests.helpers import CertificateTestCase, FakeClock
+from tests.simulator import Simulator, Library
+
+
+class SimulatorResponseTest(TestCase):
+    """The protocol, without any networking"""
+
+    def setUp(self):
+        self.sim = Simulator(Library.generate(players=1, artists=3),
+                             user="bob", password="s3cret")
+
+    def test_login(self):
+        session = {"authenticated": False}
+        assert self.sim.respond("serverstatus 0 99", session) is None
+        assert self.sim.respond("login bob wrong", session) is None
+        assert self.sim.respond("login bob s3cret", session) == \
+            "login bob ******"
+        assert session["authenticated"]
+
+    def test_query_replaces_question_mark(self):
+        assert self.sim.respond("00:04:20:12:34:00 mode ?") == \
+            "00%3A04%3A20%3A12%3A34%3A00 mode stop"
+
+    def test_paged_listing(self):
+        response = self.sim.respond("artists 1 1")
+        assert response == ("artists 1 1 id%3A10000001 "
+                            "artist%3AArtist%201 count%3A3")
+
+    def test_scanning(self):
+        self.sim.scanning = True
+        assert "rescan%3A1" in self.sim.respond("genres 0 255")
+
+
+class SimulatorServerTest(CertificateTestCase):
+    """Everything from the socket up, over TLS"""
+
+    def connect(self, cache=None, **kwargs):
+        self.sim = Simulator(Library.generate(players=2),
+                             user="bob", password="s3cret",
+                             cert_file=self.cert_file, key_file=self.key_file,
+                             **kwargs).start()
+        self.addCleanup(self.sim.stop)
+        self.ssl = SslSocketWrapper("127.0.0.1", self.sim.port)
+        self.addCleanup(self.ssl.close)
+        return Server(self.ssl, user="bob", password="s3cret", cache=cache)
+
+    def test_end_to_end(self):
+        server = self.connect()
+        assert server.player_names == {"Kitchen", "Living Room"}
+        assert server.genres[0] == "Rock"
+        now = server.get_now_playing(player_id="00:04:20:12:34:00")
+        assert now.player_name == "Kitchen"
+        assert now.title is None
+        albums = server.get_albums_with_artist_id(10000001)
+        assert albums[0].name == 'Album 0 by Artist 1'
+        assert albums[0].id == 7000005
+        server.play_album_with_id(7000001)
+        assert not server.is_stopped()
+        now = server.get_now_playing()
+        assert (now.title, now.album, now.artist) == \
+            ("Track 1", "Album 0 by Artist 0", "Artist 0")
+        assert now.mode == "play"
+        assert now.duration == 181.0
+        assert now.volume == 50
+        server.pause()
+        assert server.is_stopped()
+        assert ("recv", "login bob s3cret") in \
+            [t[1:] for t in self.sim.traffic]
+
+    def test_fragmented_responses(self):
+        server = self.connect(fragment=7)
+        assert len(server.playlists) == 5
+
+    def test_silent_command_times_out(self):
+        server = self.connect(silent={"mode"})
+        server._TIMEOUTS = {"mode": 0.2}
+        with pytest.raises(SqueezeboxTimeout):
+            server.is_stopped()
+        assert not self.ssl.is_connected
+
+    def requested(self, command):
+        return [t[2] for t in self.sim.traffic
+                if t[1] == "recv" and command in t[2].split(" ")[:2]]
+
+    def test_paged_listing(self):
+        server = self.connect()
+        server._PAGE_SIZE = 30
+        artists = server.get_artists_with_search_term("Artist")
+        assert len(artists) == 50
+        assert artists[-1] == Artist(10000049, "Artist 49")
+        assert [r.split()[2] for r in self.requested("artists")] == \
+            ["0", "30"]
+
+    def test_stops_early(self):
+        server = self.connect()
+        server._PAGE_SIZE = 3
+        artists = server.get_artists_with_search_term("Artist", limit=4)
+        assert [a.id for a in artists] == \
+            [10000000, 10000001, 10000002, 10000003]
+        # The next page's response doesn't get in the way...
+        assert server.genres
+        # ...and was the only one requested unnecessarily
+        assert len(self.requested("artists")) == 3
+
+    def test_records(self):
+        server = self.connect()
+        server._PAGE_SIZE = 3
+        tokenizer = Tokenizer.for_tags("Album", ("id", "album", "year"),
+                                       types={"id": int, "year": int})
+        albums = list(server.iter_records("albums", tokenizer,
+                                          "artist_id:10000002 tags:ly"))
+        assert [a.id for a in albums] == [7000009, 7000010, 7000011, 7000012]
+        assert albums[0].album == "Album 0 by Artist 2"
+
+    def test_scanning(self):
+        server = self.connect(scanning=True)
+        assert server.get_albums_with_search_term("Album") == "Scanning"
+
+    def test_listings_cached(self):
+        server = self.connect()
+        first = server.get_albums_with_search_term("Album 1")
+        assert server.get_albums_with_search_term("album 1") == first
+        assert len(server.get_genres()) == len(server.get_genres())
+        assert len(self.requested("albums")) == 1
+        assert len(self.requested("genres")) == 1
+
+    def test_rescan_invalidates(self):
+        server = self.connect()
+        server.get_albums_with_search_term("Album 1")
+        server.rescan()
+        server.get_albums_with_search_term("Album 1")
+        assert len(self.requested("albums")) == 2
+
+    def test_finished_scan_invalidates(self):
+        server = self.connect()
+        server.get_albums_with_search_term("Album 1")
+        server.refresh()
+        server.get_albums_with_search_term("Album 1")
+        assert len(self.requested("albums")) == 1
+        self.sim.last_scan += 1
+        server.refresh()
+        server.get_albums_with_search_term("Album 1")
+        assert len(self.requested("albums")) == 2
+
+    def test_stale_while_revalidate(self):
+        clock = FakeClock()
+        server = self.connect(cache=ResponseCache(Server._CACHE_TTLS,
+                                                  clock=clock))
+        albums = server.get_albums_with_search_term("Album 1")
+        clock.now += Server._CACHE_TTLS["albums"] + 1
+        assert server.get_albums_with_search_term("Album 1") == albums
+        server.flush()
+        # The refreshed listing is cached once its reply has been read
+        server.refresh_status()
+        assert len(self.requested("albums")) == 2
+        result, stale = server.cache.get(self.requested("albums")[-1])
+        assert result and not stale
+
+    def test_batch(self):
+        server = self.connect()
+        # Connected, logged in and players loaded
+        assert server.cur_player_id
+        writes = []
+        send = self.ssl.send
+
+        def counting_send(data, timeout=None):
+            writes.append(data)
+            return send(data, timeout=timeout)
+
+        self.ssl.send = counting_send
+        with server.batch():
+            server.play_album_with_id(7000001)
+            stopped = server.is_stopped()
+            now = server.get_now_playing()
+            server.pause()
+            assert not stopped.done
+        assert len(writes) == 1
+        assert stopped.result() is False
+        assert now.result().title == "Track 1"
+        assert server.is_stopped()
+
+    def test_unread_replies_kept(self):
+        server = self.connect()
+        pid = server.cur_player_id
+        server.pause()
+        server.flush()
+        select.select([self.ssl._ssl_sock], [], [], 2)
+        # The next invocation's check keeps the reply to the pause...
+        assert self.ssl.is_alive()
+        assert self.ssl._reader.buffered
+        # ...so it answers that, not the same request waited for now
+        assert server.player_request("pause 1", player_id=pid) == ""
+        assert server._mux.in_flight == 0
+        # Even for a new server, on the same connection
+        later = Server(self.ssl, user="bob", password="s3cret")
+        later.pause(player_id=pid)
+        later.flush()
+        assert later.player_request("pause 1", player_id=pid) == ""
+        assert later._mux.in_flight == 0
+
+    def test_session_from_another_context(self):
+        self.connect()
+        self.ssl.close()
+        # Its own context, so can't resume the session just cached
+        other = SslSocketWrapper("127.0.0.1", self.sim.port)
+        assert other.is_connected
+        other.close()
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+#
+#   Copyright 2017 Nick Boultbee
+#   This file is part of squeeze-alexa.
+#
+#   squeeze-alexa is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   See LICENSE for full license
+
+import time
+from os.path import join
+
+from squeezealexa.squeezebox.server import Server
+from squeezealexa.squeezebox.snapshot import Snapshot
+from squeezealexa.ssl_wrap import SslSocketWrapper
+from tests.helpers import CertificateTestCase
+from tests.simulator import Simulator, Library
+
+
+def offline():
+    raise AssertionError("Tried to connect to the server")
+
+
+class SnapshotTest(CertificateTestCase):
+
+    def setUp(self):
+        library = Library.generate(players=2, artists=10)
+        library.artists.append((10000099, u"Ólafur Arnalds"))
+        self.sim = Simulator(library, cert_file=self.cert_file,
+                             key_file=self.key_file).start()
+        self.addCleanup(self.sim.stop)
+        self.path = join(self.dir, "%s.snapshot" % self.id())
+
+    def connect(self):
+        def connect():
+            ssl = SslSocketWrapper("127.0.0.1", self.sim.port)
+            self.addCleanup(ssl.close)
+            return ssl
+        return Server(connect=connect)
+
+    def saved_server(self):
+        server = self.connect()
+        assert len(server.players) == 2
+        assert len(server.index.artists_matching("artist")) == 10
+        assert len(server.index.albums_by(10000001)) == 4
+        assert Snapshot.save(self.path, server)
+        return server
+
+    def test_cold_start_needs_no_server(self):
+        live = self.saved_server()
+        snapshot = Snapshot.load(self.path)
+        server = Server(connect=offline)
+        snapshot.restore(server)
+        assert server.players == live.players
+        assert server.cur_player_id == live.cur_player_id
+        olafur, = server.index.artists_matching("olafur")
+        assert olafur.name == u"Ólafur Arnalds"
+        assert server.index.albums_by(10000001) == \
+            live.index.albums_by(10000001)
+        assert server.index.version == live.index.version
+        assert not server.index.dirty
+        # Names aren't normalised again, but as saved
+        assert server.index._forms[u"Ólafur Arnalds"] is \
+            snapshot.section("names")[u"Ólafur Arnalds"]
+
+    def test_decodes_sections_lazily(self):
+        self.saved_server()
+        snapshot = Snapshot.load(self.path)
+        assert "albums" in snapshot and "genres" not in snapshot
+        assert snapshot.section("artists")
+        assert set(snapshot._decoded) == {"artists"}
+
+    def test_checked_lazily(self):
+        self.saved_server()
+        server = self.connect()
+        Snapshot.load(self.path).restore(server)
+        index = server.index
+        before = len(self.sim.traffic)
+        assert index.artists_matching("artist 1")
+        assert len(self.sim.traffic) == before
+        self.sim.library.artists.append((10000100, u"Artist 100"))
+        index.checked = time.time() - index.check_secs
+        assert len(index.artists_matching("artist 1")) == 2
+        assert index.dirty
+        # Albums haven't changed, so are still good to take from it
+        assert index.albums_by(10000001)
+        assert not any(line.startswith("albums ")
+                       for _, _, line in self.sim.traffic[before:])
+
+    def test_old_snapshot_checked_at_once(self):
+        self.saved_server()
+        snapshot = Snapshot.load(self.path)
+        server = self.connect()
+        snapshot.saved -= server.index.check_secs
+        snapshot.restore(server)
+        self.sim.library.artists.append((10000100, u"Artist 100"))
+        assert len(server.index.artists_matching("artist 1")) == 2
+
+    def test_saves_changes_only(self):
+        server = self.saved_server()
+        assert Snapshot.save_changes(self.path, server, server.players) \
+            is server.players
+        server.index.dirty = True
+        saved = Snapshot.save_changes(self.path, server)
+        assert saved == server.players
+        assert not server.index.dirty
+
+    def test_unusable(self):
+        assert Snapshot.load(join(self.dir, "missing")) is None
+        with open(self.path, "wb") as f:
+            f.write(b"not a snapshot at all")
+        assert Snapshot.load(self.path) is None
+        self.saved_server()
+        with open(self.path, "r+b") as f:
+            f.seek(4)
+            f.write(b"\xff")
+        assert Snapshot.load(self.path) is None
+
+    def test_unwritable(self):
+        server = self.connect()
+        assert not Snapshot.save(join(self.dir, "no", "such", "dir"), server)
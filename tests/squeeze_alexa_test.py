@@ -10,11 +10,55 @@
 #
 #   See LICENSE for full license
 
+import socket
 from unittest import TestCase
 
 import pytest
 
+from squeezealexa.circuit_breaker import CircuitBreaker, CircuitOpenError
 from squeezealexa.main import SqueezeAlexa
+from squeezealexa.pool import ConnectionPool
+from squeezealexa.squeezebox.records import Album, Artist
+from squeezealexa.squeezebox.server import Server, SqueezeboxException, \
+    SqueezeboxTimeout
+from squeezealexa.ssl_wrap import Timeout
+from squeezealexa.utils import Deadline
+from tests.helpers import FakeClock
+
+STATUS = 'serverstatus 0 99 player%20count:1 playerid:ab:cd name:Kitchen'
+
+
+class SlowSsl(object):
+    """Answers the status query, then times out on everything else"""
+    is_connected = True
+    authenticated = False
+
+    def __init__(self):
+        self.sent = []
+        self.reads = 0
+
+    def send(self, data, timeout=None):
+        self.sent.append(data)
+        return True
+
+    def is_alive(self):
+        return self.is_connected
+
+    def close(self):
+        self.is_connected = False
+
+    def readline(self, timeout=None):
+        self.reads += 1
+        if self.sent[-1].startswith('serverstatus'):
+            return STATUS
+        raise Timeout("Too slow (%s)" % timeout)
+
+
+def intent_event(name):
+    return {'request': {'requestId': '1234', 'type': 'IntentRequest',
+                        'intent': {'name': name}},
+            'session': {'new': False, 'sessionId': '5678',
+                        'application': {'applicationId': 'foo'}}}
 
 
 class SqueezeAlexaTest(TestCase):
@@ -30,3 +74,184 @@ class SqueezeAlexaTest(TestCase):
             sqa.handle({'request': {'requestId': '1234',
                                     'type': 'CrazyThing'}}, {})
         assert 'unknown request type' in str(excinfo.value).lower()
+
+    def test_slow_server_gets_spoken_response(self):
+        sqa = SqueezeAlexa(server=Server(ssl_wrap=SlowSsl()))
+        response = sqa.handle(intent_event('AMAZON.NextIntent'), None)
+        speech = response['response']['outputSpeech']['text']
+        assert 'server is slow' in speech
+
+    def test_fails_fast_once_circuit_open(self):
+        ssl = SlowSsl()
+        sqa = SqueezeAlexa(server=Server(ssl_wrap=ssl))
+        for _ in range(Server._MAX_FAILURES):
+            sqa.handle(intent_event('AMAZON.NextIntent'), None)
+        sent = len(ssl.sent)
+        response = sqa.handle(intent_event('AMAZON.NextIntent'), None)
+        speech = response['response']['outputSpeech']['text']
+        assert "can't reach" in speech
+        assert len(ssl.sent) == sent
+
+    def test_pause_answers_without_waiting(self):
+        ssl = SlowSsl()
+        sqa = SqueezeAlexa(server=Server(ssl_wrap=ssl))
+        response = sqa.handle(intent_event('AMAZON.PauseIntent'), None)
+        assert 'outputSpeech' not in response['response']
+        # ...but it was still sent, before the response was returned
+        assert ssl.sent[-1] == "ab:cd pause 1\n"
+        # ...and nothing waited for its reply: only the status was read
+        assert ssl.reads == len([line for line in ssl.sent
+                                 if line.startswith("serverstatus")])
+
+    def test_new_server_forgets_old_snapshots(self):
+        SqueezeAlexa._snapshots = [["/nonexistent/old.snapshot", None]]
+        server = Server(ssl_wrap=SlowSsl())
+        SqueezeAlexa(server=server)
+        assert SqueezeAlexa._server is server
+        assert SqueezeAlexa._snapshots == []
+        SqueezeAlexa.flush()
+
+    def test_pools_connection_between_invocations(self):
+        pool = ConnectionPool(SlowSsl)
+        SqueezeAlexa._pools = [pool]
+        self.addCleanup(setattr, SqueezeAlexa, "_pools", None)
+        server = Server(connect=pool.acquire)
+        sqa = SqueezeAlexa(server=server)
+        sqa.handle(intent_event('AMAZON.PauseIntent'), None)
+        assert server.ssl_wrap is None
+        assert len(pool) == 1
+        sqa.handle(intent_event('AMAZON.PauseIntent'), None)
+        assert pool.created == 1
+
+    def test_static_intents_touch_no_network(self):
+        def connect():
+            raise AssertionError("Tried to connect to the server")
+
+        sqa = SqueezeAlexa(server=Server(connect=connect))
+        for name in ['AMAZON.HelpIntent', 'AMAZON.StopIntent',
+                     'AMAZON.CancelIntent']:
+            sqa.handle(intent_event(name), None)
+        with pytest.raises(AssertionError):
+            sqa.handle(intent_event('AMAZON.NextIntent'), None)
+
+    def test_server_connects_when_first_needed(self):
+        connections = []
+
+        def connect():
+            connections.append(SlowSsl())
+            return connections[-1]
+
+        server = Server(connect=connect)
+        assert not connections
+        assert server.cur_player_id == "ab:cd"
+        assert len(connections) == 1
+        assert connections[0].sent == ["serverstatus 0 99\n"]
+
+    def test_recovers_after_half_open(self):
+        clock = FakeClock()
+        down = [True]
+
+        def connect():
+            if down[0]:
+                raise socket.error("Connection refused")
+            return SlowSsl()
+
+        pool = ConnectionPool(connect, breaker=CircuitBreaker(
+            max_failures=3, clock=clock, rand=lambda: 0.0))
+        server = Server(connect=pool.acquire, breaker=pool.breaker)
+        for _ in range(3):
+            with pytest.raises(SqueezeboxException):
+                server.refresh_status()
+        with pytest.raises(CircuitOpenError):
+            server.refresh_status()
+        down[0] = False
+        clock.now += 1000
+        server.refresh_status()
+        assert server.breaker.state == CircuitBreaker.CLOSED
+        assert server.cur_player_id == "ab:cd"
+
+    def test_gives_up_when_out_of_time(self):
+        server = Server(ssl_wrap=SlowSsl())
+        server.deadline = Deadline(0)
+        with pytest.raises(SqueezeboxTimeout) as excinfo:
+            server.refresh_status()
+        assert 'Out of time' in str(excinfo.value)
+
+    def test_per_command_timeouts(self):
+        server = Server(ssl_wrap=SlowSsl())
+        timeout = server._timeout_for(['ab:cd mode ?'])
+        assert timeout == Server._TIMEOUTS['mode']
+        assert server._timeout_for(['foo bar']) == Server._TIMEOUT
+        server.deadline = Deadline(1.5)
+        assert server._timeout_for(['albums 0 255']) <= 1.5
+
+
+class AlbumMatchingTest(TestCase):
+    """Matching against a library index, all in memory"""
+
+    def setUp(self):
+        def connect():
+            raise AssertionError("Tried to connect to the server")
+
+        self.server = Server(connect=connect)
+        index = self.server.index
+        index.artists = {1: Artist(1, u"Ásgeir"),
+                         2: Artist(2, u"Ásgeir Trausti"),
+                         3: Artist(3, u"Someone Else"),
+                         4: Artist(4, u"Dido")}
+        albums = [Album(11, u"Going Home (EP)", 2014, u"Ásgeir", 1),
+                  Album(12, u"In the Silence", 2013, u"Ásgeir", 1),
+                  Album(13, u"Dýrð í dauðaþögn", 2012, u"Ásgeir Trausti", 2),
+                  Album(14, u"In the Silence", 2016, u"Someone Else", 3),
+                  Album(15, u"Tutu", 1986, u"Miles Davis", 5)]
+        index.albums = {album.id: album for album in albums}
+        index.loaded.update(["artists", "albums"])
+        index._build()
+        self.sqa = SqueezeAlexa(server=self.server)
+
+    def one_album(self, intent_name):
+        return self.sqa.get_one_album_by_artist(
+            self.server, {'name': intent_name}, "asgeir")
+
+    def test_first_and_latest(self):
+        assert self.one_album('PlayFirstAlbumByArtistIntent') == \
+            (13, 2012, u"Dýrð í dauðaþögn", u"Ásgeir Trausti")
+        assert self.one_album('PlayLatestAlbumByArtistIntent') == \
+            (11, 2014, u"Going Home (EP)", u"Ásgeir")
+        assert self.one_album('PlayRandomAlbumByArtistIntent')[0] in \
+            (11, 12, 13)
+
+    def test_albums_in_year_order(self):
+        albums = self.sqa.get_albums_by_artist(self.sqa, self.server,
+                                               "asgeir")
+        assert [album.id for album, _ in albums] == [13, 12, 11]
+
+    def test_artists_scored_as_simplified(self):
+        assert self.sqa.get_artist_matches(self.server, "the dido") == \
+            {4: u"Dido"}
+        assert self.sqa.get_artist_matches(self.server, "asgeir")[1] == \
+            u"Ásgeir"
+
+    def test_same_names_dont_collide(self):
+        album_id, year, name, artist = self.sqa.get_matched_album(
+            self.sqa, self.server, "in silence")
+        assert (album_id, year, artist) in {(12, 2013, u"Ásgeir"),
+                                            (14, 2016, u"Someone Else")}
+        assert self.sqa.get_matched_album_by_artist(
+            self.sqa, self.server, "in silence", "someone else") == \
+            (14, 2016, u"In the Silence", u"Someone Else")
+
+    def test_nothing_matched(self):
+        assert self.sqa.get_matched_album_by_artist(
+            self.sqa, self.server, "nope nope", "someone else") is None
+
+    def test_sound_alikes_must_still_score(self):
+        # "Tutu" sounds like "Dido", but isn't like it
+        assert self.server.index.albums_sounding_like("dido")
+        assert self.sqa.get_matched_album(self.sqa, self.server,
+                                          "dido") is None
+        found = self.sqa.get_one_album_by_artist(
+            self.server, {'name': 'PlayRandomAlbumByArtistIntent'}, "dido")
+        assert found is None
+        assert self.sqa.get_artist_matches(self.server, "dido") == \
+            {4: u"Dido"}
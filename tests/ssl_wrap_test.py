@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+#
+#   Copyright 2017 Nick Boultbee
+#   This file is part of squeeze-alexa.
+#
+#   squeeze-alexa is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   See LICENSE for full license
+
+import socket
+import time
+from unittest import TestCase
+
+import pytest
+
+from squeezealexa.ssl_wrap import LineReader, SessionCache, \
+    SslSocketWrapper, Timeout, create_context
+from squeezealexa.utils import Deadline
+
+
+def chunked(data, size):
+    chunks = [data[i:i + size] for i in range(0, len(data), size)]
+
+    def recv(bufsize):
+        return chunks.pop(0) if chunks else b''
+
+    return recv
+
+
+class LineReaderTest(TestCase):
+
+    def test_lines_across_chunks(self):
+        reader = LineReader(chunked(b'foo bar\nbaz\nquux', 3))
+        assert reader.readline() == u'foo bar'
+        assert reader.readline() == u'baz'
+        assert reader.readline() is None
+
+    def test_multibyte_split(self):
+        data = u'artist:\xd3lafur Arnalds\n'.encode('utf-8')
+        reader = LineReader(chunked(data, 1))
+        assert reader.readline() == u'artist:\xd3lafur Arnalds'
+
+    def test_read_lines_stops_at_eof(self):
+        reader = LineReader(chunked(b'one\ntwo\n', 5))
+        assert reader.read_lines(3) == [u'one', u'two']
+
+    def test_keeps_remainder(self):
+        reader = LineReader(chunked(b'one\ntwo\nthr', 100))
+        assert reader.read_lines(1) == [u'one']
+        assert reader.buffered == len(b'two\nthr')
+        reader.clear()
+        assert reader.buffered == 0
+
+    def test_feed(self):
+        reader = LineReader(chunked(b'ree\n', 100))
+        reader.feed(b'one\nth')
+        assert reader.read_lines(3) == [u'one', u'three']
+
+
+class SessionCacheTest(TestCase):
+
+    def test_hit_rate(self):
+        cache = SessionCache()
+        cache.record(0.2, offered=False, resumed=False)
+        cache.record(0.05, offered=True, resumed=True)
+        cache.record(0.2, offered=True, resumed=False)
+        cache.record(0.03, offered=True, resumed=True)
+        assert cache.hits == 2
+        assert cache.misses == 1
+        assert abs(cache.hit_rate - 2 / 3.0) < 0.001
+        assert abs(cache.mean_handshake(resumed=True) - 0.04) < 0.001
+        assert "67% resumed" in str(cache)
+
+    def test_sessions_by_server(self):
+        cache = SessionCache()
+        cache.put(("foo", 1), "session")
+        cache.put(("foo", 1), None)
+        assert cache.get(("foo", 1)) == "session"
+        cache.discard(("foo", 1))
+        assert cache.get(("foo", 1)) is None
+
+    def test_empty_stats(self):
+        cache = SessionCache()
+        assert cache.hit_rate == 0.0
+        assert cache.stats()["mean resumed secs"] is None
+
+
+class Unconnected(SslSocketWrapper):
+    """Never actually connects, reading from some `recv` instead"""
+
+    def __init__(self, recv=None, **kwargs):
+        self.recv = recv
+        super(Unconnected, self).__init__("localhost", **kwargs)
+
+    def connect(self, deadline=None):
+        self._reader = LineReader(self.recv)
+        self.is_connected = True
+
+
+class SslSocketWrapperTest(TestCase):
+
+    def test_timeout_without_limit(self):
+        def recv(bufsize):
+            raise socket.timeout("timed out")
+
+        conn = Unconnected(recv)
+        with pytest.raises(Timeout) as excinfo:
+            conn.readline(timeout=None)
+        assert "localhost" in str(excinfo.value)
+        assert not conn.is_connected
+
+    def test_connect_within_deadline(self):
+        start = time.time()
+        with pytest.raises(Timeout):
+            SslSocketWrapper("localhost", port=9, context=create_context(),
+                             deadline=Deadline(0))
+        assert time.time() - start < 1
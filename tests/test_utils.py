@@ -12,7 +12,8 @@
 
 from unittest import TestCase
 
-from squeezealexa.utils import english_join, sanitise_text
+from squeezealexa.utils import english_join, sanitise_text, simplified, \
+    Deadline
 
 LOTS = ['foo', 'bar', 'baz', 'quux']
 
@@ -53,3 +54,40 @@ class TestSanitise(TestCase):
 
     def test_playlists(self):
         assert sanitise_text("My bad-a$$ playlist") == 'My bad ass playlist'
+
+
+class TestSimplified(TestCase):
+    def test_basics(self):
+        assert simplified(u"I’m Not in Love") == u"i m not love"
+        assert simplified("Live: At the BBC") == u"live bbc"
+        assert simplified(u"Dýrð í dauðaþögn") == u"dyrð i dauðaþogn"
+
+    def test_only_stop_words(self):
+        assert simplified(u"The The") == u"the the"
+        assert simplified(u"") == u""
+
+
+class FakeContext(object):
+    def get_remaining_time_in_millis(self):
+        return 7000
+
+
+class TestDeadline(TestCase):
+    def test_no_deadline(self):
+        deadline = Deadline()
+        assert deadline.remaining() is None
+        assert not deadline.expired
+        assert deadline.timeout(10) == 10
+
+    def test_expired(self):
+        deadline = Deadline(0)
+        assert deadline.expired
+        assert deadline.timeout(10) == 0
+
+    def test_from_lambda_context(self):
+        deadline = Deadline.from_context(FakeContext(), margin=1.0)
+        assert 5.5 < deadline.remaining() <= 6.0
+        assert deadline.timeout(2) == 2
+
+    def test_from_missing_context(self):
+        assert Deadline.from_context({}).remaining() is None
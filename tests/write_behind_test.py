@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+#
+#   Copyright 2017 Nick Boultbee
+#   This file is part of squeeze-alexa.
+#
+#   squeeze-alexa is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   See LICENSE for full license
+
+import threading
+from unittest import TestCase
+
+from squeezealexa.squeezebox.write_behind import WriteBehindQueue
+
+
+class WriteBehindQueueTest(TestCase):
+
+    def test_sends_in_order(self):
+        sent = []
+        queue = WriteBehindQueue(sent.extend)
+        queue.put(["a", "b"])
+        queue.put(["c"])
+        queue.flush()
+        assert sent == ["a", "b", "c"]
+        assert not len(queue)
+
+    def test_put_does_not_block(self):
+        release = threading.Event()
+        sent = []
+
+        def slow(lines):
+            release.wait(5)
+            sent.extend(lines)
+
+        queue = WriteBehindQueue(slow)
+        queue.put(["pause 1"])
+        assert not sent
+        release.set()
+        queue.flush()
+        assert sent == ["pause 1"]
+
+    def test_failures_counted(self):
+        def broken(lines):
+            raise IOError("Connection reset")
+
+        queue = WriteBehindQueue(broken)
+        queue.put(["stop"])
+        queue.flush()
+        assert queue.failures == 1